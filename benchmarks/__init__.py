@@ -0,0 +1,8 @@
+"""
+Benchmarks of Zeph, run with `python -m benchmarks.<module>`:
+
+- `suite`: time and peak memory of all the rankers and selectors, compared to a JSON baseline.
+- `coverage`: coverage loss of `SketchCoverRanker` compared to the exact greedy algorithm.
+- `greedy`: scaling of the eager and lazy implementations of `GreedyCoverRanker`.
+- `synthetic`: seeded synthetic `(agent, prefix) -> links` datasets.
+"""
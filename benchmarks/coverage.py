@@ -0,0 +1,88 @@
+"""
+Coverage loss of `SketchCoverRanker` compared to the exact `GreedyCoverRanker`.
+
+    python -m benchmarks.coverage --sketch-sizes 8,16,32,64
+    python -m benchmarks.coverage --ground-truth ground-truth.npz
+
+The links are those of a synthetic dataset, or of a real measurement cycle
+exported with `zeph-simulate export`. Each ranker runs without budgets, and with
+a budget of `--budget` times the number of prefixes for each agent.
+"""
+from pathlib import Path
+from typing import Any, Optional
+
+import typer
+
+from benchmarks.suite import measure
+from benchmarks.synthetic import synthetic_store
+from zeph.comparison import covered_links
+from zeph.rankers import GreedyCoverRanker, SketchCoverRanker
+from zeph.simulation import GroundTruth
+from zeph.store import LinkStore
+
+
+def run(
+    store: LinkStore, sketch_sizes: list[int], budget: float
+) -> list[dict[str, Any]]:
+    results = []
+    budgets_ = {agent: int(len(store.prefixes) * budget) for agent in store.agents}
+    for budgets in (None, budgets_):
+        exact = covered_links(store, GreedyCoverRanker()(store, budgets))
+        result = measure(lambda: GreedyCoverRanker()(store, budgets), 1)
+        results.append(
+            {
+                "ranker": "GreedyCoverRanker",
+                "budgets": budgets is not None,
+                "covered_links": exact,
+                "loss": 0.0,
+                # The links of the store (the exact ranker needs all of them).
+                "input_bytes": store.nbytes,
+                **result,
+            }
+        )
+        for sketch_size in sketch_sizes:
+            ranker = SketchCoverRanker(sketch_size)
+            covered = covered_links(store, ranker(store, budgets))
+            result = measure(lambda: ranker(store, budgets), 1)
+            results.append(
+                {
+                    "ranker": f"SketchCoverRanker({sketch_size})",
+                    "budgets": budgets is not None,
+                    "covered_links": covered,
+                    "loss": 1 - covered / max(exact, 1),
+                    # The sketches and the number of links of each (agent, prefix).
+                    "input_bytes": len(store) * (8 * sketch_size + 8),
+                    **result,
+                }
+            )
+    return results
+
+
+def main(
+    ground_truth: Optional[Path] = typer.Option(
+        None, help="Links exported with `zeph-simulate export`", metavar="FILE"
+    ),
+    n_agents: int = typer.Option(8, help="Number of agents of the synthetic dataset"),
+    n_prefixes: int = typer.Option(
+        20_000, help="Number of prefixes of the synthetic dataset"
+    ),
+    sketch_sizes: str = typer.Option("8,16,32,64", help="Comma-separated sizes"),
+    budget: float = typer.Option(0.05, help="Budget of each agent, in prefixes"),
+    seed: int = typer.Option(2021, help="Seed of the synthetic dataset"),
+) -> None:
+    if ground_truth:
+        store = GroundTruth.load(ground_truth).store
+    else:
+        store = synthetic_store(n_agents=n_agents, n_prefixes=n_prefixes, seed=seed)
+    print(f"rows={len(store)} links={store.n_links}")
+    print("ranker,budgets,covered_links,loss,seconds,input_bytes,peak_bytes")
+    for result in run(store, [int(x) for x in sketch_sizes.split(",")], budget):
+        print(
+            f"{result['ranker']},{result['budgets']},{result['covered_links']},"
+            f"{result['loss']:.4f},{result['seconds']:.3f},"
+            f"{result['input_bytes']},{result['peak_bytes']}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,44 @@
+"""
+Scaling benchmark of the eager and lazy implementations of `GreedyCoverRanker`.
+
+    python -m benchmarks.greedy --max-prefixes 8000
+"""
+from copy import deepcopy
+from time import perf_counter
+
+import typer
+
+from benchmarks.synthetic import synthetic_store
+from zeph.rankers import GreedyCoverRanker
+
+
+def main(
+    n_agents: int = 4,
+    min_prefixes: int = 250,
+    max_prefixes: int = 4000,
+    links_per_prefix: float = 16,
+    seed: int = 2021,
+) -> None:
+    print("n_keys,eager_s,lazy_s,speedup")
+    n_prefixes = min_prefixes
+    while n_prefixes <= max_prefixes:
+        # The eager implementation only ranks dicts: both rank the same dict.
+        links = synthetic_store(
+            n_agents=n_agents,
+            n_prefixes=n_prefixes,
+            links_per_prefix=links_per_prefix,
+            seed=seed,
+        ).to_dict()
+        timings = []
+        for lazy in (False, True):
+            links_ = deepcopy(links)
+            start = perf_counter()
+            GreedyCoverRanker(lazy=lazy)(links_)
+            timings.append(perf_counter() - start)
+        eager, lazy_ = timings
+        print(f"{len(links)},{eager:.3f},{lazy_:.3f},{eager / lazy_:.1f}")
+        n_prefixes *= 2
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,190 @@
+"""
+Benchmark of the rankers and of the selectors on synthetic datasets of several sizes.
+
+    python -m benchmarks.suite --scales small,medium --output results.json
+    python -m benchmarks.suite --scales small,medium --baseline results.json
+
+The time of each benchmark is the best of `--repeat` runs, and its peak memory
+is measured with `tracemalloc` in a separate run.
+With `--baseline`, the results are compared to those of a previous run (e.g. on
+another commit) and the command fails if a benchmark is slower by more than `--tolerance`.
+"""
+import json
+import os
+import platform
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Optional
+
+import numpy as np
+import typer
+
+from benchmarks.synthetic import synthetic_store
+from zeph import rankers
+from zeph.selectors import (
+    AbstractSelector,
+    ConstrainedRandomSelector,
+    EpsilonSelector,
+    RandomSelector,
+)
+from zeph.store import LinkStore
+from zeph.universe import Universe
+
+SCALES = {
+    "small": {"n_agents": 4, "n_prefixes": 2_000},
+    "medium": {"n_agents": 8, "n_prefixes": 20_000},
+    "large": {"n_agents": 16, "n_prefixes": 100_000},
+}
+
+RANKERS = (
+    "DFGCoverRanker",
+    "GreedyCoverRanker",
+    "NaiveRanker",
+    "SketchCoverRanker",
+    "UniqueLinksRanker",
+)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> dict[str, float]:
+    """Best time of `repeat` runs, and peak memory allocated during one run."""
+    seconds = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        seconds.append(perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_bytes": peak}
+
+
+def selectors(
+    store: LinkStore, ranked_prefixes: dict[str, list[str]], seed: int
+) -> dict[str, Callable[[], AbstractSelector]]:
+    # The universe holds the probed prefixes and a larger range of unprobed prefixes.
+    universe = Universe.from_networks(
+        [*store.prefixes, f"20.0.0.0-{20 + len(store.prefixes) // 6500}.255.255.255"]
+    )
+    budgets = {agent: len(store.prefixes) // 2 for agent in store.agents}
+    return {
+        "RandomSelector": lambda: RandomSelector(universe, budgets, seed),
+        "EpsilonSelector": lambda: EpsilonSelector(
+            universe, budgets, 0.1, ranked_prefixes, seed
+        ),
+        "ConstrainedRandomSelector": lambda: ConstrainedRandomSelector(
+            universe, budgets, seed
+        ),
+    }
+
+
+def run(scales: list[str], repeat: int, seed: int) -> list[dict[str, Any]]:
+    results = []
+    for scale in scales:
+        store = synthetic_store(**SCALES[scale], seed=seed)
+        parameters = {
+            "scale": scale,
+            "rows": len(store),
+            "links": store.n_links,
+            "store_bytes": store.nbytes,
+        }
+        # Rank 5% of the prefixes of each agent, a typical budget.
+        budgets = {agent: len(store.prefixes) // 20 for agent in store.agents}
+        ranked_prefixes: dict[str, list[str]] = {}
+        for name in RANKERS:
+            ranker = getattr(rankers, name)
+            result = measure(lambda: ranker()(store), repeat)
+            results.append({"benchmark": f"ranker/{name}", **parameters, **result})
+            print_result(results[-1])
+            result = measure(lambda: ranker()(store, budgets), repeat)
+            results.append(
+                {"benchmark": f"ranker/{name}/budgets", **parameters, **result}
+            )
+            print_result(results[-1])
+            if name == "DFGCoverRanker":
+                ranked_prefixes = ranker()(store)
+                # Gains computed by worker processes (the peak memory is the parent's).
+                processes = max(os.cpu_count() or 1, 2)
+                result = measure(lambda: ranker(processes=processes)(store), repeat)
+                results.append(
+                    {"benchmark": f"ranker/{name}/sharded", **parameters, **result}
+                )
+                print_result(results[-1])
+        for name, selector in selectors(store, ranked_prefixes, seed).items():
+
+            def select() -> None:
+                selector_ = selector()
+                for agent in store.agents:
+                    selector_.select(agent)
+
+            result = measure(select, repeat)
+            results.append({"benchmark": f"selector/{name}", **parameters, **result})
+            print_result(results[-1])
+    return results
+
+
+def print_result(result: dict[str, Any]) -> None:
+    print(
+        f"{result['benchmark']:<34} {result['scale']:<8} "
+        f"{result['seconds']:>9.3f}s {result['peak_bytes'] / 2**20:>9.1f}MiB"
+    )
+
+
+def compare(
+    results: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float
+) -> list[str]:
+    """Print the ratio of each result to the baseline and return the regressions."""
+    previous = {(x["benchmark"], x["scale"]): x for x in baseline}
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["scale"])
+        if key not in previous:
+            continue
+        time_ratio = result["seconds"] / max(previous[key]["seconds"], 1e-9)
+        memory_ratio = result["peak_bytes"] / max(previous[key]["peak_bytes"], 1)
+        print(
+            f"{key[0]:<34} {key[1]:<8} time={time_ratio:>6.2f}x memory={memory_ratio:>6.2f}x"
+        )
+        if time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance:
+            regressions.append(f"{key[0]} ({key[1]})")
+    return regressions
+
+
+def main(
+    scales: str = typer.Option("small,medium", help="Comma-separated scales"),
+    repeat: int = typer.Option(3, help="Number of timed runs"),
+    seed: int = typer.Option(2021, help="Seed of the synthetic datasets"),
+    output: Optional[Path] = typer.Option(
+        None, help="Write the results to this JSON file", metavar="FILE"
+    ),
+    baseline: Optional[Path] = typer.Option(
+        None, help="Compare the results to this JSON file", metavar="FILE"
+    ),
+    tolerance: float = typer.Option(
+        0.2, help="Maximum slowdown (or memory increase) relative to the baseline"
+    ),
+) -> None:
+    results = run(scales.split(","), repeat, seed)
+    if output:
+        document = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results,
+        }
+        output.write_text(json.dumps(document, indent=2))
+    if baseline:
+        regressions = compare(
+            results, json.loads(baseline.read_text())["results"], tolerance
+        )
+        if regressions:
+            print(f"regressions: {', '.join(regressions)}")
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,63 @@
+"""
+Seeded synthetic datasets of `(agent, prefix) -> links`.
+
+The links seen from a prefix are a mix of links specific to the prefix (e.g. close
+to the destination), which are seen by all the agents probing this prefix,
+and of links shared across prefixes (e.g. in the core of the network), whose
+popularity follows a power law: a few links are seen from most prefixes,
+and most links are seen from a few prefixes.
+"""
+import numpy as np
+
+from zeph.store import LinkStore, LinkStoreBuilder
+from zeph.utilities import IPV4_MAPPED
+
+
+def synthetic_prefixes(n_prefixes: int, rng: np.random.Generator) -> np.ndarray:
+    """Network keys (see `zeph.utilities.network_key`) of distinct /24 prefixes in 1.0.0.0/8-223.0.0.0/8."""
+    units = rng.choice(np.arange(0x010000, 0xE00000), n_prefixes, replace=False)
+    units.sort()
+    return (units.astype(np.uint64) << np.uint64(8)) | np.uint64(IPV4_MAPPED << 32)
+
+
+def synthetic_store(
+    n_agents: int = 4,
+    n_prefixes: int = 10_000,
+    n_shared_links: int | None = None,
+    links_per_prefix: float = 16,
+    local_links_per_prefix: int = 8,
+    local_ratio: float = 0.5,
+    alpha: float = 1.2,
+    seed: int = 2021,
+) -> LinkStore:
+    """
+    Args:
+        n_agents: number of agents, each agent probes all the prefixes.
+        n_prefixes: number of /24 prefixes.
+        n_shared_links: number of distinct shared links (default: `4 * n_prefixes`).
+        links_per_prefix: mean number of links per (agent, prefix), before deduplication.
+        local_links_per_prefix: number of distinct links specific to each prefix.
+        local_ratio: probability for a link to be specific to the prefix.
+        alpha: exponent of the power-law popularity of the shared links.
+        seed: the same seed always generates the same dataset.
+    """
+    n_shared_links = n_shared_links or 4 * n_prefixes
+    assert n_shared_links + n_prefixes * local_links_per_prefix < 2**32
+    rng = np.random.default_rng(seed)
+    keys = synthetic_prefixes(n_prefixes, rng)
+    popularity = 1 / np.arange(1, n_shared_links + 1) ** alpha
+    popularity /= popularity.sum()
+    builder = LinkStoreBuilder()
+    for agent in range(n_agents):
+        sizes = rng.geometric(1 / links_per_prefix, n_prefixes)
+        rows = np.repeat(np.arange(n_prefixes, dtype=np.uint64), sizes)
+        shared = rng.choice(n_shared_links, len(rows), p=popularity)
+        local = n_shared_links + rows * np.uint64(local_links_per_prefix)
+        local += rng.integers(0, local_links_per_prefix, len(rows), dtype=np.uint64)
+        links = np.where(rng.random(len(rows)) < local_ratio, local, shared)
+        # Remove the duplicate links of each row, the rows stay in order.
+        pairs = np.unique((rows << np.uint64(32)) | links.astype(np.uint64))
+        rows, links = pairs >> np.uint64(32), pairs & np.uint64(0xFFFFFFFF)
+        sizes = np.bincount(rows.astype(np.int64), minlength=n_prefixes)
+        builder.add_many(f"agent-{agent}", keys, sizes, links)
+    return builder.build()
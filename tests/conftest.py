@@ -1,4 +1,6 @@
-from ipaddress import ip_network
+import re
+from ipaddress import IPv6Address, ip_network
+from random import Random
 
 import pytest
 
@@ -10,3 +12,100 @@ def universe():
         ip_network("10.0.1.0/24"),
         ip_network("10.0.2.0/24"),
     ]
+
+
+@pytest.fixture
+def random_links():
+    """
+    Factory of seeded random `(agent, prefix) -> links` dicts:
+    each agent probes `n_prefixes` /24 prefixes (in the first `n_networks` ones,
+    or the first `n_prefixes` ones), and sees `min_links` to `max_links - 1`
+    links per prefix, drawn from `n_links` distinct links.
+    """
+
+    def random_links(
+        agents=("a", "b", "c"),
+        n_prefixes=100,
+        n_links=2000,
+        max_links=20,
+        *,
+        min_links=0,
+        n_networks=None,
+        ip_networks=False,
+        rng=None,
+    ):
+        rng = rng or Random(2021)
+        network = ip_network if ip_networks else str
+        return {
+            (agent, network(f"10.0.{prefix}.0/24")): {
+                rng.randrange(n_links)
+                for _ in range(rng.randrange(min_links, max_links))
+            }
+            for agent in agents
+            for prefix in (
+                rng.sample(range(n_networks), n_prefixes)
+                if n_networks
+                else range(n_prefixes)
+            )
+        }
+
+    return random_links
+
+
+class FakeClickHouseClient:
+    """Answer the links queries from a dict of `table -> probe_dst_prefix -> links`."""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def rows(self, query):
+        table = re.search(r"FROM (\w+)", query).group(1)
+        bounds = re.search(
+            r"probe_dst_prefix >= toIPv6\('(.+?)'\) AND probe_dst_prefix <= toIPv6\('(.+?)'\)",
+            query,
+        )
+        for prefix, links in self.tables.get(table, {}).items():
+            if bounds and not (
+                IPv6Address(bounds[1]) <= IPv6Address(prefix) <= IPv6Address(bounds[2])
+            ):
+                continue
+            yield prefix, links
+
+    def json(self, query, data=None, settings=None):
+        prefixes = [IPv6Address(prefix) for prefix, _ in self.rows(query)]
+        # The aggregates of an empty table are the default values.
+        return [
+            {
+                "first": str(min(prefixes, default="::")),
+                "last": str(max(prefixes, default="::")),
+            }
+        ]
+
+    def iter_bytes(self, query, data=None, settings=None):
+        assert settings["default_format"] == "RowBinary"
+        data = b"".join(
+            IPv6Address(prefix).packed + link.to_bytes(8, "little")
+            for prefix, links in self.rows(query)
+            for link in links
+        )
+        # Split the records across chunks
+        for start in range(0, len(data), 10):
+            end = start + 10
+            yield data[start:end]
+
+
+@pytest.fixture
+def client():
+    return FakeClickHouseClient(
+        {
+            "links__m__a": {
+                "::ffff:10.0.0.0": [1, 2],
+                "::ffff:10.0.1.0": [2, 3],
+                "::ffff:192.168.0.0": [4],
+                "2001:db8::": [2**64 - 1],
+            },
+            "links__m__b": {
+                "::ffff:10.0.0.0": [1, 5],
+            },
+        }
+    )
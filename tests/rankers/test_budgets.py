@@ -0,0 +1,72 @@
+from copy import deepcopy
+
+import pytest
+
+from zeph.rankers import (
+    DFGCoverRanker,
+    GreedyCoverRanker,
+    NaiveRanker,
+    SketchCoverRanker,
+    UniqueLinksRanker,
+)
+
+RANKERS = [
+    DFGCoverRanker,
+    GreedyCoverRanker,
+    lambda: GreedyCoverRanker(lazy=False),
+    NaiveRanker,
+    SketchCoverRanker,
+    UniqueLinksRanker,
+]
+
+
+@pytest.fixture
+def links(random_links):
+    return random_links()
+
+
+@pytest.mark.parametrize("ranker", RANKERS)
+def test_ranker_budgets(ranker, links):
+    ranked = ranker()(deepcopy(links))
+    # Large budgets do not change the ranking.
+    budgets = {"a": 1000, "b": 1000, "c": 1000}
+    assert ranker()(deepcopy(links), budgets) == ranked
+    # The quotas are respected, and the agents without budget are not ranked.
+    ranked = ranker()(deepcopy(links), {"a": 5, "b": 10})
+    assert len(ranked["a"]) == 5
+    assert len(ranked["b"]) == 10
+    assert not ranked.get("c")
+
+
+@pytest.mark.parametrize(
+    "ranker",
+    [DFGCoverRanker, GreedyCoverRanker, NaiveRanker, SketchCoverRanker],
+    ids=repr,
+)
+def test_cover_ranker_budgets(ranker):
+    links = {
+        ("a", "10.0.0.0/24"): {1, 2, 3},
+        ("a", "10.0.1.0/24"): {4, 5},
+        ("b", "10.0.0.0/24"): {4, 5},
+    }
+    assert ranker()(deepcopy(links)) == {"a": ["10.0.0.0/24", "10.0.1.0/24"]}
+    # Once the quota of "a" is filled, its links can be covered by "b".
+    assert ranker()(deepcopy(links), {"a": 1, "b": 1}) == {
+        "a": ["10.0.0.0/24"],
+        "b": ["10.0.0.0/24"],
+    }
+
+
+def test_greedy_ranker_budgets_lazy_matches_eager(links):
+    budgets = {"a": 10, "b": 3, "c": 0}
+    eager = GreedyCoverRanker(lazy=False)(deepcopy(links), budgets)
+    lazy = GreedyCoverRanker(lazy=True)(deepcopy(links), budgets)
+    assert lazy == eager
+
+
+def test_unique_ranker_rank_rewards_budgets():
+    rewards = {"a": {"10.0.0.0/24": 1, "10.0.1.0/24": 3, "10.0.2.0/24": 1}, "b": {}}
+    assert UniqueLinksRanker.rank_rewards(rewards, {"a": 2, "b": 2}) == {
+        "a": ["10.0.1.0/24", "10.0.0.0/24"],
+        "b": [],
+    }
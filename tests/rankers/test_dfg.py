@@ -1,4 +1,9 @@
+from collections import defaultdict
+from copy import deepcopy
 from ipaddress import ip_network
+from math import floor, log
+
+import pytest
 
 from zeph.rankers import DFGCoverRanker
 
@@ -20,3 +25,43 @@ def test_dfg_ranker():
 def test_dfg_ranker_empty():
     ranker = DFGCoverRanker()
     ranker({})
+
+
+def dfg_reference(links, p):
+    """Set-based implementation of the DFG algorithm (before vectorization)."""
+    covered = set()
+    prefixes = defaultdict(list)
+    subcollections = defaultdict(list)
+    for (agent, prefix), links_ in links.items():
+        k = floor(log(len(links_) or 1, p))
+        subcollections[k].append((agent, prefix))
+    k_max = max(subcollections.keys())
+    for k in range(k_max, 0, -1):
+        for agent, prefix in subcollections[k]:
+            if len(links[(agent, prefix)] - covered) >= p**k:
+                prefixes[agent].append(prefix)
+                covered.update(links[(agent, prefix)])
+            else:
+                links[(agent, prefix)] -= covered
+                k_prime = floor(log(len(links[(agent, prefix)]) or 1, p))
+                subcollections[k_prime].append((agent, prefix))
+    for agent, prefix in subcollections[0]:
+        if len(links[(agent, prefix)] - covered) == 1:
+            prefixes[agent].append(prefix)
+            covered.update(links[(agent, prefix)])
+    return prefixes
+
+
+@pytest.mark.parametrize("p", [1.05, 1.5, 3.0])
+def test_dfg_ranker_matches_reference(p, random_links):
+    links = random_links(n_prefixes=200, n_links=500, max_links=40, ip_networks=True)
+    expected = dfg_reference(deepcopy(links), p)
+    assert DFGCoverRanker(p)(links) == expected
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 10, "b": 30}])
+def test_dfg_ranker_sharded(budgets, random_links):
+    links = random_links(n_prefixes=200, n_links=500, max_links=40)
+    ranker = DFGCoverRanker(processes=2)
+    ranker.min_sharded_rows = 1
+    assert ranker(links, budgets) == DFGCoverRanker()(links, budgets)
@@ -1,3 +1,4 @@
+from copy import deepcopy
 from ipaddress import ip_network
 
 from zeph.rankers import GreedyCoverRanker
@@ -20,3 +21,10 @@ def test_greedy_ranker():
 def test_greedy_ranker_empty():
     ranker = GreedyCoverRanker()
     ranker({})
+
+
+def test_greedy_ranker_lazy_matches_eager(random_links):
+    links = random_links(n_links=200, ip_networks=True)
+    eager = GreedyCoverRanker(lazy=False)(deepcopy(links))
+    lazy = GreedyCoverRanker(lazy=True)(deepcopy(links))
+    assert lazy == eager
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from zeph.comparison import covered_links
+from zeph.rankers import AbstractRanker, GreedyCoverRanker, SketchCoverRanker
+from zeph.store import LinkStore
+from zeph.utilities import network_key
+
+
+@pytest.fixture
+def store(random_links):
+    return LinkStore.from_dict(random_links(max_links=200))
+
+
+def test_sketch_ranker_exact_for_small_prefixes():
+    links = {
+        ("a", "192.168.0.0/24"): {1},
+        ("a", "192.168.1.0/24"): {1, 2},
+        ("a", "192.168.2.0/24"): {1, 3},
+        ("b", "192.168.0.0/24"): {1},
+        ("b", "192.168.1.0/24"): {5, 6},
+    }
+    # The sketches hold all the links, the ranking is that of the greedy algorithm.
+    assert SketchCoverRanker()(links) == GreedyCoverRanker()(links)
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 10, "b": 0}])
+def test_sketch_ranker_rank_blocks(store, budgets):
+    blocks = []
+    for agent_id, agent in enumerate(store.agents):
+        rows = np.flatnonzero(store.row_agents == agent_id)
+        for part in np.array_split(rows, 3):
+            keys = [network_key(store.prefixes[i]) for i in store.row_prefixes[part]]
+            links = [store.link_values[store.row(i)] for i in part]
+            blocks.append(
+                (
+                    agent,
+                    np.array(keys, dtype=np.uint64),
+                    np.array([len(x) for x in links], dtype=np.int64),
+                    np.concatenate(links),
+                )
+            )
+    ranker = SketchCoverRanker(sketch_size=16)
+    expected = AbstractRanker.rank_blocks(ranker, blocks, budgets)
+    assert ranker.rank_blocks(iter(blocks), budgets) == expected
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 10, "b": 10, "c": 10}])
+def test_sketch_ranker_coverage(store, budgets):
+    exact = covered_links(store, GreedyCoverRanker()(store, budgets))
+    covered = covered_links(store, SketchCoverRanker(sketch_size=32)(store, budgets))
+    assert covered >= 0.95 * exact
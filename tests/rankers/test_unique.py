@@ -1,6 +1,12 @@
+from collections import Counter, defaultdict
 from ipaddress import ip_network
 
-from zeph.rankers import UniqueLinksRanker
+import numpy as np
+import pytest
+
+from zeph.rankers import AbstractRanker, UniqueLinksRanker
+from zeph.store import LinkStore
+from zeph.utilities import network_key
 
 
 def test_unique_ranker():
@@ -20,3 +26,73 @@ def test_unique_ranker():
 def test_unique_ranker_empty():
     ranker = UniqueLinksRanker()
     ranker({})
+
+
+def test_unique_ranker_sort_by_decreasing_reward():
+    ranker = UniqueLinksRanker()
+    links = {
+        ("a", ip_network("192.168.0.0/24")): {("1", "2")},
+        ("a", ip_network("192.168.1.0/24")): {("2", "3"), ("3", "4"), ("4", "5")},
+        ("a", ip_network("192.168.2.0/24")): {("5", "6"), ("6", "7")},
+    }
+    ranked = ranker(links)
+    assert ranked["a"] == [
+        ip_network("192.168.1.0/24"),
+        ip_network("192.168.2.0/24"),
+        ip_network("192.168.0.0/24"),
+    ]
+
+
+def unique_reference(links):
+    """Set-based implementation of the unique links rewards (before vectorization)."""
+    counts = Counter()
+    for links_ in links.values():
+        counts.update(links_)
+    rewards = defaultdict(lambda: defaultdict(int))
+    for (agent, prefix), links_ in links.items():
+        for link in links_:
+            if counts[link] == 1:
+                rewards[agent][prefix] += 1
+    return rewards
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 10, "c": 0}])
+def test_unique_ranker_matches_reference(budgets, random_links):
+    links = random_links(
+        ("c", "a", "b"), 100, 500, 10, n_networks=200, ip_networks=True
+    )
+    expected = UniqueLinksRanker.rank_rewards(unique_reference(links), budgets)
+    ranked = UniqueLinksRanker()(links, budgets)
+    assert ranked == expected
+    assert list(ranked) == list(expected)
+
+
+def test_unique_ranker_rank_rewards():
+    rewards = {"a": {"10.0.0.0/24": 1, "10.0.1.0/24": 3, "10.0.2.0/24": 1}, "b": {}}
+    assert UniqueLinksRanker.rank_rewards(rewards) == {
+        "a": ["10.0.1.0/24", "10.0.0.0/24", "10.0.2.0/24"],
+        "b": [],
+    }
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 10, "b": 0}])
+def test_unique_ranker_rank_blocks(budgets, random_links):
+    store = LinkStore.from_dict(random_links(n_links=1000))
+    blocks = []
+    for agent_id, agent in enumerate(store.agents):
+        rows = np.flatnonzero(store.row_agents == agent_id)
+        for part in np.array_split(rows, 3):
+            keys = [network_key(store.prefixes[i]) for i in store.row_prefixes[part]]
+            links = [store.link_values[store.row(i)] for i in part]
+            blocks.append(
+                (
+                    agent,
+                    np.array(keys, dtype=np.uint64),
+                    np.array([len(x) for x in links], dtype=np.int64),
+                    np.concatenate(links),
+                )
+            )
+    ranker = UniqueLinksRanker()
+    expected = AbstractRanker.rank_blocks(ranker, blocks, budgets)
+    assert expected == ranker(store, budgets)
+    assert ranker.rank_blocks(iter(blocks), budgets) == expected
@@ -26,3 +26,18 @@ def test_constrained_random_selector_large_budget(universe):
     assert len(prefixes_a) == 2
     assert len(prefixes_b) == 1
     assert len(prefixes_a & prefixes_b) == 0
+
+
+def test_constrained_random_selector_dispatch():
+    universe = [f"10.0.{i}.0/24" for i in range(100)]
+    budgets = {"a": 10, "b": 50, "c": 0, "d": 70}
+    selector = ConstrainedRandomSelector(universe, budgets, seed=42)
+    prefixes = {agent: selector.select(agent) for agent in budgets}
+    # The prefixes skipped by the full agents are dispatched to the others.
+    assert {agent: len(x) for agent, x in prefixes.items()} == {
+        "a": 10,
+        "b": 45,
+        "c": 0,
+        "d": 45,
+    }
+    assert set().union(*prefixes.values()) == set(universe)
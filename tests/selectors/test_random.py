@@ -1,3 +1,5 @@
+import pytest
+
 from zeph.selectors import RandomSelector
 
 
@@ -23,3 +25,23 @@ def test_random_selector_large_budget(universe):
     prefixes_b = selector.select("b")
     assert len(prefixes_a) == 3
     assert len(prefixes_b) == 1
+
+
+def test_random_selector_seed():
+    universe = sorted(f"10.{i // 256}.{i % 256}.0/24" for i in range(1000))
+    prefixes = RandomSelector(universe, {"a": 100}, seed=42).select("a")
+    assert len(prefixes) == 100
+    assert prefixes == RandomSelector(universe, {"a": 100}, seed=42).select("a")
+    assert prefixes != RandomSelector(universe, {"a": 100}, seed=43).select("a")
+    # Sets are sorted, so the selection does not depend on their iteration order.
+    assert prefixes == RandomSelector(set(universe), {"a": 100}, seed=42).select("a")
+
+
+@pytest.mark.parametrize("budget", [1, 100, 499, 500, 999, 1000, 2000])
+def test_random_selector_sample(budget):
+    universe = [f"10.0.{i}.0/24" for i in range(1000)]
+    selector = RandomSelector(universe, {"a": budget})
+    exclude = set(universe[:250]) | {"192.168.0.0/24"}
+    sample = selector.sample(budget, exclude)
+    assert len(sample) == len(set(sample)) == min(budget, 750)
+    assert not set(sample) & exclude
@@ -0,0 +1,42 @@
+import numpy as np
+
+from benchmarks import coverage
+from benchmarks.suite import SCALES, compare, run
+from benchmarks.synthetic import synthetic_store
+
+
+def test_synthetic_store():
+    a = synthetic_store(n_agents=2, n_prefixes=100, seed=1)
+    b = synthetic_store(n_agents=2, n_prefixes=100, seed=1)
+    c = synthetic_store(n_agents=2, n_prefixes=100, seed=2)
+    assert sorted(a.agents) == ["agent-0", "agent-1"]
+    assert len(a.prefixes) == 100
+    assert list(a.prefixes) == list(b.prefixes)
+    assert np.array_equal(a.links, b.links)
+    assert list(a.prefixes) != list(c.prefixes)
+    # Some links are seen from many prefixes.
+    _, counts = np.unique(a.links, return_counts=True)
+    assert counts.max() > 10 * np.median(counts)
+
+
+def test_suite(monkeypatch):
+    monkeypatch.setitem(SCALES, "tiny", {"n_agents": 2, "n_prefixes": 200})
+    results = run(["tiny"], repeat=1, seed=2021)
+    benchmarks = [result["benchmark"] for result in results]
+    assert "ranker/DFGCoverRanker" in benchmarks
+    assert "selector/EpsilonSelector" in benchmarks
+    assert all(result["peak_bytes"] > 0 for result in results)
+    assert compare(results, results, tolerance=0.2) == []
+    slower = [{**result, "seconds": result["seconds"] * 2} for result in results]
+    assert len(compare(slower, results, tolerance=0.2)) == len(results)
+
+
+def test_coverage():
+    store = synthetic_store(n_agents=2, n_prefixes=200)
+    results = coverage.run(store, [8, 64], budget=0.05)
+    assert [result["ranker"] for result in results[:3]] == [
+        "GreedyCoverRanker",
+        "SketchCoverRanker(8)",
+        "SketchCoverRanker(64)",
+    ]
+    assert all(0 <= result["loss"] < 0.5 for result in results)
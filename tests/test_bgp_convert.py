@@ -0,0 +1,73 @@
+import random
+from ipaddress import IPv4Network, ip_network
+
+from zeph.universe import Universe
+from zeph_utils.zeph_bgp_convert import (
+    covering_prefixes,
+    iter_ipv4_prefixes,
+    iter_ipv6_samples,
+    iter_ranges,
+    prefix_intervals,
+)
+
+PREFIXES = [
+    "10.0.0.0/8",
+    "10.1.0.0/16",
+    "10.255.255.0/24",
+    "11.0.0.0/24",
+    "11.0.1.0/24",
+    "11.0.3.0/25",
+    "12.0.0.0/22",
+    "12.0.2.0/23",
+    "2001:db8::/32",
+    "2001:db8:1::/48",
+    "2001:db9::/64",
+    "2001:db9:0:1::/64",
+]
+
+
+def naive_convert(prefixes):
+    subnets = set()
+    for prefix in prefixes:
+        net = ip_network(prefix)
+        if isinstance(net, IPv4Network) and net.prefixlen <= 24:
+            subnets.update(str(subnet) for subnet in net.subnets(new_prefix=24))
+    return subnets
+
+
+def test_convert():
+    intervals = prefix_intervals(covering_prefixes(PREFIXES), 4)
+    assert len(intervals) == 2
+    lines = "".join(iter_ipv4_prefixes(intervals, chunk_size=1000)).splitlines()
+    assert len(lines) == len(set(lines))
+    assert set(lines) == naive_convert(PREFIXES)
+
+
+def test_convert_ranges():
+    intervals = prefix_intervals(covering_prefixes(PREFIXES), 4)
+    lines = "".join(iter_ranges(intervals, 4)).splitlines()
+    assert lines == ["10.0.0.0-11.0.1.255", "12.0.0.0-12.0.3.255"]
+    assert set(Universe.from_networks(lines)) == naive_convert(PREFIXES)
+
+
+def test_convert_ipv6_ranges():
+    intervals = prefix_intervals(covering_prefixes(PREFIXES), 6)
+    lines = "".join(iter_ranges(intervals, 6)).splitlines()
+    assert lines == ["2001:db8::-2001:db9:0:1:ffff:ffff:ffff:ffff"]
+    universe = Universe.from_networks(lines)
+    assert len(universe) == 2**32 + 2
+    assert "2001:db8:1::/64" in universe
+    assert "2001:db9:0:2::/64" not in universe
+
+
+def test_convert_ipv6_samples():
+    routes = covering_prefixes(PREFIXES)
+    lines = "".join(iter_ipv6_samples(routes, 100, random.Random(42))).splitlines()
+    assert len(lines) == len(set(lines)) == 100 + 2
+    assert lines[-2:] == ["2001:db9::/64", "2001:db9:0:1::/64"]
+    assert all(
+        ip_network(line).subnet_of(ip_network("2001:db8::/32")) for line in lines[:-2]
+    )
+    assert (
+        lines == "".join(iter_ipv6_samples(routes, 100, random.Random(42))).splitlines()
+    )
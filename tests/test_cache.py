@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from zeph.cache import LinkCache
+from zeph.queries import GetUniqueLinksByPrefix
+from zeph.store import LinkStoreBuilder
+
+
+@pytest.fixture
+def arrays():
+    return (
+        np.array([0xFFFF0A000000, 0xFFFF0A000100], dtype=np.uint64),
+        np.array([2, 1], dtype=np.int64),
+        np.array([1, 2, 3], dtype=np.uint64),
+    )
+
+
+def test_link_cache(tmp_path, arrays):
+    cache = LinkCache(tmp_path, 2**20)
+    key = cache.key("m", "a", GetUniqueLinksByPrefix(filter_virtual=True))
+    assert key != cache.key("m", "a", GetUniqueLinksByPrefix())
+    assert key != cache.key("m", "b", GetUniqueLinksByPrefix(filter_virtual=True))
+    assert cache.get(key, "finished:1") is None
+    cache.put(key, "finished:1", *arrays)
+    cached = cache.get(key, "finished:1")
+    assert isinstance(cached[0], np.memmap)
+    for expected, actual in zip(arrays, cached):
+        assert np.array_equal(expected, actual)
+    assert cache.get(key, "finished:2") is None
+
+
+def test_link_cache_eviction(tmp_path, arrays):
+    cache = LinkCache(tmp_path, 2**20)
+    for key in ("a", "b", "c"):
+        cache.put(key, "v", *arrays)
+    entry_size = sum(file.stat().st_size for file in (tmp_path / "a").iterdir())
+    # Make "a" the most recently used entry
+    os.utime(tmp_path / "b" / "metadata.json", (0, 0))
+    os.utime(tmp_path / "c" / "metadata.json", (1, 1))
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert cache.get("a", "v") is not None
+    assert cache.get("b", "v") is None
+    assert cache.get("c", "v") is not None
+
+
+def test_link_cache_put_keeps_entry(tmp_path, arrays):
+    cache = LinkCache(tmp_path, 2**20)
+    cache.put("a", "v", *arrays)
+    entry_size = sum(file.stat().st_size for file in (tmp_path / "a").iterdir())
+    # "a" is used after the new entry "b", but "b" is not evicted.
+    os.utime(tmp_path / "a" / "metadata.json", (2**31, 2**31))
+    cache.max_bytes = entry_size
+    cache.put("b", "v", *arrays)
+    assert cache.get("a", "v") is None
+    assert cache.get("b", "v") is not None
+    # An entry larger than the cache is not written.
+    cache.max_bytes = entry_size - 1
+    cache.put("c", "v", *arrays)
+    assert cache.get("b", "v") is not None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b"]
+
+
+def test_get_unique_links_by_prefix_cached(tmp_path, arrays):
+    class Client:
+        def iter_bytes(self, *args, **kwargs):
+            raise AssertionError("the links should be read from the cache")
+
+    query = GetUniqueLinksByPrefix()
+    cache = LinkCache(tmp_path, 2**20)
+    cache.put(cache.key("m", "a", query), "finished:1", *arrays)
+    store = query.for_all_agents(
+        Client(), "m", ["a"], cache=cache, cache_version="finished:1"
+    )
+    builder = LinkStoreBuilder()
+    builder.add_many("a", *arrays)
+    assert store.to_dict() == builder.build().to_dict()
+
+
+def test_get_unique_links_by_prefix_populates_cache(client, tmp_path):
+    cache = LinkCache(tmp_path, 2**20)
+    query = GetUniqueLinksByPrefix()
+    kwargs = dict(cache=cache, cache_version="finished:1")
+    expected = query.for_all_agents(client, "m", ["a"], **kwargs).to_dict()
+    client.tables = {}
+    assert query.for_all_agents(client, "m", ["a"], **kwargs).to_dict() == expected
+    # Measurements that are not finished are never cached
+    assert query.for_all_agents(client, "m", ["a"], cache=cache).to_dict() == {}
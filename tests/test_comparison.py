@@ -0,0 +1,30 @@
+import pytest
+
+from zeph.comparison import compare_rankers, covered_links
+from zeph.rankers import DFGCoverRanker, NaiveRanker
+from zeph.store import LinkStore
+
+
+@pytest.fixture
+def store(random_links):
+    return LinkStore.from_dict(random_links(("a", "b"), 50, 500))
+
+
+def test_covered_links(store):
+    ranked = NaiveRanker()(store)
+    assert covered_links(store, ranked) == store.n_links
+    assert covered_links(store, {}) == 0
+
+
+@pytest.mark.parametrize("budgets", [None, {"a": 5, "b": 10}])
+def test_compare_rankers(store, budgets):
+    results = compare_rankers(store, ["DFGCoverRanker", "NaiveRanker"], budgets)
+    assert [result.ranker for result in results] == ["DFGCoverRanker", "NaiveRanker"]
+    assert results[0].ranked_prefixes == DFGCoverRanker()(store, budgets)
+    assert results[1].ranked_prefixes == NaiveRanker()(store, budgets)
+    for result in results:
+        assert result.covered_links == covered_links(store, result.ranked_prefixes)
+        assert result.seconds >= 0
+    if budgets:
+        # The cover ranker covers more links than the naive one with the same budget.
+        assert results[0].covered_links >= results[1].covered_links
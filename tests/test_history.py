@@ -0,0 +1,96 @@
+from functools import partial
+from random import Random
+
+import numpy as np
+import pytest
+
+from zeph.history import EMPTY, RewardHistory
+from zeph.rankers import GreedyCoverRanker, SketchCoverRanker
+from zeph.store import LinkStore
+from zeph.utilities import key_network
+
+
+@pytest.fixture
+def hash_links(random_links):
+    """Links of 50 out of 100 prefixes per agent, as 63-bit hashes."""
+    return partial(
+        random_links, n_prefixes=50, n_links=2**63, min_links=1, n_networks=100
+    )
+
+
+def test_reward_history_update(hash_links):
+    rng = Random(2021)
+    cycles = [hash_links(("a", "b"), rng=rng), hash_links(("b", "c"), rng=rng)]
+    history = RewardHistory(sketch_size=8)
+    for i, links in enumerate(cycles):
+        history.update(LinkStore.from_dict(links), f"m{i}", decay=0.5)
+    assert history.measurements == ["m0", "m1"]
+    rewards = history.rewards()
+    for (agent, prefix), links in cycles[0].items():
+        expected = 0.5 * len(links) + len(cycles[1].get((agent, prefix), ()))
+        assert rewards[agent][prefix] == expected
+    # The sketches are the smallest hashes of the union of the links of each cycle.
+    for agent_id, key, sketch in zip(
+        history.row_agents, history.row_keys, history.sketches
+    ):
+        agent, prefix = history.agents[agent_id], key_network(int(key))
+        union = cycles[0].get((agent, prefix), set()) | cycles[1].get(
+            (agent, prefix), set()
+        )
+        assert set(sketch[sketch != EMPTY].tolist()) == set(sorted(union)[:8])
+
+
+def test_reward_history_forget():
+    history = RewardHistory()
+    history.update(LinkStore.from_dict({("a", "10.0.0.0/24"): {1}}), "m0")
+    history.update(LinkStore.from_dict({("a", "10.0.1.0/24"): {2}}), "m1", decay=0.2)
+    assert history.rewards() == {"a": {"10.0.1.0/24": 1.0, "10.0.0.0/24": 0.2}}
+    history.update(LinkStore.from_dict({}), "m2", decay=0.2)
+    assert history.rewards() == {"a": {"10.0.1.0/24": 0.2}}
+
+
+def test_reward_history_save_load(hash_links, tmp_path):
+    history = RewardHistory(sketch_size=4)
+    history.update(LinkStore.from_dict(hash_links(("a", "b"))), "m0")
+    history.save(tmp_path / "history.npz")
+    loaded = RewardHistory.load(tmp_path / "history.npz")
+    assert loaded.measurements == ["m0"]
+    assert loaded.rewards() == history.rewards()
+    assert np.array_equal(loaded.sketches, history.sketches)
+    assert (loaded.sketches != EMPTY).any()
+
+
+def test_reward_history_ranking(hash_links):
+    links = hash_links(("a", "b"))
+    history = RewardHistory(sketch_size=64)
+    history.update(LinkStore.from_dict(links), "m0")
+    # The sketches hold all the links, so the prefixes are those of the greedy ranking.
+    assert {
+        agent: set(prefixes)
+        for agent, prefixes in SketchCoverRanker.rank_history(history).items()
+    } == {
+        agent: set(prefixes) for agent, prefixes in GreedyCoverRanker()(links).items()
+    }
+
+
+def test_reward_history_ranking_large_prefixes():
+    history = RewardHistory(sketch_size=8)
+    cycles = [
+        {
+            ("a", "10.0.0.0/24"): set(range(200)),
+            ("a", "10.0.1.0/24"): set(range(1000, 1020)),
+        },
+        {
+            ("a", "10.0.1.0/24"): set(range(1000, 1030)),
+            ("a", "10.0.2.0/24"): set(range(2000, 2010)),
+        },
+    ]
+    for i, links in enumerate(cycles):
+        history.update(LinkStore.from_dict(links), f"m{i}", decay=0.5)
+    # The prefixes are weighted by their decayed reward, not by the size of their sketch.
+    assert SketchCoverRanker.rank_history(history, {"a": 2}) == {
+        "a": ["10.0.0.0/24", "10.0.1.0/24"]
+    }
+    # The rewards decay (50, 20 and 5) without changing the ranking.
+    history.update(LinkStore.from_dict({}), "m2", decay=0.5)
+    assert SketchCoverRanker.rank_history(history, {"a": 1}) == {"a": ["10.0.0.0/24"]}
@@ -0,0 +1,67 @@
+import json
+import tracemalloc
+
+import pytest
+
+from zeph.instrumentation import NULL_SPAN, Instrumentation
+from zeph.queries import GetUniqueLinksByPrefix
+
+
+def test_instrumentation_disabled():
+    instrumentation = Instrumentation(trace_memory=True)
+    assert instrumentation.span("rank", agent="a") is NULL_SPAN
+    assert not tracemalloc.is_tracing()
+
+
+def test_instrumentation(tmp_path):
+    metrics_file = tmp_path / "metrics.jsonl"
+    prometheus_file = tmp_path / "zeph.prom"
+    instrumentation = Instrumentation(metrics_file, prometheus_file, trace_memory=True)
+    with instrumentation.span("outer") as outer:
+        with instrumentation.span("inner", agent="a") as inner:
+            data = bytearray(10_000_000)
+            inner.count(prefixes=len(data))
+        del data
+    with pytest.raises(RuntimeError):
+        with instrumentation.span("failure"):
+            raise RuntimeError
+    instrumentation.close()
+    assert not tracemalloc.is_tracing()
+
+    spans = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["inner", "outer", "failure"]
+    assert spans[0]["attributes"] == {"agent": "a"}
+    assert spans[0]["counts"] == {"prefixes": 10_000_000}
+    assert spans[0]["wall_seconds"] <= spans[1]["wall_seconds"]
+    # The peak of the inner span is also the peak of the outer span.
+    assert spans[0]["peak_traced_bytes"] >= 10_000_000
+    assert spans[1]["peak_traced_bytes"] >= 10_000_000
+    assert spans[1]["process_max_rss_bytes"] > 0
+    # The 10 MB allocated (zeroed) in the inner span are resident at its exit.
+    assert spans[0]["rss_delta_bytes"] >= 5_000_000
+    assert spans[2]["error"] == "RuntimeError"
+    assert outer.wall_seconds == spans[1]["wall_seconds"]
+
+    metrics = prometheus_file.read_text()
+    assert "# TYPE zeph_span_wall_seconds gauge" in metrics
+    assert 'zeph_span_count{name="inner",agent="a",key="prefixes"} 10000000' in metrics
+    assert 'zeph_span_errors{name="failure"} 1' in metrics
+
+
+def test_instrumentation_fetch(tmp_path, client):  # noqa: F811
+    instrumentation = Instrumentation(tmp_path / "metrics.jsonl")
+    GetUniqueLinksByPrefix().for_all_agents(
+        client,
+        "m",
+        ["a", "b"],
+        subsets_per_agent=2,
+        concurrent_requests=4,
+        instrumentation=instrumentation,
+    )
+    spans = sorted(
+        (span.attributes["agent"], span.counts["links"])
+        for span in instrumentation.spans
+    )
+    # Agent "b" has a single prefix, which cannot be split in subsets.
+    assert [agent for agent, _ in spans] == ["a", "a", "b"]
+    assert sum(links for _, links in spans) == 8
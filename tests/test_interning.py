@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from zeph.interning import LinkInterner, merge_runs
+
+
+@pytest.mark.parametrize("memory_limit", [None, 64, 1024, 2**20])
+def test_link_interner(memory_limit, tmp_path):
+    rng = np.random.default_rng(2021)
+    chunks = [
+        rng.integers(0, 500, size=rng.integers(0, 100)).astype(np.uint64) * 2**50
+        for _ in range(50)
+    ]
+    interner = LinkInterner(memory_limit, tmp_path)
+    for chunk in chunks:
+        interner.add(chunk)
+    assert len(interner) == sum(len(chunk) for chunk in chunks)
+    link_values, links = interner.finish()
+    expected_values, expected_links = np.unique(
+        np.concatenate(chunks), return_inverse=True
+    )
+    assert link_values.tolist() == expected_values.tolist()
+    assert links.dtype == np.uint32
+    assert links.tolist() == expected_links.tolist()
+    # The spilled runs are removed.
+    assert not list(tmp_path.iterdir())
+
+
+def test_link_interner_values(tmp_path):
+    interner = LinkInterner(16, tmp_path)
+    for chunk in ([3, 1], [2], [5, 1, 4]):
+        interner.add(np.array(chunk, dtype=np.uint64))
+    assert interner.values().tolist() == [3, 1, 2, 5, 1, 4]
+    assert not list(tmp_path.iterdir())
+
+
+def test_merge_runs():
+    rng = np.random.default_rng(2021)
+    runs = [np.unique(rng.integers(0, 1000, size=200)) for _ in range(5)]
+    expected = np.unique(np.concatenate(runs)).tolist()
+    for block_size in (1, 7, 1000):
+        assert merge_runs(runs, block_size).tolist() == expected
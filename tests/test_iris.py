@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+from zeph.iris import ChunksReader, target_lines, upload_prefix_list
+
+
+class FakeIrisClient:
+    """Record the uploaded target files, failing the first `failures` requests."""
+
+    def __init__(self, failures: int = 0, status_code: int = 201):
+        self.failures = failures
+        self.status_code = status_code
+        self.attempts = 0
+        self.files: dict[str, bytes] = {}
+
+    def post(self, url: str, files: dict) -> httpx.Response:
+        self.attempts += 1
+        request = httpx.Request("POST", url)
+        (key, file) = files["target_file"]
+        content = file.read()
+        if self.failures:
+            self.failures -= 1
+            raise httpx.ConnectError("connection reset", request=request)
+        self.files[key] = content
+        return httpx.Response(self.status_code, request=request)
+
+
+def test_chunks_reader():
+    file = ChunksReader(iter([b"ab", b"", b"cde"]))
+    assert file.read(1) == b"a"
+    assert file.read() == b"bcde"
+    assert file.read() == b""
+
+
+def test_target_lines():
+    prefixes = [f"10.0.{i}.0/24" for i in range(5)]
+    content = b"".join(target_lines(prefixes, "icmp", 2, 32, lines_per_chunk=2))
+    assert content.decode() == "\n".join(f"{prefix},icmp,2,32,6" for prefix in prefixes)
+    assert b"".join(target_lines([], "icmp", 2, 32)) == b""
+
+
+def test_target_lines_ttl_bounds():
+    prefixes = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24"]
+    ttl_bounds = {"10.0.0.0/24": (5, 10), "10.0.1.0/24": (1, 40)}
+    content = b"".join(
+        target_lines(prefixes, "icmp", 2, 32, ttl_bounds=ttl_bounds, ttl_margin=1)
+    )
+    assert content.decode().split("\n") == [
+        "10.0.0.0/24,icmp,4,11,6",
+        # The ranges stay within the global range.
+        "10.0.1.0/24,icmp,2,32,6",
+        # The prefixes without bounds are probed at all the TTLs.
+        "10.0.2.0/24,icmp,2,32,6",
+    ]
+
+
+def test_upload_prefix_list():
+    prefixes = {f"10.0.{i}.0/24" for i in range(10_000)}
+    client = FakeIrisClient(failures=1)
+    key = upload_prefix_list(client, prefixes, "icmp", 2, 32, retry_delay=0)
+    assert client.attempts == 2
+    lines = client.files[key].decode().split("\n")
+    assert sorted(lines) == sorted(f"{prefix},icmp,2,32,6" for prefix in prefixes)
+    key = upload_prefix_list(
+        client, prefixes, "icmp", 2, 32, ttl_bounds={"10.0.0.0/24": (5, 10)}
+    )
+    assert "10.0.0.0/24,icmp,3,12,6" in client.files[key].decode().split("\n")
+
+
+def test_upload_prefix_list_failure():
+    client = FakeIrisClient(failures=2)
+    with pytest.raises(httpx.TransportError):
+        upload_prefix_list(
+            client, {"10.0.0.0/24"}, "icmp", 2, 32, retries=1, retry_delay=0
+        )
+    client = FakeIrisClient(status_code=400)
+    with pytest.raises(RuntimeError):
+        upload_prefix_list(client, {"10.0.0.0/24"}, "icmp", 2, 32, retry_delay=0)
+    assert client.attempts == 1
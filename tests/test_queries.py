@@ -0,0 +1,127 @@
+import re
+from ipaddress import IPv6Address
+
+import numpy as np
+import pytest
+
+from zeph.queries import (
+    REWARDS_DTYPE,
+    TTL_BOUNDS_DTYPE,
+    GetTTLBounds,
+    GetUniqueLinksByPrefix,
+    GetUniqueLinksRewards,
+)
+
+
+@pytest.mark.parametrize("subsets_per_agent", [1, 2, 16])
+@pytest.mark.parametrize("concurrent_requests", [1, 4])
+def test_get_unique_links_by_prefix(client, subsets_per_agent, concurrent_requests):
+    store = GetUniqueLinksByPrefix().for_all_agents(
+        client,
+        "m",
+        ["a", "b"],
+        subsets_per_agent=subsets_per_agent,
+        concurrent_requests=concurrent_requests,
+    )
+    assert store.to_dict() == {
+        ("a", "10.0.0.0/24"): {1, 2},
+        ("a", "10.0.1.0/24"): {2, 3},
+        ("a", "192.168.0.0/24"): {4},
+        ("a", "2001:db8::/64"): {2**64 - 1},
+        ("b", "10.0.0.0/24"): {1, 5},
+    }
+    assert list(store.keys())[-1] == ("b", "10.0.0.0/24")
+
+
+def test_get_unique_links_by_prefix_empty_table(client):
+    # The links table of agent "c" is empty.
+    store = GetUniqueLinksByPrefix().for_all_agents(
+        client, "m", ["b", "c"], subsets_per_agent=4
+    )
+    assert store.to_dict() == {("b", "10.0.0.0/24"): {1, 5}}
+
+
+def test_get_unique_links_by_prefix_interleaved(client):
+    # The rows of the prefixes are interleaved, as with several ClickHouse threads.
+    rows = [
+        ("::ffff:10.0.0.0", 1),
+        ("::ffff:10.0.1.0", 2),
+        ("::ffff:10.0.0.0", 2),
+        ("::ffff:10.0.1.0", 3),
+        ("::ffff:10.0.0.0", 4),
+    ]
+
+    def iter_bytes(query, data=None, settings=None):
+        for prefix, link in rows:
+            yield IPv6Address(prefix).packed + link.to_bytes(8, "little")
+
+    client.iter_bytes = iter_bytes
+    store = GetUniqueLinksByPrefix().for_all_agents(client, "m", ["a"])
+    assert len(store) == 2
+    assert store.to_dict() == {
+        ("a", "10.0.0.0/24"): {1, 2, 4},
+        ("a", "10.0.1.0/24"): {2, 3},
+    }
+
+
+def test_get_unique_links_by_prefix_iter(client):
+    queries = []
+    iter_bytes = client.iter_bytes
+
+    def record(query, data=None, settings=None):
+        queries.append(query)
+        return iter_bytes(query, data, settings)
+
+    client.iter_bytes = record
+    blocks = GetUniqueLinksByPrefix().iter_all_agents(
+        client, "m", ["b", "a"], subsets_per_agent=16, concurrent_requests=1
+    )
+    agent, keys, sizes, links = next(blocks)
+    assert agent == "b"
+    assert sizes.tolist() == [2]
+    # At most one block is fetched ahead of the consumer.
+    assert len(queries) <= 2
+    agents = [block[0] for block in blocks]
+    assert set(agents) == {"a"}
+    assert len(queries) == 1 + len(agents)
+
+
+def test_get_unique_links_rewards():
+    records = np.zeros(3, dtype=REWARDS_DTYPE)
+    records["agent"] = [0, 0, 1]
+    records["low"] = [0xFFFF0A000000, 0xFFFF0A000100, 0xFFFF0A000000]
+    records["reward"] = [2, 1, 5]
+
+    class Client:
+        def iter_bytes(self, query, data=None, settings=None):
+            assert "links__m__a" in query and "links__m__b" in query
+            yield records.tobytes()
+
+    query = GetUniqueLinksRewards(agents_uuid=("a", "b", "c"))
+    assert query.for_all_agents(Client(), "m") == {
+        "a": {"10.0.0.0/24": 2, "10.0.1.0/24": 1},
+        "b": {"10.0.0.0/24": 5},
+        "c": {},
+    }
+
+
+@pytest.mark.parametrize("concurrent_requests", [1, 2])
+def test_get_ttl_bounds(concurrent_requests):
+    records = {
+        "links__m__a": np.array(
+            [(0, 0xFFFF0A000000, 2, 12), (0, 0xFFFF0A000100, 3, 9)],
+            dtype=TTL_BOUNDS_DTYPE,
+        )
+    }
+
+    class Client:
+        def iter_bytes(self, query, data=None, settings=None):
+            assert "GROUP BY probe_dst_prefix" in query
+            table = re.search(r"FROM (\w+)", query).group(1)
+            yield records.get(table, np.empty(0, TTL_BOUNDS_DTYPE)).tobytes()
+
+    query = GetTTLBounds(filter_virtual=True)
+    bounds = query.for_all_agents(
+        Client(), "m", ["a", "b"], concurrent_requests=concurrent_requests
+    )
+    assert bounds == {"a": {"10.0.0.0/24": (2, 12), "10.0.1.0/24": (3, 9)}, "b": {}}
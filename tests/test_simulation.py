@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+
+from zeph.history import RewardHistory
+from zeph.queries import GetUniqueLinksByPrefix, GetUniqueLinksRewards
+from zeph.simulation import (
+    GroundTruth,
+    SimulatedClickHouse,
+    SimulatedIris,
+    simulate,
+    simulate_cycles,
+)
+from zeph.store import LinkStore
+from zeph.utilities import network_key
+
+LINKS = {
+    ("a", "10.0.0.0/24"): {1, 2},
+    ("a", "10.0.1.0/24"): {2, 3},
+    ("a", "2001:db8::/64"): {4},
+    ("b", "10.0.0.0/24"): {1, 5},
+    ("b", "10.0.2.0/24"): {6, 7, 8},
+}
+
+
+@pytest.fixture
+def ground_truth():
+    return GroundTruth(LinkStore.from_dict(LINKS))
+
+
+def measure(ground_truth, prefixes):
+    """Create a measurement where each agent probes `prefixes`."""
+    iris = SimulatedIris(ground_truth)
+    keys = np.array([network_key(prefix) for prefix in prefixes], dtype=np.uint64)
+    iris.targets["targets"] = keys
+    definition = {
+        "tags": [],
+        "agents": [{"uuid": agent, "target_file": "targets"} for agent in "ab"],
+    }
+    measurement = iris.post("/measurements", json=definition).json()
+    return iris, measurement["uuid"]
+
+
+def test_ground_truth_save_load(ground_truth, tmp_path):
+    ground_truth.save(tmp_path / "ground-truth.npz")
+    loaded = GroundTruth.load(tmp_path / "ground-truth.npz")
+    assert loaded.store.to_dict() == LINKS
+
+
+@pytest.mark.parametrize("subsets_per_agent", [1, 4])
+def test_simulated_clickhouse(ground_truth, subsets_per_agent):
+    iris, uuid = measure(ground_truth, ["10.0.0.0/24", "2001:db8::/64", "1.0.0.0/24"])
+    clickhouse = SimulatedClickHouse(iris, chunk_size=10)
+    store = GetUniqueLinksByPrefix().for_all_agents(
+        clickhouse, uuid, ["a", "b"], subsets_per_agent=subsets_per_agent
+    )
+    assert store.to_dict() == {
+        ("a", "10.0.0.0/24"): {1, 2},
+        ("a", "2001:db8::/64"): {4},
+        ("b", "10.0.0.0/24"): {1, 5},
+    }
+    rewards = GetUniqueLinksRewards(agents_uuid=("a", "b")).for_all_agents(
+        clickhouse, uuid
+    )
+    assert rewards == {
+        "a": {"10.0.0.0/24": 1, "2001:db8::/64": 1},
+        "b": {"10.0.0.0/24": 1},
+    }
+
+
+def test_simulated_clickhouse_empty_table(ground_truth):
+    # Agent "b" discovers no links.
+    iris, uuid = measure(ground_truth, ["10.0.1.0/24"])
+    clickhouse = SimulatedClickHouse(iris)
+    store = GetUniqueLinksByPrefix().for_all_agents(
+        clickhouse, uuid, ["a", "b"], subsets_per_agent=4
+    )
+    assert store.to_dict() == {("a", "10.0.1.0/24"): {2, 3}}
+
+
+@pytest.mark.parametrize("server_side_rewards", [False, True])
+def test_simulate(ground_truth, server_side_rewards):
+    universe = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "2001:db8::/64"]
+    results = list(
+        simulate(
+            ground_truth,
+            universe,
+            cycles=3,
+            budget=4,
+            ranker="UniqueLinksRanker",
+            seed=1,
+            server_side_rewards=server_side_rewards,
+        )
+    )
+    assert [result["cycle"] for result in results] == [0, 1, 2]
+    # With a budget equal to the universe, all the links are discovered at once.
+    assert results[0]["discovered_links"] == 8
+    assert results[1]["new_links"] == 0
+    assert "rank" in results[1]["stages"]
+
+
+def test_simulate_compare_rankers(ground_truth):
+    universe = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "2001:db8::/64"]
+    results = list(
+        simulate(
+            ground_truth,
+            universe,
+            cycles=2,
+            budget=4,
+            seed=1,
+            compare_rankers=["NaiveRanker", "DFGCoverRanker"],
+        )
+    )
+    assert results[0]["discovered_links"] == 8
+    assert "compare-rankers" in results[1]["stages"]
+    assert "get-previous-links" in results[1]["stages"]
+
+
+@pytest.mark.parametrize("history_decay", [0.0, 0.5])
+def test_simulate_history(ground_truth, history_decay, tmp_path):
+    universe = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "2001:db8::/64"]
+    results = list(
+        simulate_cycles(
+            ground_truth,
+            universe,
+            cycles=3,
+            budget=4,
+            ranker="SketchCoverRanker",
+            exploration_ratio=0.1,
+            seed=1,
+            server_side_rewards=False,
+            compare_rankers=None,
+            history_file=tmp_path / "history.npz",
+            history_decay=history_decay,
+        )
+    )
+    assert "update-history" in results[1]["stages"]
+    # Each cycle probes all the prefixes, and is added to the history by the next one:
+    # a decay of 0 drops the rewards of the first cycle, and a decay of 0.5 halves them.
+    history = RewardHistory.load(tmp_path / "history.npz")
+    assert history.measurements == ["simulation-0", "simulation-1"]
+    weight = 1 + history_decay
+    assert history.rewards() == {
+        "a": {
+            "10.0.0.0/24": 2 * weight,
+            "10.0.1.0/24": 2 * weight,
+            "2001:db8::/64": weight,
+        },
+        "b": {"10.0.2.0/24": 3 * weight, "10.0.0.0/24": 2 * weight},
+    }
+
+
+def test_simulate_history_decay(ground_truth):
+    universe = ["10.0.0.0/24", "10.0.1.0/24"]
+    # A decay of 0 still uses the history.
+    results = list(
+        simulate(
+            ground_truth,
+            universe,
+            cycles=2,
+            budget=2,
+            ranker="SketchCoverRanker",
+            history_decay=0.0,
+        )
+    )
+    assert "update-history" in results[1]["stages"]
+    # The history holds sketches of the links, which only `SketchCoverRanker` ranks.
+    with pytest.raises(ValueError):
+        list(simulate(ground_truth, universe, cycles=2, budget=2, history_decay=0.5))
@@ -0,0 +1,113 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from zeph.rankers import (
+    DFGCoverRanker,
+    GreedyCoverRanker,
+    NaiveRanker,
+    SketchCoverRanker,
+    UniqueLinksRanker,
+)
+from zeph.store import ARRAYS, LinkStore, LinkStoreBuilder
+from zeph.utilities import network_key
+
+
+@pytest.fixture
+def links(random_links):
+    return random_links(("a", "b"), 50, 2**64, 10, ip_networks=True)
+
+
+def test_link_store_from_dict(links):
+    store = LinkStore.from_dict(links)
+    assert len(store) == len(links)
+    assert store.agents == ["a", "b"]
+    assert len(store.prefixes) == 50
+    assert store.links.dtype == np.uint32
+    assert store.link_values.dtype == np.uint64
+    assert store.to_dict() == links
+
+
+def test_link_store_builder(links):
+    builder = LinkStoreBuilder()
+    for (agent, prefix), links_ in links.items():
+        builder.add(agent, prefix, links_)
+    store = builder.build()
+    assert len(store) == len(links)
+    assert store.n_links == len(set().union(*links.values()))
+    assert store.to_dict() == links
+
+
+def test_link_store_builder_memory_limit(links, tmp_path):
+    builder = LinkStoreBuilder(memory_limit=256, spill_directory=tmp_path)
+    for (agent, prefix), links_ in links.items():
+        builder.add(agent, prefix, links_)
+    assert builder.build().to_dict() == links
+
+
+def test_link_store_builder_empty():
+    store = LinkStoreBuilder().build()
+    assert len(store) == 0
+    assert store.n_links == 0
+    assert store.to_dict() == {}
+
+
+@pytest.mark.parametrize(
+    "ranker",
+    [
+        DFGCoverRanker,
+        GreedyCoverRanker,
+        NaiveRanker,
+        SketchCoverRanker,
+        UniqueLinksRanker,
+    ],
+)
+def test_rankers_accept_link_store(ranker, links):
+    assert ranker()(LinkStore.from_dict(links)) == ranker()(links)
+
+
+def test_link_store_save_load(links, tmp_path):
+    store = LinkStore.from_dict(links)
+    store.save(tmp_path)
+    loaded = LinkStore.load(tmp_path)
+    assert not loaded.links.flags.writeable
+    assert loaded.to_dict() == {
+        (agent, str(prefix)): links_ for (agent, prefix), links_ in links.items()
+    }
+
+
+def test_link_store_save_load_network_array(links, tmp_path):
+    builder = LinkStoreBuilder()
+    for (agent, prefix), links_ in links.items():
+        builder.add_many(
+            agent,
+            np.array([network_key(str(prefix))], dtype=np.uint64),
+            np.array([len(links_)]),
+            np.array(sorted(links_), dtype=np.uint64),
+        )
+    store = builder.build()
+    store.save(tmp_path)
+    assert LinkStore.load(tmp_path, mmap_mode=None).to_dict() == store.to_dict()
+
+
+@pytest.mark.parametrize(
+    "ranker",
+    [
+        DFGCoverRanker,
+        GreedyCoverRanker,
+        lambda: GreedyCoverRanker(lazy=False),
+        NaiveRanker,
+        SketchCoverRanker,
+        UniqueLinksRanker,
+    ],
+)
+def test_rankers_do_not_modify_their_input(ranker, links):
+    expected = deepcopy(links)
+    ranked = ranker()(links)
+    assert links == expected
+    # The rankers operating on arrays accept read-only arrays, such as memory maps.
+    store = LinkStore.from_dict(links)
+    for name in ARRAYS:
+        getattr(store, name).flags.writeable = False
+    assert ranker()(store) == ranked
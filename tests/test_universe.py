@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from zeph.universe import Universe
+
+NETWORKS = [
+    "10.0.1.0/24",
+    "10.0.0.0/24",
+    "2001:db8:0:1::/64",
+    "192.0.2.0/24",
+    "2001:db8::/64",
+]
+
+
+def test_universe():
+    universe = Universe.from_networks(NETWORKS + NETWORKS[:2])
+    assert len(universe) == 5
+    assert list(universe) == [
+        "10.0.0.0/24",
+        "10.0.1.0/24",
+        "192.0.2.0/24",
+        "2001:db8::/64",
+        "2001:db8:0:1::/64",
+    ]
+    assert set(universe) == set(NETWORKS)
+    assert all(network in universe for network in NETWORKS)
+    assert "10.0.2.0/24" not in universe
+    assert "2001:db8:0:2::/64" not in universe
+    assert "10.0.0.0/16" not in universe
+    assert "invalid" not in universe
+    assert universe[-1] == "2001:db8:0:1::/64"
+    assert universe[-1] in universe
+    assert universe[1:3] == ["10.0.1.0/24", "192.0.2.0/24"]
+
+
+def test_universe_intervals():
+    universe = Universe.from_networks(
+        [
+            "10.0.0.0/16",
+            "10.0.255.0/24",
+            "10.1.0.0-10.1.1.255",
+            "10.2.0.0/24",
+            "2001:db8::/48",
+            "2001:db8::/64",
+        ]
+    )
+    assert universe.n_intervals == 3
+    assert universe.ipv4.tolist() == [[0x0A0000, 0x0A0101], [0x0A0200, 0x0A0200]]
+    assert len(universe) == 256 + 2 + 1 + 2**16
+    assert universe[0] == "10.0.0.0/24"
+    assert universe[256] == "10.1.0.0/24"
+    assert universe[258] == "10.2.0.0/24"
+    assert universe[259] == "2001:db8::/64"
+    assert universe[-1] == "2001:db8:0:ffff::/64"
+    assert list(universe)[250:260] == universe[250:260]
+    assert all(universe[i] in universe for i in range(0, len(universe), 97))
+    assert "10.1.2.0/24" not in universe
+    assert "2001:db8:1::/64" not in universe
+    assert "9.255.255.0/24" not in universe
+
+
+def test_universe_invalid():
+    with pytest.raises(ValueError):
+        Universe.from_networks(["10.0.0.0/25"])
+    with pytest.raises(ValueError):
+        Universe.from_networks(["10.0.0.1/16"])
+    with pytest.raises(ValueError):
+        Universe.from_networks(["10.0.1.0-10.0.0.0"])
+    with pytest.raises(ValueError):
+        Universe.from_networks(["10.0.0.256/24"])
+
+
+@pytest.mark.parametrize("networks", [NETWORKS, NETWORKS[:1], NETWORKS[2:3], []])
+def test_universe_snapshot(tmp_path, networks):
+    universe = Universe.from_networks(networks)
+    universe.save(tmp_path / "snapshot", b"digest")
+    loaded = Universe.load(tmp_path / "snapshot", b"digest")
+    assert loaded is not None
+    assert list(loaded) == list(universe)
+    assert np.array_equal(loaded.ipv4, universe.ipv4)
+    assert np.array_equal(loaded.ipv6, universe.ipv6)
+    assert Universe.load(tmp_path / "snapshot", b"other") is None
+    assert Universe.load(tmp_path / "missing") is None
+
+
+def test_universe_open(tmp_path):
+    prefixes_file = tmp_path / "prefixes.txt"
+    prefixes_file.write_text("# comment\n" + "\n".join(NETWORKS) + "\n")
+    directory = tmp_path / "universe"
+    universe = Universe.open(prefixes_file, directory)
+    assert len(list(directory.iterdir())) == 1
+    # The second time, the snapshot is memory-mapped.
+    cached = Universe.open(prefixes_file, directory)
+    assert isinstance(cached.ipv4, np.memmap)
+    assert list(cached) == list(universe)
+    # The snapshot is rebuilt when the prefixes file changes.
+    prefixes_file.write_text("10.0.0.0/24\n")
+    assert list(Universe.open(prefixes_file, directory)) == ["10.0.0.0/24"]
+    assert len(list(directory.iterdir())) == 2
+    assert list(Universe.open(prefixes_file)) == ["10.0.0.0/24"]
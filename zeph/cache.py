@@ -0,0 +1,123 @@
+"""
+Persistent cache of the links of previous measurements.
+
+Each entry holds the links of one agent of a measurement, as returned by
+`GetUniqueLinksByPrefix.fetch`, in `.npy` files that are memory-mapped when read.
+Entries are validated against the state of the measurement and evicted in
+least-recently-used order when the cache exceeds its maximum size
+(an entry larger than the cache is not written).
+"""
+import json
+import shutil
+from dataclasses import asdict
+from hashlib import sha256
+from pathlib import Path
+from tempfile import mkdtemp
+
+import numpy as np
+from diamond_miner.queries.query import Query
+
+from zeph.logging import logger
+from zeph.typing import Agent
+
+ARRAYS = ("keys", "sizes", "links")
+FINAL_STATES = ("agent_failure", "canceled", "finished")
+
+
+def measurement_version(measurement: dict) -> str | None:
+    """
+    Version of a measurement, as returned by the Iris API, used to validate the cache entries.
+    Measurements that are not finished are not cached.
+    >>> measurement_version({"state": "finished", "end_time": "2022-01-01T00:00:00"})
+    'finished:2022-01-01T00:00:00'
+    >>> measurement_version({"state": "ongoing", "end_time": None}) is None
+    True
+    """
+    if measurement.get("state") not in FINAL_STATES:
+        return None
+    return f"{measurement['state']}:{measurement.get('end_time')}"
+
+
+class LinkCache:
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, measurement_uuid: str, agent_uuid: Agent, query: Query) -> str:
+        """Cache key of the results of `query` for an agent of a measurement."""
+        params = {
+            "measurement_uuid": measurement_uuid,
+            "agent_uuid": agent_uuid,
+            "query": query.name,
+            "parameters": asdict(query),
+        }
+        return sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def get(
+        self, key: str, version: str
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        entry = self.directory / key
+        try:
+            metadata = json.loads((entry / "metadata.json").read_text())
+            if metadata["version"] != version:
+                logger.info("cache-invalid key=%s", key)
+                return None
+            arrays = tuple(np.load(entry / f"{x}.npy", mmap_mode="r") for x in ARRAYS)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Mark the entry as recently used
+        (entry / "metadata.json").touch()
+        logger.info("cache-hit key=%s", key)
+        return arrays
+
+    def put(
+        self,
+        key: str,
+        version: str,
+        keys: np.ndarray,
+        sizes: np.ndarray,
+        links: np.ndarray,
+    ) -> None:
+        # Write to a temporary directory first, so that readers never see partial entries.
+        tmp = Path(mkdtemp(dir=self.directory, prefix=".tmp-"))
+        for name, array in zip(ARRAYS, (keys, sizes, links)):
+            np.save(tmp / f"{name}.npy", array)
+        (tmp / "metadata.json").write_text(json.dumps({"version": version}))
+        size = entry_size(tmp)
+        if size > self.max_bytes:
+            # The entry would evict the whole cache, and then itself.
+            logger.warning("cache-skip key=%s bytes=%s", key, size)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        entry = self.directory / key
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp.rename(entry)
+        logger.info("cache-put key=%s", key)
+        self.evict(keep=key)
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Remove the least recently used entries, except `keep`,
+        until the cache fits in `max_bytes`.
+        """
+        entries, total = [], 0
+        for entry in self.directory.iterdir():
+            metadata = entry / "metadata.json"
+            if entry.name.startswith(".") or not metadata.exists():
+                continue
+            size = entry_size(entry)
+            total += size
+            if entry.name != keep:
+                entries.append((metadata.stat().st_mtime, size, entry))
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.info("cache-evict key=%s", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def entry_size(entry: Path) -> int:
+    """Size of the files of a cache entry, in bytes."""
+    return sum(file.stat().st_size for file in entry.iterdir())
@@ -0,0 +1,79 @@
+"""
+Comparison of several rankers on the same links.
+
+The links are saved once in a temporary directory (in `/dev/shm` when available),
+and each ranker runs in a worker process on a read-only memory map of this copy.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from zeph import rankers
+from zeph.store import LinkStore
+from zeph.typing import Agent, Network
+from zeph.utilities import network_key, shared_directory
+
+
+@dataclass(frozen=True)
+class RankerResult:
+    ranker: str
+    ranked_prefixes: dict[Agent, list[Network]]
+    seconds: float
+    "Time spent in the ranker, excluding the process startup."
+    covered_links: int
+    "Number of distinct links seen by the ranked prefixes."
+
+
+def covered_links(store: LinkStore, ranked_prefixes: dict[Agent, list[Network]]) -> int:
+    """
+    Number of distinct links of `store` seen by the ranked prefixes.
+    >>> store = LinkStore.from_dict({("a", "10.0.0.0/24"): {1, 2}, ("b", "10.0.0.0/24"): {2, 3}})
+    >>> covered_links(store, {"a": ["10.0.0.0/24"], "b": ["10.0.0.0/24", "10.0.1.0/24"]})
+    3
+    """
+    row_keys = store.prefix_keys()[store.row_prefixes]
+    selected = np.zeros(len(store), dtype=np.bool_)
+    for agent_id, agent in enumerate(store.agents):
+        keys = [network_key(x) for x in ranked_prefixes.get(agent, [])]
+        selected |= (store.row_agents == agent_id) & np.isin(
+            row_keys, np.array(keys, dtype=np.uint64)
+        )
+    covered = np.zeros(store.n_links, dtype=np.bool_)
+    covered[store.links_of(np.flatnonzero(selected))] = True
+    return int(np.count_nonzero(covered))
+
+
+def run_ranker(
+    ranker: str, directory: Path, budgets: dict[Agent, int] | None
+) -> RankerResult:
+    """Run a ranker on the store saved in `directory`."""
+    store = LinkStore.load(directory)
+    start = perf_counter()
+    ranked_prefixes = getattr(rankers, ranker)()(store, budgets)
+    seconds = perf_counter() - start
+    return RankerResult(
+        ranker, dict(ranked_prefixes), seconds, covered_links(store, ranked_prefixes)
+    )
+
+
+def compare_rankers(
+    store: LinkStore,
+    rankers_: list[str],
+    budgets: dict[Agent, int] | None = None,
+    processes: int | None = None,
+) -> list[RankerResult]:
+    """Run the rankers (class names of `zeph.rankers`) in parallel on `store`."""
+    with shared_directory() as directory:
+        store.save(Path(directory))
+        with ProcessPoolExecutor(
+            processes or min(len(rankers_), os.cpu_count() or 1)
+        ) as executor:
+            futures = [
+                executor.submit(run_ranker, ranker, Path(directory), budgets)
+                for ranker in rankers_
+            ]
+            return [future.result() for future in futures]
@@ -0,0 +1,158 @@
+"""
+Reward history of the prefixes over several measurement cycles.
+
+For each (agent, prefix), the history holds a decayed reward (the number of links
+discovered by the prefix, multiplied by `decay` at each cycle) and a bottom-k sketch
+of its links: the `sketch_size` smallest link hashes seen by the prefix in any cycle.
+The sketches use the same hash for all the prefixes (coordinated sampling),
+so the links shared by two prefixes tend to be kept in both sketches.
+
+The history is updated from the links of the newest measurement only.
+The sketches hold at most `sketch_size` links per prefix, so they are not link sets:
+`SketchCoverRanker.rank_history` ranks the prefixes on the history, estimating the gain
+of a prefix from its decayed reward and the fraction of its sketch not yet covered.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from zeph.store import LinkStore
+from zeph.typing import Agent, Network
+from zeph.utilities import key_network
+
+# Empty slot of a sketch.
+EMPTY = np.iinfo(np.uint64).max
+
+
+class RewardHistory:
+    """
+    >>> history = RewardHistory(sketch_size=2)
+    >>> history.update(LinkStore.from_dict({("a", "10.0.0.0/24"): {3, 1, 2}, ("a", "10.0.1.0/24"): {4}}), "m1")
+    >>> history.update(LinkStore.from_dict({("a", "10.0.0.0/24"): {5, 0}}), "m2", decay=0.5)
+    >>> history.rewards()
+    {'a': {'10.0.0.0/24': 3.5, '10.0.1.0/24': 0.5}}
+    >>> history.sketches.tolist() == [[0, 1], [4, EMPTY]]
+    True
+    """
+
+    min_reward = 0.1
+    "The prefixes whose reward falls below are forgotten."
+
+    def __init__(self, sketch_size: int = 64) -> None:
+        self.sketch_size = sketch_size
+        self.measurements: list[str] = []
+        self.agents: list[Agent] = []
+        self.row_agents = np.empty(0, dtype=np.uint32)
+        self.row_keys = np.empty(0, dtype=np.uint64)
+        self.row_rewards: np.ndarray = np.empty(0, dtype=np.float64)
+        self.sketches = np.empty((0, sketch_size), dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+    def update(
+        self, store: LinkStore, measurement_uuid: str, decay: float = 0.5
+    ) -> None:
+        """
+        Add the links of a measurement: the previous rewards are multiplied by `decay`,
+        and the links of each (agent, prefix) of `store` are merged in its sketch.
+        The link values of `store` must be integer hashes.
+        """
+        agent_ids = {agent: i for i, agent in enumerate(self.agents)}
+        for agent in store.agents:
+            agent_ids.setdefault(agent, len(agent_ids))
+        self.agents = list(agent_ids)
+        prefix_keys = store.prefix_keys()
+        new_agents = np.array(
+            [agent_ids[agent] for agent in store.agents], dtype=np.uint32
+        )[store.row_agents]
+
+        # Group the rows of the history and of the store by (agent, prefix).
+        row_agents = np.concatenate([self.row_agents, new_agents])
+        row_keys = np.concatenate([self.row_keys, prefix_keys[store.row_prefixes]])
+        rewards = np.concatenate([self.row_rewards * decay, store.sizes()])
+        order = np.lexsort((row_keys, row_agents))
+        row_agents, row_keys = row_agents[order], row_keys[order]
+        first = np.ones(len(order), dtype=np.bool_)
+        first[1:] = (row_agents[1:] != row_agents[:-1]) | (
+            row_keys[1:] != row_keys[:-1]
+        )
+        starts = np.flatnonzero(first)
+        groups = np.empty(len(order), dtype=np.int64)
+        groups[order] = np.cumsum(first) - 1
+
+        # Merge the sketches with the links of the store.
+        old_rows, old_slots = np.nonzero(self.sketches != EMPTY)
+        new_rows = np.repeat(np.arange(len(store)), store.sizes())
+        entry_groups = np.concatenate([groups[old_rows], groups[len(self) + new_rows]])
+        entry_values = np.concatenate(
+            [
+                self.sketches[old_rows, old_slots],
+                store.link_values[store.links].astype(np.uint64),
+            ]
+        )
+        sketches = bottom_k(entry_groups, entry_values, len(starts), self.sketch_size)
+
+        totals: np.ndarray = np.bincount(groups, weights=rewards, minlength=len(starts))
+        keep = totals >= self.min_reward
+        self.row_agents = row_agents[starts][keep]
+        self.row_keys = row_keys[starts][keep]
+        self.row_rewards = totals[keep]
+        self.sketches = sketches[keep]
+        self.measurements.append(measurement_uuid)
+
+    def rewards(self) -> dict[Agent, dict[Network, float]]:
+        """Decayed reward of the prefixes of each agent, in decreasing order."""
+        rewards: dict[Agent, dict[Network, float]] = {}
+        for row in np.lexsort((-self.row_rewards, self.row_agents)).tolist():
+            agent = self.agents[self.row_agents[row]]
+            prefix = key_network(int(self.row_keys[row]))
+            rewards.setdefault(agent, {})[prefix] = float(self.row_rewards[row])
+        return rewards
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez(
+                f,
+                measurements=np.array(self.measurements, dtype=str),
+                agents=np.array(self.agents, dtype=str),
+                row_agents=self.row_agents,
+                row_keys=self.row_keys,
+                rewards=self.row_rewards,
+                sketches=self.sketches,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "RewardHistory":
+        with np.load(path) as data:
+            history = cls(data["sketches"].shape[1])
+            history.measurements = data["measurements"].tolist()
+            history.agents = data["agents"].tolist()
+            history.row_agents = data["row_agents"]
+            history.row_keys = data["row_keys"]
+            history.row_rewards = data["rewards"]
+            history.sketches = data["sketches"]
+        return history
+
+
+def bottom_k(
+    groups: np.ndarray, values: np.ndarray, n_groups: int, k: int
+) -> np.ndarray:
+    """
+    The `k` smallest distinct values of each group, padded with `EMPTY`.
+    >>> bottom_k(np.array([0, 1, 0, 0, 0]), np.array([5, 3, 1, 5, 4]), 3, 2).tolist() == [[1, 4], [3, EMPTY], [EMPTY, EMPTY]]
+    True
+    """
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    distinct = np.ones(len(order), dtype=np.bool_)
+    distinct[1:] = (groups[1:] != groups[:-1]) | (values[1:] != values[:-1])
+    groups, values = groups[distinct], values[distinct]
+    # Rank of each value in its group.
+    starts = np.searchsorted(groups, groups)
+    ranks = np.arange(len(groups)) - starts
+    keep = ranks < k
+    sketches = np.full((n_groups, k), EMPTY, dtype=np.uint64)
+    sketches[groups[keep], ranks[keep]] = values[keep]
+    return sketches
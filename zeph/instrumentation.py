@@ -0,0 +1,232 @@
+"""
+Instrumentation of the stages of a Zeph cycle.
+
+Each stage is recorded as a span, with its wall-clock time, the CPU time of the process,
+the change of the resident set size of the process during the stage (on Linux),
+the maximum resident set size of the process since it started (not specific to the stage),
+and, if enabled, the peak memory allocated by Python during the stage (`tracemalloc`),
+as well as arbitrary counts (rows, prefixes, ...).
+The spans are written to a JSON-lines file and/or to a Prometheus textfile
+(for the node exporter textfile collector).
+When no output is specified (and the instrumentation is not explicitly enabled,
+to keep the spans in memory), `Instrumentation.span` returns a shared no-op span.
+
+>>> instrumentation = Instrumentation()
+>>> with instrumentation.span("rank") as span:
+...     span.count(prefixes=42)
+>>> instrumentation.spans
+[]
+"""
+import json
+import os
+import resource
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from types import TracebackType
+from typing import Any
+
+
+class Span:
+    def __init__(
+        self, instrumentation: "Instrumentation", name: str, attributes: dict[str, Any]
+    ) -> None:
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.counts: dict[str, int] = {}
+        self.start = 0.0
+        self.start_perf = 0.0
+        self.start_cpu = 0.0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.start_rss: int | None = None
+        self.rss_delta_bytes: int | None = None
+        self.process_max_rss_bytes = 0
+        self.peak_traced_bytes: int | None = None
+        self.error: str | None = None
+
+    def count(self, **counts: int) -> None:
+        """Record counts, e.g. `span.count(rows=len(rows))`."""
+        self.counts.update(counts)
+
+    def __enter__(self) -> "Span":
+        self.instrumentation.enter(self)
+        self.start = time.time()
+        self.start_perf = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_rss = resident_bytes()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.wall_seconds = time.perf_counter() - self.start_perf
+        self.cpu_seconds = time.process_time() - self.start_cpu
+        rss = resident_bytes()
+        if rss is not None and self.start_rss is not None:
+            self.rss_delta_bytes = rss - self.start_rss
+        # `ru_maxrss` is in kilobytes on Linux, and it is the peak of the whole process.
+        self.process_max_rss_bytes = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        )
+        if exc_type:
+            self.error = exc_type.__name__
+        self.instrumentation.exit(self)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "attributes": self.attributes,
+            "start": self.start,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "process_max_rss_bytes": self.process_max_rss_bytes,
+            "peak_traced_bytes": self.peak_traced_bytes,
+            "counts": self.counts,
+            "error": self.error,
+        }
+
+
+class NullSpan:
+    def count(self, **counts: int) -> None:
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Instrumentation:
+    def __init__(
+        self,
+        metrics_file: Path | None = None,
+        prometheus_file: Path | None = None,
+        trace_memory: bool = False,
+        enabled: bool = False,
+    ) -> None:
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.trace_memory = trace_memory
+        self.enabled = enabled or bool(metrics_file or prometheus_file)
+        self.spans: list[Span] = []
+        self.active: list[Span] = []
+        self.lock = Lock()
+        self.started_tracing = False
+        if self.enabled and self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def span(self, name: str, **attributes: Any) -> Span | NullSpan:
+        """Record a stage, e.g. `with instrumentation.span("select", agent=agent_uuid)`."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def enter(self, span: Span) -> None:
+        with self.lock:
+            self.update_peaks()
+            span.peak_traced_bytes = 0 if self.tracing else None
+            self.active.append(span)
+
+    def exit(self, span: Span) -> None:
+        with self.lock:
+            self.update_peaks()
+            self.active.remove(span)
+            self.spans.append(span)
+            if self.metrics_file:
+                with self.metrics_file.open("a") as f:
+                    f.write(json.dumps(span.to_dict()) + "\n")
+
+    @property
+    def tracing(self) -> bool:
+        return self.trace_memory and tracemalloc.is_tracing()
+
+    def update_peaks(self) -> None:
+        """
+        Since `tracemalloc` has a single peak, which is reset when a span starts or ends,
+        the peak since the last reset is attributed to all the active spans.
+        """
+        if not self.tracing:
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for span in self.active:
+            span.peak_traced_bytes = max(span.peak_traced_bytes or 0, peak)
+
+    def close(self) -> None:
+        """Write the Prometheus textfile, with the last span of each name and attributes."""
+        if self.prometheus_file:
+            self.write_prometheus(self.prometheus_file)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def write_prometheus(self, path: Path) -> None:
+        metrics: dict[str, dict[str, float]] = {
+            "zeph_span_wall_seconds": {},
+            "zeph_span_cpu_seconds": {},
+            "zeph_span_rss_delta_bytes": {},
+            "zeph_span_process_max_rss_bytes": {},
+            "zeph_span_peak_traced_bytes": {},
+            "zeph_span_count": {},
+            "zeph_span_errors": {},
+        }
+        for span in self.spans:
+            labels = {"name": span.name, **span.attributes}
+            key = format_labels(labels)
+            metrics["zeph_span_wall_seconds"][key] = span.wall_seconds
+            metrics["zeph_span_cpu_seconds"][key] = span.cpu_seconds
+            if span.rss_delta_bytes is not None:
+                metrics["zeph_span_rss_delta_bytes"][key] = span.rss_delta_bytes
+            metrics["zeph_span_process_max_rss_bytes"][key] = span.process_max_rss_bytes
+            if span.peak_traced_bytes is not None:
+                metrics["zeph_span_peak_traced_bytes"][key] = span.peak_traced_bytes
+            metrics["zeph_span_errors"][key] = int(bool(span.error))
+            for name, value in span.counts.items():
+                metrics["zeph_span_count"][
+                    format_labels({**labels, "key": name})
+                ] = value
+        lines = []
+        for metric, values in metrics.items():
+            if values:
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(
+                    f"{metric}{labels} {value}" for labels, value in values.items()
+                )
+        # Write atomically, since the file can be read by the node exporter at any time.
+        with NamedTemporaryFile("w", dir=path.parent, delete=False) as f:
+            f.write("\n".join(lines) + "\n")
+        Path(f.name).replace(path)
+
+
+def resident_bytes() -> int | None:
+    """Current resident set size of the process, if available (`/proc` on Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def format_labels(labels: dict[str, Any]) -> str:
+    """
+    >>> format_labels({"name": "upload", "agent": 'a"b'})
+    '{name="upload",agent="a\\\\"b"}'
+    """
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
@@ -0,0 +1,189 @@
+"""
+Interning of the link hashes to dense ids, with an external sort.
+
+The id of a link is the rank of its hash among the distinct hashes.
+The hashes are buffered in memory up to `memory_limit` bytes; beyond that,
+the buffer is spilled to disk as its raw values and a sorted run of its distinct values.
+The runs are then merged block by block, and the ids are assigned
+by searching each block of the raw values in the merged distinct values,
+so that only the distinct values and the ids are held in memory at the end.
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from zeph.logging import logger
+from zeph.utilities import concatenate
+
+
+class LinkInterner:
+    """
+    >>> interner = LinkInterner(memory_limit=16)
+    >>> interner.add(np.array([30, 10], dtype=np.uint64))
+    >>> interner.add(np.array([20, 10, 30], dtype=np.uint64))
+    >>> link_values, links = interner.finish()
+    >>> link_values.tolist(), links.tolist()
+    ([10, 20, 30], [2, 0, 1, 0, 2])
+    """
+
+    def __init__(
+        self, memory_limit: int | None = None, directory: Path | None = None
+    ) -> None:
+        """
+        Args:
+            memory_limit: size of the hashes buffered in memory before spilling them to disk
+                (unlimited by default). It does not include the distinct values and the ids
+                returned by `finish`, 12 bytes per link at most.
+            directory: directory of the spilled runs (by default, the system temporary directory).
+        """
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self.buffer: list[np.ndarray] = []
+        self.buffer_bytes = 0
+        self.spill_directory: TemporaryDirectory | None = None
+        self.runs: list[Path] = []
+        self.n_values = 0
+
+    def __len__(self) -> int:
+        """Number of hashes added."""
+        return self.n_values
+
+    def add(self, values: np.ndarray) -> None:
+        values = values.astype(np.uint64, copy=False)
+        self.buffer.append(values)
+        self.buffer_bytes += values.nbytes
+        self.n_values += len(values)
+        if self.memory_limit is not None and self.buffer_bytes > self.memory_limit:
+            self.spill()
+
+    def spill(self) -> None:
+        """Write the buffered hashes, and a sorted run of their distinct values, to disk."""
+        if not self.buffer:
+            return
+        if self.spill_directory is None:
+            self.spill_directory = TemporaryDirectory(
+                dir=self.directory, prefix="zeph-links-"
+            )
+        directory = Path(self.spill_directory.name)
+        values = np.concatenate(self.buffer)
+        with (directory / "values.bin").open("ab") as f:
+            values.tofile(f)
+        distinct = sorted_distinct(values)
+        self.runs.append(directory / f"run-{len(self.runs)}.npy")
+        np.save(self.runs[-1], distinct)
+        logger.info("spill-links values=%s distinct=%s", len(values), len(distinct))
+        self.buffer, self.buffer_bytes = [], 0
+
+    def values(self) -> np.ndarray:
+        """All the hashes, in the order in which they were added."""
+        if not self.runs:
+            return concatenate(self.buffer, np.uint64)
+        self.spill()
+        assert self.spill_directory
+        values = np.fromfile(
+            Path(self.spill_directory.name) / "values.bin", dtype=np.uint64
+        )
+        self.close()
+        return values
+
+    def finish(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the distinct hashes (sorted), and the id (`uint32`) of each hash added."""
+        if not self.runs:
+            # Everything fits in memory.
+            values = concatenate(self.buffer, np.uint64)
+            self.buffer, self.buffer_bytes = [], 0
+            link_values, links = sorted_distinct_ids(values)
+            assert len(link_values) < 2**32, "too many distinct links"
+            return link_values, links
+        self.spill()
+        assert self.spill_directory
+        directory = Path(self.spill_directory.name)
+        try:
+            runs = [np.load(run, mmap_mode="r") for run in self.runs]
+            block_size = self.block_size(len(runs))
+            link_values = merge_runs(runs, block_size)
+            assert len(link_values) < 2**32, "too many distinct links"
+            values = np.memmap(directory / "values.bin", dtype=np.uint64, mode="r")
+            links = np.empty(len(values), dtype=np.uint32)
+            for start in range(0, len(values), block_size):
+                end = start + block_size
+                # The search is faster for sorted values (fewer cache misses).
+                block = np.asarray(values[start:end])
+                order = np.argsort(block)
+                links[start:end][order] = np.searchsorted(link_values, block[order])
+            del values
+        finally:
+            self.close()
+        return link_values, links
+
+    def block_size(self, n_runs: int) -> int:
+        """Number of values of each run read at once, within the memory limit."""
+        memory_limit = self.memory_limit or 2**30
+        return max(memory_limit // (16 * max(n_runs, 1)), 2**12)
+
+    def close(self) -> None:
+        """Remove the spilled runs."""
+        if self.spill_directory is not None:
+            self.spill_directory.cleanup()
+            self.spill_directory = None
+        self.runs = []
+
+
+def merge_runs(runs: list[np.ndarray], block_size: int) -> np.ndarray:
+    """
+    Distinct values of sorted runs, read `block_size` values at a time.
+    >>> runs = [np.array([1, 3, 5, 7]), np.array([2, 3, 8]), np.array([], dtype=int)]
+    >>> merge_runs(runs, 2).tolist()
+    [1, 2, 3, 5, 7, 8]
+    """
+    positions = [0] * len(runs)
+    blocks = []
+    while True:
+        active = [i for i, run in enumerate(runs) if positions[i] < len(run)]
+        if not active:
+            break
+        heads = {}
+        for i in active:
+            start = positions[i]
+            end = start + block_size
+            heads[i] = runs[i][start:end]
+        # All the values up to the smallest last value of the heads are in the heads.
+        bound = min(head[-1] for head in heads.values())
+        parts = []
+        for i, head in heads.items():
+            n = int(np.searchsorted(head, bound, side="right"))
+            parts.append(head[:n])
+            positions[i] += n
+        blocks.append(sorted_distinct(np.concatenate(parts)))
+    return concatenate(blocks, np.uint64)
+
+
+def sorted_distinct(values: np.ndarray) -> np.ndarray:
+    """
+    Same as `np.unique(values)`, which is much slower since it uses a hash table for integers.
+    >>> sorted_distinct(np.array([3, 1, 3, 2])).tolist()
+    [1, 2, 3]
+    """
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=np.bool_)
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    distinct: np.ndarray = values[keep]
+    return distinct
+
+
+def sorted_distinct_ids(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Same as `np.unique(values, return_inverse=True)`, with `uint32` ids, but with a single sort.
+    >>> distinct, ids = sorted_distinct_ids(np.array([3, 1, 3, 2]))
+    >>> distinct.tolist(), ids.tolist()
+    ([1, 2, 3], [2, 0, 2, 1])
+    """
+    order = np.argsort(values)
+    values = values[order]
+    keep = np.ones(len(values), dtype=np.bool_)
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    ids = np.empty(len(values), dtype=np.uint32)
+    ids[order] = np.cumsum(keep) - 1
+    distinct: np.ndarray = values[keep]
+    return distinct, ids
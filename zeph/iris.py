@@ -1,10 +1,15 @@
 """API drivers."""
-from io import BytesIO
+from collections.abc import Iterable, Iterator, Mapping
+from io import RawIOBase
+from itertools import islice
+from time import sleep
+from typing import Any
 from uuid import uuid4
 
-from httpx import HTTPStatusError
+from httpx import HTTPStatusError, TransportError
 from iris_client import IrisClient
 
+from zeph.logging import logger
 from zeph.typing import Network
 
 
@@ -22,25 +27,135 @@ def get_agents(client: IrisClient, tag: str) -> dict[str, dict]:
     return {agent["uuid"]: agent for agent in agents}
 
 
+def get_measurement(client: IrisClient, measurement_uuid: str) -> dict:
+    return dict(client.get(f"/measurements/{measurement_uuid}").json())
+
+
 def get_measurement_agents(client: IrisClient, measurement_uuid: str) -> list[str]:
-    measurement = client.get(f"/measurements/{measurement_uuid}").json()
+    measurement = get_measurement(client, measurement_uuid)
     return [agent["agent_uuid"] for agent in measurement["agents"]]
 
 
+class ChunksReader(RawIOBase):
+    """
+    Read-only, non-seekable file object over an iterator of bytes.
+    httpx streams such files with a chunked transfer encoding,
+    without loading the whole content in memory.
+
+    >>> ChunksReader(iter([b"ab", b"", b"cde"])).read()
+    b'abcde'
+    """
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = chunk
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def target_lines(
+    prefixes: Iterable[Network],
+    protocol: str,
+    min_ttl: int,
+    max_ttl: int,
+    lines_per_chunk: int = 4096,
+    ttl_bounds: Mapping[Network, tuple[int, int]] | None = None,
+    ttl_margin: int = 2,
+) -> Iterator[bytes]:
+    """
+    Generate the lines of a target file, `lines_per_chunk` lines at a time.
+    With `ttl_bounds` (see `zeph.queries.GetTTLBounds`), the TTL range of each prefix
+    is its observed range, widened by `ttl_margin` on each side, within `min_ttl..max_ttl`.
+    The prefixes without bounds (e.g. the exploration prefixes) are probed at `min_ttl..max_ttl`.
+    >>> b"".join(target_lines(["10.0.0.0/24", "10.0.1.0/24"], "icmp", 2, 32, ttl_bounds={"10.0.0.0/24": (3, 12)}))
+    b'10.0.0.0/24,icmp,2,14,6\\n10.0.1.0/24,icmp,2,32,6'
+    """
+    prefixes = iter(prefixes)
+    separator = ""
+    while chunk := list(islice(prefixes, lines_per_chunk)):
+        if ttl_bounds:
+            ranges = [
+                ttl_range(ttl_bounds.get(prefix), min_ttl, max_ttl, ttl_margin)
+                for prefix in chunk
+            ]
+        else:
+            ranges = [(min_ttl, max_ttl)] * len(chunk)
+        lines = "\n".join(
+            f"{prefix},{protocol},{low},{high},6"
+            for prefix, (low, high) in zip(chunk, ranges)
+        )
+        yield f"{separator}{lines}".encode()
+        separator = "\n"
+
+
+def ttl_range(
+    bounds: tuple[int, int] | None, min_ttl: int, max_ttl: int, margin: int
+) -> tuple[int, int]:
+    """
+    TTL range of a prefix whose links were observed between `bounds`.
+    >>> ttl_range((5, 10), 2, 32, 2), ttl_range((2, 31), 2, 32, 2), ttl_range(None, 2, 32, 2)
+    ((3, 12), (2, 32), (2, 32))
+    """
+    if bounds is None:
+        return min_ttl, max_ttl
+    low, high = max(bounds[0] - margin, min_ttl), min(bounds[1] + margin, max_ttl)
+    if low > high:
+        return min_ttl, max_ttl
+    return low, high
+
+
 def upload_prefix_list(
     client: IrisClient,
-    prefixes: set[Network],
+    prefixes: Iterable[Network],
     protocol: str,
     min_ttl: int,
     max_ttl: int,
+    retries: int = 3,
+    retry_delay: float = 5.0,
+    ttl_bounds: Mapping[Network, tuple[int, int]] | None = None,
+    ttl_margin: int = 2,
 ) -> str:
+    """
+    Upload a target file, streamed from `prefixes`; see `target_lines` for the TTLs.
+    Transport and server (5xx) errors are retried `retries` times,
+    so `prefixes` must be iterable more than once (e.g. a set).
+    """
     key = f"zeph__{uuid4()}.csv"
-    file = BytesIO(
-        "\n".join(
-            f"{prefix},{protocol},{min_ttl},{max_ttl},6" for prefix in prefixes
-        ).encode()
-    )
-    res = client.post("/targets", files={"target_file": (key, file)})
+    for attempt in range(retries + 1):
+        file = ChunksReader(
+            target_lines(
+                prefixes,
+                protocol,
+                min_ttl,
+                max_ttl,
+                ttl_bounds=ttl_bounds,
+                ttl_margin=ttl_margin,
+            )
+        )
+        try:
+            res = client.post("/targets", files={"target_file": (key, file)})
+        except TransportError as e:
+            if attempt == retries:
+                raise
+            error = repr(e)
+        else:
+            if not res.is_server_error or attempt == retries:
+                break
+            error = f"status_code={res.status_code}"
+        logger.warning("key=%s attempt=%s error=%s", key, attempt + 1, error)
+        sleep(retry_delay * 2**attempt)
     try:
         res.raise_for_status()
     except HTTPStatusError as e:
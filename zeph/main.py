@@ -4,26 +4,38 @@ Zeph.
 Communicate with Iris to perform measurements.
 """
 import logging
+from collections.abc import Collection, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 import typer
 from iris_client import IrisClient
 from pych_client import ClickHouseClient
-from tqdm import tqdm
 
 from zeph import rankers
+from zeph.cache import LinkCache, measurement_version
+from zeph.comparison import compare_rankers as compare_rankers_
+from zeph.history import RewardHistory
+from zeph.instrumentation import Instrumentation
 from zeph.iris import (
     create_measurement,
     get_agents,
-    get_measurement_agents,
+    get_measurement,
     upload_prefix_list,
 )
 from zeph.logging import logger
-from zeph.queries import GetUniqueLinksByPrefix
-from zeph.rankers import AbstractRanker
+from zeph.queries import GetTTLBounds, GetUniqueLinksByPrefix, GetUniqueLinksRewards
+from zeph.rankers import (
+    AbstractRanker,
+    DFGCoverRanker,
+    SketchCoverRanker,
+    UniqueLinksRanker,
+)
 from zeph.selectors import EpsilonSelector
 from zeph.typing import Network
+from zeph.universe import Universe
 
 app = typer.Typer()
 
@@ -32,7 +44,7 @@ app = typer.Typer()
 def zeph(
     prefixes_file: Path = typer.Argument(
         ...,
-        help="File containing all the /24 or /64 prefixes that can be probed.",
+        help="File containing all the /24 or /64 prefixes that can be probed (or larger networks and address ranges).",
     ),
     previous_uuid: Optional[str] = typer.Argument(
         None,
@@ -68,6 +80,15 @@ def zeph(
         help="The maximum probe TTL",
         metavar="TTL",
     ),
+    adaptive_ttl: bool = typer.Option(
+        False,
+        help="Probe each prefix in the TTL range of its links in the previous measurement (within --min-ttl and --max-ttl)",
+    ),
+    ttl_margin: int = typer.Option(
+        2,
+        help="Number of TTLs probed beyond the range of the links of a prefix (--adaptive-ttl only)",
+        metavar="N",
+    ),
     exploration_ratio: float = typer.Option(
         0.1,
         help="The minimum percentage of the budget allocated to exploration",
@@ -76,14 +97,94 @@ def zeph(
         None,
         help="Override the agents budget",
     ),
+    seed: Optional[int] = typer.Option(
+        None,
+        help="Seed of the random selection of the prefixes",
+    ),
     ranker_class: str = typer.Option(
         "DFGCoverRanker",
         help="The class to use to rank prefixes",
     ),
+    ranker_processes: int = typer.Option(
+        1,
+        help="Number of processes computing the marginal gains (DFGCoverRanker only)",
+        metavar="N",
+    ),
+    compare_rankers: Optional[str] = typer.Option(
+        None,
+        help="Comma-separated ranker classes to run in parallel on the previous links; the ranking that covers the most links is used (overrides --ranker-class)",
+        metavar="CLASSES",
+    ),
     dry_run: bool = typer.Option(
         False,
         help="Do not actually perform the measurement",
     ),
+    concurrent_requests: int = typer.Option(
+        4,
+        help="Maximum number of concurrent ClickHouse queries",
+        metavar="N",
+    ),
+    subsets_per_agent: int = typer.Option(
+        1,
+        help="Number of subsets of the prefix space queried independently per agent",
+        metavar="N",
+    ),
+    server_side_rewards: bool = typer.Option(
+        False,
+        help="Compute the rewards in ClickHouse (UniqueLinksRanker only)",
+    ),
+    upload_concurrency: int = typer.Option(
+        4,
+        help="Maximum number of concurrent target list uploads",
+        metavar="N",
+    ),
+    upload_retries: int = typer.Option(
+        3,
+        help="Number of retries of a failed target list upload",
+        metavar="N",
+    ),
+    links_memory_limit: Optional[int] = typer.Option(
+        None,
+        help="Spill the link hashes of the previous measurement to disk (in $TMPDIR) beyond this size",
+        metavar="BYTES",
+    ),
+    history_file: Optional[Path] = typer.Option(
+        None,
+        help="Keep a decayed reward history of the prefixes in this file, and rank the prefixes on it instead of on the previous measurement only (SketchCoverRanker only)",
+        metavar="FILE",
+    ),
+    history_decay: float = typer.Option(
+        0.5,
+        help="Factor applied to the rewards of the history at each cycle",
+    ),
+    cache: bool = typer.Option(
+        True,
+        help="Cache the links of the previous measurement and the prefixes file on disk",
+    ),
+    cache_directory: Path = typer.Option(
+        Path.home() / ".cache" / "zeph",
+        help="Directory of the cache",
+        metavar="DIRECTORY",
+    ),
+    cache_max_bytes: int = typer.Option(
+        32 * 1024**3,
+        help="Maximum size of the links cache",
+        metavar="BYTES",
+    ),
+    metrics_file: Optional[Path] = typer.Option(
+        None,
+        help="Append the duration and the memory usage of each stage to this JSON-lines file",
+        metavar="FILE",
+    ),
+    prometheus_file: Optional[Path] = typer.Option(
+        None,
+        help="Write the duration and the memory usage of each stage to this Prometheus textfile",
+        metavar="FILE",
+    ),
+    trace_memory: bool = typer.Option(
+        False,
+        help="Trace the peak memory allocated by each stage (slow)",
+    ),
     iris_base_url: str = typer.Option(
         None,
         help="Iris API URL",
@@ -101,15 +202,22 @@ def zeph(
     ),
 ) -> None:
     logging.basicConfig(level=logging.INFO)
-    universe = set()
-    with prefixes_file.open() as f:
-        for line in tqdm(f):
-            if line.startswith("#"):
-                continue
-            line = line.strip()
-            assert line.endswith("/24") or line.endswith("/64")
-            universe.add(line)
-    logger.info("file=%s distinct-prefixes=%s", prefixes_file, len(universe))
+    ranker: AbstractRanker | str = ranker_class
+    if ranker_processes > 1:
+        if ranker_class != "DFGCoverRanker":
+            raise typer.BadParameter(
+                "--ranker-processes is only supported by DFGCoverRanker"
+            )
+        ranker = DFGCoverRanker(processes=ranker_processes)
+    universe = Universe.open(
+        prefixes_file, cache_directory / "universe" if cache else None
+    )
+    logger.info(
+        "file=%s distinct-prefixes=%s intervals=%s",
+        prefixes_file,
+        len(universe),
+        universe.n_intervals,
+    )
 
     with IrisClient(
         base_url=iris_base_url,
@@ -120,23 +228,44 @@ def zeph(
         if previous_uuid:
             params["measurement_uuid"] = previous_uuid
         credentials = iris.get("/users/me/services", params=params).json()
+        link_cache = LinkCache(cache_directory, cache_max_bytes) if cache else None
+        instrumentation = Instrumentation(metrics_file, prometheus_file, trace_memory)
         with ClickHouseClient(**credentials["clickhouse"]) as clickhouse:
-            run_zeph(
-                iris=iris,
-                clickhouse=clickhouse,
-                ranker=ranker_class,
-                universe=universe,
-                agent_tag=agent_tag,
-                measurement_tags=measurement_tags.split(","),
-                tool=tool,
-                protocol=protocol,
-                min_ttl=min_ttl,
-                max_ttl=max_ttl,
-                exploration_ratio=exploration_ratio,
-                previous_uuid=previous_uuid,
-                fixed_budget=fixed_budget,
-                dry_run=dry_run,
-            )
+            try:
+                run_zeph(
+                    iris=iris,
+                    clickhouse=clickhouse,
+                    ranker=ranker,
+                    compare_rankers=(
+                        compare_rankers.split(",") if compare_rankers else None
+                    ),
+                    universe=universe,
+                    agent_tag=agent_tag,
+                    measurement_tags=measurement_tags.split(","),
+                    tool=tool,
+                    protocol=protocol,
+                    min_ttl=min_ttl,
+                    max_ttl=max_ttl,
+                    adaptive_ttl=adaptive_ttl,
+                    ttl_margin=ttl_margin,
+                    exploration_ratio=exploration_ratio,
+                    previous_uuid=previous_uuid,
+                    fixed_budget=fixed_budget,
+                    dry_run=dry_run,
+                    seed=seed,
+                    concurrent_requests=concurrent_requests,
+                    subsets_per_agent=subsets_per_agent,
+                    server_side_rewards=server_side_rewards,
+                    upload_concurrency=upload_concurrency,
+                    upload_retries=upload_retries,
+                    cache=link_cache,
+                    instrumentation=instrumentation,
+                    links_memory_limit=links_memory_limit,
+                    history_file=history_file,
+                    history_decay=history_decay,
+                )
+            finally:
+                instrumentation.close()
 
 
 def run_zeph(
@@ -144,7 +273,7 @@ def run_zeph(
     iris: IrisClient,
     clickhouse: ClickHouseClient,
     ranker: AbstractRanker | str,
-    universe: set[Network],
+    universe: Collection[Network],
     agent_tag: str,
     measurement_tags: list[str],
     tool: str,
@@ -155,24 +284,35 @@ def run_zeph(
     previous_uuid: str | None,
     fixed_budget: int | None,
     dry_run: bool,
+    seed: int | None = None,
+    concurrent_requests: int = 1,
+    subsets_per_agent: int = 1,
+    server_side_rewards: bool = False,
+    upload_concurrency: int = 1,
+    upload_retries: int = 3,
+    cache: LinkCache | None = None,
+    instrumentation: Instrumentation | None = None,
+    compare_rankers: list[str] | None = None,
+    links_memory_limit: int | None = None,
+    history_file: Path | None = None,
+    history_decay: float = 0.5,
+    adaptive_ttl: bool = False,
+    ttl_margin: int = 2,
 ) -> None:
+    instrumentation = instrumentation or Instrumentation()
     if isinstance(ranker, str):
         ranker_ = getattr(rankers, ranker)()
     else:
         ranker_ = ranker
-    # Rank the prefixes based on the previous measurement
-    ranked_prefixes = {}
-    if previous_uuid:
-        logger.info("get-previous-agents")
-        previous_agents = get_measurement_agents(iris, previous_uuid)
-        logger.info("previous-agents=%s", previous_agents)
-
-        logger.info("get-previous-links")
-        query = GetUniqueLinksByPrefix(filter_virtual=True)
-        links = query.for_all_agents(clickhouse, previous_uuid, previous_agents)
-
-        logger.info("rank-previous-prefixes")
-        ranked_prefixes = ranker_(links)
+    if server_side_rewards and not isinstance(ranker_, UniqueLinksRanker):
+        raise ValueError("Server-side rewards are only supported by UniqueLinksRanker")
+    if server_side_rewards and compare_rankers:
+        raise ValueError("Server-side rewards cannot be used to compare rankers")
+    if server_side_rewards and history_file:
+        raise ValueError("Server-side rewards cannot be used with a reward history")
+    if history_file and (compare_rankers or not isinstance(ranker_, SketchCoverRanker)):
+        # The history holds sketches of the links, not the links themselves.
+        raise ValueError("The reward history is only supported by SketchCoverRanker")
 
     logger.info("get-current-agents")
     agents = get_agents(iris, agent_tag)
@@ -180,31 +320,198 @@ def run_zeph(
 
     logger.info("compute-budget")
     budgets: dict[str, int] = {}
-    for agent_uuid, agent in agents.items():
-        if fixed_budget:
-            budgets[agent_uuid] = fixed_budget
+    with instrumentation.span("compute-budget") as span:
+        for agent_uuid, agent in agents.items():
+            if fixed_budget:
+                budgets[agent_uuid] = fixed_budget
+            else:
+                # Compute the budget (number of prefixes to send per agent).
+                # Based on the probing rate and the approximate duration of the measurement.
+                # 6 hours at 100'000 pps -> 200'000 prefixes (from the paper)
+                probing_rate = agent["parameters"]["max_probing_rate"]
+                budgets[agent_uuid] = probing_rate * 2
+            logger.info("agent=%s budget=%s", agent_uuid, budgets[agent_uuid])
+        span.count(agents=len(budgets), prefixes=sum(budgets.values()))
+
+    # Rank the prefixes based on the previous measurement.
+    # Only the prefixes used for exploitation are ranked.
+    ranking_budgets = {
+        agent_uuid: EpsilonSelector.exploitation_budget(budget, exploration_ratio)
+        for agent_uuid, budget in budgets.items()
+    }
+    ranked_prefixes = {}
+    if previous_uuid:
+        logger.info("get-previous-agents")
+        previous_measurement = get_measurement(iris, previous_uuid)
+        previous_agents = [
+            agent["agent_uuid"] for agent in previous_measurement["agents"]
+        ]
+        logger.info("previous-agents=%s", previous_agents)
+
+        if server_side_rewards:
+            logger.info("get-previous-rewards")
+            with instrumentation.span("get-previous-rewards") as span:
+                rewards = GetUniqueLinksRewards(
+                    filter_virtual=True, agents_uuid=tuple(previous_agents)
+                ).for_all_agents(clickhouse, previous_uuid)
+                span.count(rows=sum(len(x) for x in rewards.values()))
+
+            logger.info("rank-previous-prefixes")
+            with instrumentation.span("rank", ranker="UniqueLinksRanker") as span:
+                ranked_prefixes = UniqueLinksRanker.rank_rewards(
+                    rewards, ranking_budgets
+                )
+                span.count(prefixes=sum(len(x) for x in ranked_prefixes.values()))
+        elif compare_rankers or history_file:
+            history = None
+            if history_file:
+                history = (
+                    RewardHistory.load(history_file)
+                    if history_file.exists()
+                    else RewardHistory()
+                )
+            if history is None or previous_uuid not in history.measurements:
+                logger.info("get-previous-links")
+                with instrumentation.span("get-previous-links") as span:
+                    store = GetUniqueLinksByPrefix(filter_virtual=True).for_all_agents(
+                        clickhouse,
+                        previous_uuid,
+                        previous_agents,
+                        subsets_per_agent=subsets_per_agent,
+                        concurrent_requests=concurrent_requests,
+                        cache=cache,
+                        cache_version=measurement_version(previous_measurement),
+                        instrumentation=instrumentation,
+                        memory_limit=links_memory_limit,
+                    )
+                    span.count(rows=len(store), links=store.n_links)
+            if history is not None and history_file:
+                # Only the newest measurement is fetched, see `zeph.history`.
+                if previous_uuid not in history.measurements:
+                    logger.info("update-history")
+                    with instrumentation.span("update-history") as span:
+                        history.update(store, previous_uuid, history_decay)
+                        history.save(history_file)
+                        span.count(rows=len(history))
+                logger.info(
+                    "history measurements=%s rows=%s",
+                    len(history.measurements),
+                    len(history),
+                )
+
+            if compare_rankers:
+                # The rankers share a single copy of the links, see `zeph.comparison`.
+                logger.info("compare-rankers")
+                with instrumentation.span("compare-rankers") as span:
+                    results = compare_rankers_(store, compare_rankers, ranking_budgets)
+                    span.count(rankers=len(results))
+                for result in results:
+                    logger.info(
+                        "ranker=%s seconds=%.3f covered-links=%s",
+                        result.ranker,
+                        result.seconds,
+                        result.covered_links,
+                    )
+                # `max` returns the first of the rankers that cover the most links.
+                best = max(results, key=lambda result: result.covered_links)
+                logger.info("selected-ranker=%s", best.ranker)
+                ranked_prefixes = best.ranked_prefixes
+            elif history is not None:
+                logger.info("rank-history-prefixes")
+                with instrumentation.span(
+                    "rank", ranker=type(ranker_).__name__
+                ) as span:
+                    ranked_prefixes = SketchCoverRanker.rank_history(
+                        history, ranking_budgets
+                    )
+                    span.count(
+                        rows=len(history),
+                        prefixes=sum(len(x) for x in ranked_prefixes.values()),
+                    )
         else:
-            # Compute the budget (number of prefixes to send per agent).
-            # Based on the probing rate and the approximate duration of the measurement.
-            # 6 hours at 100'000 pps -> 200'000 prefixes (from the paper)
-            probing_rate = agent["parameters"]["max_probing_rate"]
-            budgets[agent_uuid] = probing_rate * 2
-        logger.info("agent=%s budget=%s", agent_uuid, budgets[agent_uuid])
+            # The links are ranked as they are fetched, see `AbstractRanker.rank_blocks`.
+            logger.info("get-and-rank-previous-links")
+            counts = {"rows": 0, "links": 0}
+
+            def count_blocks(
+                blocks: Iterable[tuple[str, np.ndarray, np.ndarray, np.ndarray]]
+            ) -> Iterator[tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+                for block in blocks:
+                    counts["rows"] += len(block[1])
+                    counts["links"] += len(block[3])
+                    yield block
+
+            with instrumentation.span("rank", ranker=type(ranker_).__name__) as span:
+                blocks = GetUniqueLinksByPrefix(filter_virtual=True).iter_all_agents(
+                    clickhouse,
+                    previous_uuid,
+                    previous_agents,
+                    subsets_per_agent=subsets_per_agent,
+                    concurrent_requests=concurrent_requests,
+                    cache=cache,
+                    cache_version=measurement_version(previous_measurement),
+                    instrumentation=instrumentation,
+                )
+                ranked_prefixes = ranker_.rank_blocks(
+                    count_blocks(blocks), ranking_budgets, links_memory_limit
+                )
+                span.count(
+                    **counts, prefixes=sum(len(x) for x in ranked_prefixes.values())
+                )
+            logger.info(
+                "previous-links rows=%s links=%s", counts["rows"], counts["links"]
+            )
+
+    # Per-prefix TTL ranges, the prefixes not probed previously use the global range.
+    ttl_bounds: dict[str, dict[Network, tuple[int, int]]] = {}
+    if previous_uuid and adaptive_ttl:
+        logger.info("get-ttl-bounds")
+        with instrumentation.span("get-ttl-bounds") as span:
+            ttl_bounds = GetTTLBounds(filter_virtual=True).for_all_agents(
+                clickhouse,
+                previous_uuid,
+                previous_agents,
+                concurrent_requests=concurrent_requests,
+            )
+            span.count(prefixes=sum(len(x) for x in ttl_bounds.values()))
 
     # Instantiate the selector
-    selector = EpsilonSelector(universe, budgets, exploration_ratio, ranked_prefixes)
+    selector = EpsilonSelector(
+        universe, budgets, exploration_ratio, ranked_prefixes, seed=seed
+    )
 
-    # Select and upload the prefixes
-    targets = {}
-    for agent_uuid in agents:
-        logger.info("agent=%s select-prefixes", agent_uuid)
-        prefixes = selector.select(agent_uuid)
-        if not dry_run:
-            logger.info("agent=%s upload-prefixes", agent_uuid)
-            targets[agent_uuid] = upload_prefix_list(
-                iris, prefixes, protocol, min_ttl, max_ttl
+    # Select and upload the prefixes.
+    # The prefixes of the next agent are selected while the previous ones are uploaded.
+    def upload_prefixes(agent_uuid: str, prefixes: set[Network]) -> str:
+        with instrumentation.span("upload", agent=agent_uuid) as span:
+            span.count(prefixes=len(prefixes))
+            return upload_prefix_list(
+                iris,
+                prefixes,
+                protocol,
+                min_ttl,
+                max_ttl,
+                retries=upload_retries,
+                ttl_bounds=ttl_bounds.get(agent_uuid),
+                ttl_margin=ttl_margin,
             )
-            logger.info("agent=%s key=%s", agent_uuid, targets[agent_uuid])
+
+    uploads = {}
+    with ThreadPoolExecutor(upload_concurrency) as executor:
+        for agent_uuid in agents:
+            logger.info("agent=%s select-prefixes", agent_uuid)
+            with instrumentation.span("select", agent=agent_uuid) as span:
+                prefixes = selector.select(agent_uuid)
+                span.count(prefixes=len(prefixes))
+            if not dry_run:
+                logger.info("agent=%s upload-prefixes", agent_uuid)
+                uploads[agent_uuid] = executor.submit(
+                    upload_prefixes, agent_uuid, prefixes
+                )
+    targets = {}
+    for agent_uuid, upload in uploads.items():
+        targets[agent_uuid] = upload.result()
+        logger.info("agent=%s key=%s", agent_uuid, targets[agent_uuid])
 
     # Create the measurement
     if not dry_run:
@@ -224,5 +531,7 @@ def run_zeph(
                 for agent_uuid in agents
             ],
         }
-        measurement = create_measurement(iris, definition)
+        with instrumentation.span("create-measurement") as span:
+            measurement = create_measurement(iris, definition)
+            span.count(agents=len(definition["agents"]))
         logger.info("measurement_uuid=%s", measurement["uuid"])
@@ -1,12 +1,58 @@
+from collections import Counter, deque
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 
+import numpy as np
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries.query import LinksQuery, links_table
 from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import LoggingTimer, common_parameters
 from pych_client import ClickHouseClient
 
-from zeph.typing import Agent, Link, Network
-from zeph.utilities import measurement_id, parse_network
+from zeph.cache import LinkCache
+from zeph.instrumentation import Instrumentation
+from zeph.logging import logger
+from zeph.store import LinkStore, LinkStoreBuilder
+from zeph.typing import Agent, Network
+from zeph.utilities import (
+    address_keys,
+    concatenate,
+    covering_network,
+    iter_records,
+    key_network,
+    measurement_id,
+    split_network,
+)
+
+ROW_BINARY_DTYPE = np.dtype([("high", ">u8"), ("low", ">u8"), ("link", "<u8")])
+"""RowBinary encoding of (probe_dst_prefix IPv6, link UInt64): IPv6 addresses are big-endian."""
+
+REWARDS_DTYPE = np.dtype(
+    [("agent", "<u2"), ("high", ">u8"), ("low", ">u8"), ("reward", "<u8")]
+)
+"""RowBinary encoding of (agent UInt16, probe_dst_prefix IPv6, reward UInt64)."""
+
+TTL_BOUNDS_DTYPE = np.dtype(
+    [("high", ">u8"), ("low", ">u8"), ("min_ttl", "u1"), ("max_ttl", "u1")]
+)
+"""RowBinary encoding of (probe_dst_prefix IPv6, min_ttl UInt8, max_ttl UInt8)."""
+
+
+@dataclass(frozen=True)
+class GetPrefixRange(LinksQuery):
+    """Get the smallest and largest probed prefixes."""
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        SELECT
+            min(probe_dst_prefix) AS first,
+            max(probe_dst_prefix) AS last
+        FROM {links_table(measurement_id)}
+        WHERE {self.filters(subset)}
+        """
 
 
 @dataclass(frozen=True)
@@ -29,14 +75,340 @@ class GetUniqueLinksByPrefix(LinksQuery):
         GROUP BY probe_dst_prefix
         """
 
+    def subsets(
+        self, client: ClickHouseClient, measurement_id: str, n: int
+    ) -> Sequence[IPNetwork]:
+        """Split the probed prefixes of a measurement in `n` (or more) subsets."""
+        if n <= 1:
+            return [UNIVERSE_SUBSET]
+        query = GetPrefixRange(**common_parameters(self, LinksQuery))
+        (row,) = query.execute(client, measurement_id)
+        return split_network(covering_network(row["first"], row["last"]), n)
+
+    def binary_statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        """
+        One row per (prefix, link). ClickHouse may interleave the rows of different
+        prefixes (with several threads), so `fetch` groups them by prefix.
+        In the RowBinary format each row is 24 bytes long (see `ROW_BINARY_DTYPE`).
+        """
+        return f"""
+        SELECT probe_dst_prefix, link
+        FROM ({self.statement(measurement_id, subset)})
+        ARRAY JOIN links AS link
+        """
+
+    def fetch(
+        self, client: ClickHouseClient, measurement_id: str, subset: IPNetwork
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fetch the links of a measurement in the RowBinary format.
+        Returns the prefixes (as network keys), the number of links per prefix,
+        and the links hashes.
+        """
+        keys, links = [], []
+        with LoggingTimer(
+            logger,
+            f"query={self.name} measurement_id={measurement_id} subset={subset}",
+        ):
+            for records in iter_records(
+                client.iter_bytes(
+                    self.binary_statement(measurement_id, subset),
+                    settings={"default_format": "RowBinary"},
+                ),
+                ROW_BINARY_DTYPE,
+            ):
+                keys.append(address_keys(records["high"], records["low"]))
+                links.append(records["link"].astype(np.uint64))
+        keys_ = np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+        links_ = concatenate(links, np.uint64)
+        if np.any(keys_[1:] < keys_[:-1]):
+            # Make the rows of each prefix contiguous, keeping the order of the links.
+            order = np.argsort(keys_, kind="stable")
+            keys_, links_ = keys_[order], links_[order]
+        # Find the first row of each prefix.
+        starts = np.flatnonzero(np.diff(keys_, prepend=keys_[:1] + 1))
+        sizes = np.diff(np.append(starts, len(keys_)))
+        return keys_[starts], sizes, links_
+
+    def iter_all_agents(
+        self,
+        client: ClickHouseClient,
+        measurement_uuid: str,
+        agents_uuid: Iterable[Agent],
+        *,
+        subsets_per_agent: int = 1,
+        concurrent_requests: int = 1,
+        cache: LinkCache | None = None,
+        cache_version: str | None = None,
+        instrumentation: Instrumentation | None = None,
+    ) -> Iterator[tuple[Agent, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Fetch the links of all the agents, concurrently for each agent and for
+        each subset of the probed prefixes (if `subsets_per_agent` > 1).
+        Yields blocks of `(agent, keys, sizes, links)` (see `fetch`) in the order of
+        `agents_uuid` and of the subsets, so that the results do not depend on the
+        order of completion of the queries. At most `concurrent_requests` blocks
+        are fetched ahead of the consumer. Each block is the full result of an
+        (agent, subset) query, so the peak memory is one block per in-flight request
+        (plus the block being consumed); `subsets_per_agent` bounds the block size.
+        If `cache` and `cache_version` are specified, the links of each agent are
+        read from (or written to) the cache; see `zeph.cache.measurement_version`.
+        Each query is recorded as a `fetch` span of `instrumentation`.
+        """
+        instrumentation = instrumentation or Instrumentation()
+        measurement_ids = {
+            agent_uuid: measurement_id(measurement_uuid, agent_uuid)
+            for agent_uuid in agents_uuid
+        }
+        cache_keys = {}
+        cached = {}
+        if cache and cache_version:
+            for agent_uuid in measurement_ids:
+                cache_keys[agent_uuid] = cache.key(measurement_uuid, agent_uuid, self)
+                if arrays := cache.get(cache_keys[agent_uuid], cache_version):
+                    cached[agent_uuid] = arrays
+        missing = [
+            agent_uuid for agent_uuid in measurement_ids if agent_uuid not in cached
+        ]
+        with ThreadPoolExecutor(concurrent_requests) as executor:
+            subsets = dict(
+                zip(
+                    missing,
+                    executor.map(
+                        lambda agent_uuid: self.subsets(
+                            client, measurement_ids[agent_uuid], subsets_per_agent
+                        ),
+                        missing,
+                    ),
+                )
+            )
+            # A `None` subset stands for the cached links of an agent.
+            tasks = [
+                (agent_uuid, subset)
+                for agent_uuid in measurement_ids
+                for subset in subsets.get(agent_uuid, [None])
+            ]
+
+            def fetch(
+                task: tuple[Agent, IPNetwork | None]
+            ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+                agent_uuid, subset = task
+                if subset is None:
+                    return cached[agent_uuid]
+                with instrumentation.span(
+                    "fetch", agent=agent_uuid, subset=str(subset)
+                ) as span:
+                    arrays = self.fetch(client, measurement_ids[agent_uuid], subset)
+                    span.count(prefixes=len(arrays[0]), links=len(arrays[2]))
+                return arrays
+
+            # The blocks of the agents that are not cached are kept
+            # until the last block of the agent, to write the cache entry.
+            blocks: dict[Agent, list[tuple[np.ndarray, np.ndarray, np.ndarray]]] = {
+                agent_uuid: [] for agent_uuid in missing if agent_uuid in cache_keys
+            }
+            remaining = Counter(agent_uuid for agent_uuid, _ in tasks)
+
+            def result(
+                agent_uuid: Agent, future: Future
+            ) -> tuple[Agent, np.ndarray, np.ndarray, np.ndarray]:
+                arrays = future.result()
+                remaining[agent_uuid] -= 1
+                if cache and cache_version and agent_uuid in blocks:
+                    blocks[agent_uuid].append(arrays)
+                    if not remaining[agent_uuid]:
+                        cache.put(
+                            cache_keys[agent_uuid],
+                            cache_version,
+                            *concatenate_blocks(blocks.pop(agent_uuid)),
+                        )
+                return agent_uuid, *arrays
+
+            pending: deque[tuple[Agent, Future]] = deque()
+            for agent_uuid, subset in tasks:
+                pending.append(
+                    (agent_uuid, executor.submit(fetch, (agent_uuid, subset)))
+                )
+                if len(pending) > concurrent_requests:
+                    yield result(*pending.popleft())
+            while pending:
+                yield result(*pending.popleft())
+
     def for_all_agents(
-        self, client: ClickHouseClient, measurement_uuid: str, agents_uuid: list[str]
-    ) -> dict[tuple[Agent, Network], set[Link]]:
-        links: dict[tuple[Agent, Network], set[Link]] = {}
-        for agent_uuid in agents_uuid:
-            for row in self.execute_iter(
-                client, measurement_id(measurement_uuid, agent_uuid)
+        self,
+        client: ClickHouseClient,
+        measurement_uuid: str,
+        agents_uuid: Iterable[Agent],
+        *,
+        subsets_per_agent: int = 1,
+        concurrent_requests: int = 1,
+        cache: LinkCache | None = None,
+        cache_version: str | None = None,
+        instrumentation: Instrumentation | None = None,
+        memory_limit: int | None = None,
+    ) -> LinkStore:
+        """
+        Fetch the links of all the agents in a `LinkStore`; see `iter_all_agents`.
+        Beyond `memory_limit` bytes, the link hashes are spilled to disk (see `zeph.interning`).
+        """
+        builder = LinkStoreBuilder(memory_limit)
+        for agent_uuid, keys, sizes, links in self.iter_all_agents(
+            client,
+            measurement_uuid,
+            agents_uuid,
+            subsets_per_agent=subsets_per_agent,
+            concurrent_requests=concurrent_requests,
+            cache=cache,
+            cache_version=cache_version,
+            instrumentation=instrumentation,
+        ):
+            builder.add_many(agent_uuid, keys, sizes, links)
+        return builder.build()
+
+
+def concatenate_blocks(
+    blocks: list[tuple[np.ndarray, np.ndarray, np.ndarray]]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate blocks of `(keys, sizes, links)`, as returned by `GetUniqueLinksByPrefix.fetch`."""
+    keys, sizes, links = (
+        concatenate([block[i] for block in blocks], dtype)
+        for i, dtype in enumerate((np.uint64, np.int64, np.uint64))
+    )
+    return keys, sizes, links
+
+
+@dataclass(frozen=True)
+class GetUniqueLinksRewards(LinksQuery):
+    """
+    Compute, for each (agent, prefix), the number of links that have been seen
+    by this (agent, prefix) only, across all the agents of a measurement.
+    This is the reward of `zeph.rankers.UniqueLinksRanker`, computed by ClickHouse
+    so that only one integer per prefix is transferred.
+    Since the query spans the tables of several agents, `measurement_id` is the
+    measurement UUID and the agents are specified with `agents_uuid`.
+    """
+
+    agents_uuid: tuple[Agent, ...] = ()
+    "The agents of the measurement, in the order of the `agent` column."
+
+    def links_tables(self, measurement_uuid: str) -> list[str]:
+        return [
+            links_table(measurement_id(measurement_uuid, agent_uuid))
+            for agent_uuid in self.agents_uuid
+        ]
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        links = " UNION ALL ".join(
+            f"""
+            SELECT DISTINCT
+                toUInt16({i}) AS agent,
+                probe_dst_prefix,
+                cityHash64((near_addr, far_addr)) AS link
+            FROM {table}
+            WHERE {self.filters(subset)}
+            """
+            for i, table in enumerate(self.links_tables(measurement_id))
+        )
+        return f"""
+        SELECT link_agent, link_prefix, count() AS reward
+        FROM (
+            SELECT any(agent) AS link_agent, any(probe_dst_prefix) AS link_prefix
+            FROM ({links})
+            GROUP BY link
+            HAVING count() = 1
+        )
+        GROUP BY link_agent, link_prefix
+        ORDER BY link_agent, link_prefix
+        """
+
+    def for_all_agents(
+        self, client: ClickHouseClient, measurement_uuid: str
+    ) -> dict[Agent, dict[Network, int]]:
+        rewards: dict[Agent, dict[Network, int]] = {
+            agent_uuid: {} for agent_uuid in self.agents_uuid
+        }
+        if not self.agents_uuid:
+            return rewards
+        with LoggingTimer(
+            logger, f"query={self.name} measurement_uuid={measurement_uuid}"
+        ):
+            for records in iter_records(
+                client.iter_bytes(
+                    self.statement(measurement_uuid),
+                    settings={"default_format": "RowBinary"},
+                ),
+                REWARDS_DTYPE,
+            ):
+                keys = address_keys(records["high"], records["low"])
+                for agent, key, reward in zip(
+                    records["agent"].tolist(),
+                    keys.tolist(),
+                    records["reward"].tolist(),
+                ):
+                    rewards[self.agents_uuid[agent]][key_network(key)] = reward
+        return rewards
+
+
+@dataclass(frozen=True)
+class GetTTLBounds(LinksQuery):
+    """
+    Get, for each prefix, the smallest near TTL and the largest far TTL of its links,
+    i.e. the range of TTLs at which the probes towards the prefix discovered links.
+    """
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        SELECT
+            probe_dst_prefix,
+            min(near_ttl) AS min_ttl,
+            max(far_ttl) AS max_ttl
+        FROM {links_table(measurement_id)}
+        WHERE {self.filters(subset)}
+        GROUP BY probe_dst_prefix
+        """
+
+    def fetch(
+        self, client: ClickHouseClient, measurement_id: str
+    ) -> dict[Network, tuple[int, int]]:
+        bounds = {}
+        with LoggingTimer(logger, f"query={self.name} measurement_id={measurement_id}"):
+            for records in iter_records(
+                client.iter_bytes(
+                    self.statement(measurement_id),
+                    settings={"default_format": "RowBinary"},
+                ),
+                TTL_BOUNDS_DTYPE,
             ):
-                network = parse_network(row["probe_dst_prefix"])
-                links[(agent_uuid, network)] = set(row["links"])
-        return links
+                keys = address_keys(records["high"], records["low"])
+                for key, min_ttl, max_ttl in zip(
+                    keys.tolist(),
+                    records["min_ttl"].tolist(),
+                    records["max_ttl"].tolist(),
+                ):
+                    bounds[key_network(key)] = (min_ttl, max_ttl)
+        return bounds
+
+    def for_all_agents(
+        self,
+        client: ClickHouseClient,
+        measurement_uuid: str,
+        agents_uuid: Iterable[Agent],
+        *,
+        concurrent_requests: int = 1,
+    ) -> dict[Agent, dict[Network, tuple[int, int]]]:
+        """TTL bounds of the prefixes probed by each agent, fetched concurrently."""
+        agents_uuid = list(agents_uuid)
+        with ThreadPoolExecutor(concurrent_requests) as executor:
+            bounds = executor.map(
+                lambda agent_uuid: self.fetch(
+                    client, measurement_id(measurement_uuid, agent_uuid)
+                ),
+                agents_uuid,
+            )
+            return dict(zip(agents_uuid, bounds))
@@ -2,6 +2,7 @@ from zeph.rankers.abstract import AbstractRanker
 from zeph.rankers.dfg import DFGCoverRanker
 from zeph.rankers.greedy import GreedyCoverRanker
 from zeph.rankers.naive import NaiveRanker
+from zeph.rankers.sketch import SketchCoverRanker
 from zeph.rankers.unique import UniqueLinksRanker
 
 __all__ = (
@@ -9,5 +10,6 @@ __all__ = (
     "DFGCoverRanker",
     "GreedyCoverRanker",
     "NaiveRanker",
+    "SketchCoverRanker",
     "UniqueLinksRanker",
 )
@@ -1,11 +1,63 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
 
+import numpy as np
+
+from zeph.store import LinkStore, LinkStoreBuilder
 from zeph.typing import Agent, Link, Network
 
 
 class AbstractRanker(ABC):
     @abstractmethod
     def __call__(
-        self, links: dict[tuple[Agent, Network], set[Link]]
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
     ) -> dict[Agent, list[Network]]:
+        """
+        Rank the prefixes of each agent.
+        Rankers operating on sets can use `zeph.store.as_dict` to convert a `LinkStore`,
+        and rankers operating on arrays can use `LinkStore.wrap` to convert a dict.
+
+        If `budgets` is specified, at most `budgets[agent]` prefixes are ranked for each
+        agent (none for the agents that are not in `budgets`), and the ranking stops
+        once every quota is filled. The cover rankers do not consider the prefixes
+        of an agent whose quota is filled, so the links that only these prefixes
+        would cover can be covered by the prefixes of the other agents.
+        """
         ...
+
+    def rank_blocks(
+        self,
+        blocks: Iterable[tuple[Agent, np.ndarray, np.ndarray, np.ndarray]],
+        budgets: dict[Agent, int] | None = None,
+        memory_limit: int | None = None,
+    ) -> dict[Agent, list[Network]]:
+        """
+        Rank the prefixes from blocks of `(agent, keys, sizes, links)`, consumed as they
+        are yielded by `zeph.queries.GetUniqueLinksByPrefix.iter_all_agents`.
+        By default the blocks are collected in a `LinkStore` which is then ranked;
+        the rankers that can rank in one pass override this method to avoid
+        keeping all the links in memory. The result is the same in both cases.
+        `memory_limit` is the size of the link hashes held in memory by the `LinkStoreBuilder`.
+        """
+        builder = LinkStoreBuilder(memory_limit)
+        for agent, keys, sizes, links in blocks:
+            builder.add_many(agent, keys, sizes, links)
+        return self(builder.build(), budgets)
+
+    @staticmethod
+    def quotas(store: LinkStore, budgets: dict[Agent, int] | None) -> np.ndarray:
+        """
+        Number of prefixes that can be ranked for each agent of `store` (`int64`).
+        >>> store = LinkStore.from_dict({("a", "p1"): {1}, ("b", "p1"): {2}})
+        >>> AbstractRanker.quotas(store, {"a": 10}).tolist()
+        [10, 0]
+        >>> AbstractRanker.quotas(store, None).tolist()
+        [2, 2]
+        """
+        if budgets is None:
+            return np.full(len(store.agents), len(store), dtype=np.int64)
+        return np.array(
+            [budgets.get(agent, 0) for agent in store.agents], dtype=np.int64
+        )
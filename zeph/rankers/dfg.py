@@ -1,8 +1,21 @@
 from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from math import floor, log
+from pathlib import Path
+from typing import Any
+
+import numpy as np
 
 from zeph.rankers import AbstractRanker
+from zeph.store import LinkStore
 from zeph.typing import Agent, Link, Network
+from zeph.utilities import shared_directory
+
+# Step of the links that are not covered, see `DFGCoverRanker.process_sharded`.
+UNCOVERED = np.iinfo(np.uint32).max
+
+# Links and covering steps of the worker process.
+worker: dict[str, Any] = {}
 
 
 class DFGCoverRanker(AbstractRanker):
@@ -11,42 +24,293 @@ class DFGCoverRanker(AbstractRanker):
     Cormode, Graham, Howard Karloff, and Anthony Wirth.
     "Set cover algorithms for very large datasets."
     Proceedings of the 19th ACM international conference on Information and knowledge management. 2010.
+
+    The links are stored as dense ids and the covered links as a boolean mask.
+    The sub-collections are processed in windows of rows whose marginal gains
+    are computed at once; the window grows while no row is selected and shrinks
+    after a selection, since a selection invalidates the gains of the next rows.
+    The rows are visited in the same order as the set-based algorithm,
+    so the ranking is identical.
+    With budgets, the rows of the agents whose quota is filled are skipped,
+    and the ranking stops once every quota is filled.
+
+    With `processes > 1`, the marginal gains of the large sub-collections are computed
+    by worker processes, each on a shard of the rows, over memory-mapped copies of the
+    links and of the step at which each link was covered (see `process_sharded`).
+    The gains are exact, so the ranking is identical to the single-process one.
     """
 
-    def __init__(self, p: float = 1.05):
+    min_window = 16
+    min_sharded_rows = 2**16
+
+    def __init__(self, p: float = 1.05, processes: int = 1):
         self.p = p
+        self.processes = processes
+        self.k_cache: dict[int, int] = {}
 
     def __call__(
-        self, links: dict[tuple[Agent, Network], set[Link]]
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
     ) -> dict[Agent, list[Network]]:
-        if not links:
+        store = LinkStore.wrap(links)
+        quotas = self.quotas(store, budgets)
+        rows = np.flatnonzero(quotas[store.row_agents] > 0)
+        if not len(rows):
             return {}
+        if self.processes > 1 and len(rows) >= self.min_sharded_rows:
+            return self.rank_sharded(store, rows, quotas)
+        return self.rank(store, rows, quotas)
 
-        covered: set[Link] = set()
-        prefixes = defaultdict(list)
-        subcollections = defaultdict(list)
+    def rank(
+        self,
+        store: LinkStore,
+        rows: np.ndarray,
+        quotas: np.ndarray,
+        steps: np.ndarray | None = None,
+        executor: Executor | None = None,
+    ) -> dict[Agent, list[Network]]:
+        """
+        Rank `rows`. If `steps` is specified, the passes over the sub-collections
+        are done by `process_sharded`, with the workers of `executor`.
+        """
+        covered = np.zeros(store.n_links, dtype=np.bool_)
+        prefixes: dict[Agent, list[Network]] = defaultdict(list)
+        subcollections: dict[int, list[np.ndarray]] = defaultdict(list)
 
         # Populate the sub-collections
-        for (agent, prefix), links_ in links.items():
-            k = floor(log(len(links_) or 1, self.p))
-            subcollections[k].append((agent, prefix))
+        self.rebucket(subcollections, rows, store.sizes()[rows])
         k_max = max(subcollections.keys())
 
         # k = k_max ... 1
         for k in range(k_max, 0, -1):
-            for (agent, prefix) in subcollections[k]:
-                if len(links[(agent, prefix)] - covered) >= self.p**k:
-                    prefixes[agent].append(prefix)
-                    covered.update(links[(agent, prefix)])
+            # A row can be re-bucketed into the current sub-collection
+            # (e.g. due to rounding errors), in which case it is processed again.
+            while subcollections.get(k) and quotas.any():
+                rows = np.concatenate(subcollections.pop(k))
+                if steps is None:
+                    self.process(
+                        store,
+                        rows,
+                        self.p**k,
+                        covered,
+                        quotas,
+                        prefixes,
+                        subcollections,
+                    )
                 else:
-                    links[(agent, prefix)] -= covered
-                    k_prime = floor(log(len(links[(agent, prefix)]) or 1, self.p))
-                    subcollections[k_prime].append((agent, prefix))
+                    self.process_sharded(
+                        store,
+                        rows,
+                        self.p**k,
+                        covered,
+                        quotas,
+                        prefixes,
+                        subcollections,
+                        steps,
+                        executor,
+                    )
 
         # k = 0
-        for (agent, prefix) in subcollections[0]:
-            if len(links[(agent, prefix)] - covered) == 1:
-                prefixes[agent].append(prefix)
-                covered.update(links[(agent, prefix)])
+        if subcollections.get(0) and quotas.any():
+            rows = np.concatenate(subcollections.pop(0))
+            self.process(store, rows, 1, covered, quotas, prefixes, None, exact=True)
 
         return prefixes
+
+    def rank_sharded(
+        self, store: LinkStore, rows: np.ndarray, quotas: np.ndarray
+    ) -> dict[Agent, list[Network]]:
+        """Rank `rows` with `self.processes` workers."""
+        with shared_directory() as directory:
+            np.save(Path(directory) / "indptr.npy", store.indptr)
+            np.save(Path(directory) / "links.npy", store.links)
+            steps = np.lib.format.open_memmap(
+                Path(directory) / "steps.npy",
+                mode="w+",
+                dtype=np.uint32,
+                shape=(store.n_links,),
+            )
+            steps[:] = UNCOVERED
+            with ProcessPoolExecutor(
+                self.processes, initializer=initialize, initargs=(Path(directory),)
+            ) as executor:
+                return self.rank(store, rows, quotas, steps, executor)
+
+    def gains(
+        self,
+        store: LinkStore,
+        steps: np.ndarray,
+        rows: np.ndarray,
+        after: np.ndarray,
+        executor: Executor | None,
+    ) -> np.ndarray:
+        """
+        Marginal gain of each row in `rows` after the first `after` selections,
+        computed in shards by the workers of `executor` for the large sub-collections.
+        """
+        if executor is None or len(rows) < self.min_sharded_rows:
+            return uncovered_after(store, steps, rows, after)
+        shards = np.array_split(np.arange(len(rows)), self.processes)
+        futures = [
+            executor.submit(shard_gains, rows[shard], after[shard]) for shard in shards
+        ]
+        # The shards are merged in the order of the rows, whatever their completion order.
+        return np.concatenate([future.result() for future in futures])
+
+    def k(self, n: int) -> int:
+        """Index of the sub-collection of a set of `n` uncovered links."""
+        if n not in self.k_cache:
+            self.k_cache[n] = floor(log(n or 1, self.p))
+        return self.k_cache[n]
+
+    def rebucket(
+        self,
+        subcollections: dict[int, list[np.ndarray]],
+        rows: np.ndarray,
+        gains: np.ndarray,
+    ) -> None:
+        """Append `rows` to the sub-collections of their `gains`, preserving their order."""
+        values, inverse = np.unique(gains, return_inverse=True)
+        ks = np.array([self.k(int(n)) for n in values], dtype=np.int64)[inverse]
+        for k in np.unique(ks).tolist():
+            subcollections[k].append(rows[ks == k])
+
+    def process(
+        self,
+        store: LinkStore,
+        rows: np.ndarray,
+        threshold: float,
+        covered: np.ndarray,
+        quotas: np.ndarray,
+        prefixes: dict[Agent, list[Network]],
+        subcollections: dict[int, list[np.ndarray]] | None,
+        exact: bool = False,
+    ) -> list[int]:
+        """
+        Select, in order, the rows whose marginal gain is at least `threshold`
+        (or equal to `threshold` if `exact` is true), and return them.
+        The others are moved to the sub-collection of their marginal gain,
+        if `subcollections` is specified.
+        The rows of the agents without quota are dropped.
+        """
+        selected: list[int] = []
+        rejected, rejected_gains = [], []
+        start, window = 0, self.min_window
+        while start < len(rows):
+            end = start + window
+            candidates = rows[start:end]
+            gains = store.uncovered(candidates, covered)
+            # The rows of the agents whose quota is filled are neither selected nor rejected.
+            active = quotas[store.row_agents[candidates]] > 0
+            selectable = gains == threshold if exact else gains >= threshold
+            above = np.flatnonzero(selectable & active)
+            # The gains before the first selected row are exact,
+            # those after it must be recomputed.
+            stop = int(above[0]) if len(above) else len(candidates)
+            rejected.append(candidates[:stop][active[:stop]])
+            rejected_gains.append(gains[:stop][active[:stop]])
+            if stop < len(candidates):
+                i = int(candidates[stop])
+                agent, prefix = store.key(i)
+                prefixes[agent].append(prefix)
+                covered[store.row(i)] = True
+                quotas[store.row_agents[i]] -= 1
+                selected.append(i)
+                if not quotas.any():
+                    return selected
+                window = max(window // 2, self.min_window)
+                start += stop + 1
+            else:
+                window *= 2
+                start += stop
+        # The rejected rows are re-bucketed at once; this is equivalent to
+        # re-bucketing them one by one since they are only visited after `rows`.
+        if subcollections is not None and rejected:
+            self.rebucket(
+                subcollections, np.concatenate(rejected), np.concatenate(rejected_gains)
+            )
+        return selected
+
+    def process_sharded(
+        self,
+        store: LinkStore,
+        rows: np.ndarray,
+        threshold: float,
+        covered: np.ndarray,
+        quotas: np.ndarray,
+        prefixes: dict[Agent, list[Network]],
+        subcollections: dict[int, list[np.ndarray]],
+        steps: np.ndarray,
+        executor: Executor | None,
+    ) -> None:
+        """
+        Same as `process`, with the gains of `rows` computed in parallel.
+        `steps` holds, for each link, the index of the selection that covered it
+        (or `UNCOVERED`), so that the gain of a row at any point of the pass
+        can be computed after the selections.
+
+        The gains only decrease, so the rows whose gain at the start of the pass
+        is below `threshold` cannot be selected: `process` only visits the others.
+        The rejected rows are then re-bucketed with their gain at the time
+        `process` would have visited them, i.e. after the selections that precede them.
+        """
+        start = sum(len(x) for x in prefixes.values())
+        gains = self.gains(
+            store, steps, rows, np.full(len(rows), start, np.uint32), executor
+        )
+        candidates = rows[gains >= threshold]
+        selected = self.process(
+            store, candidates, threshold, covered, quotas, prefixes, None
+        )
+        for step, i in enumerate(selected, start):
+            links = store.row(i)
+            links = links[steps[links] == UNCOVERED]
+            steps[links] = step
+        if not quotas.any():
+            return
+        # Position of the selected rows in `rows`.
+        is_selected = np.isin(rows, np.array(selected, dtype=rows.dtype))
+        positions = np.flatnonzero(is_selected)
+        # The rows of the agents whose quota is filled will not be selected anymore.
+        rejected = np.flatnonzero(~is_selected & (quotas[store.row_agents[rows]] > 0))
+        after = start + np.searchsorted(positions, rejected)
+        gains = self.gains(
+            store, steps, rows[rejected], after.astype(np.uint32), executor
+        )
+        self.rebucket(subcollections, rows[rejected], gains)
+
+
+def uncovered_after(
+    store: LinkStore, steps: np.ndarray, rows: np.ndarray, after: np.ndarray
+) -> np.ndarray:
+    """
+    Number of links of each row in `rows` that are not covered by the first `after` selections.
+
+    >>> store = LinkStore.from_dict({("a", "p1"): {1, 2}, ("a", "p2"): {2, 3}})
+    >>> steps = np.array([0, 1, UNCOVERED], dtype=np.uint32)
+    >>> uncovered_after(store, steps, np.array([0, 1, 1]), np.array([0, 0, 2])).tolist()
+    [2, 2, 1]
+    """
+    lengths = store.indptr[rows + 1] - store.indptr[rows]
+    return store.count(rows, steps[store.links_of(rows)] >= np.repeat(after, lengths))
+
+
+def initialize(directory: Path) -> None:
+    """Map the links and the covering steps saved by `DFGCoverRanker.rank_sharded`."""
+    # Only the links are needed to compute the gains.
+    empty = np.empty(0, dtype=np.uint32)
+    store = LinkStore(
+        agents=[],
+        prefixes=[],
+        row_agents=empty,
+        row_prefixes=empty,
+        indptr=np.load(directory / "indptr.npy", mmap_mode="r"),
+        links=np.load(directory / "links.npy", mmap_mode="r"),
+        link_values=empty,
+    )
+    worker.update(store=store, steps=np.load(directory / "steps.npy", mmap_mode="r"))
+
+
+def shard_gains(rows: np.ndarray, after: np.ndarray) -> np.ndarray:
+    return uncovered_after(worker["store"], worker["steps"], rows, after)
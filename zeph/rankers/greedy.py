@@ -1,12 +1,44 @@
 from collections import defaultdict
+from collections.abc import Callable
+from heapq import heapify, heappop, heappush
+
+import numpy as np
 
 from zeph.rankers import AbstractRanker
+from zeph.store import LinkStore, as_dict
 from zeph.typing import Agent, Link, Network
 
 
 class GreedyCoverRanker(AbstractRanker):
+    """
+    Greedy set cover: repeatedly pick the (agent, prefix) that covers the most
+    links not yet covered. Ties are broken by the order of the `links` dict.
+
+    With `lazy=True` (the default), the marginal gains are kept in a max-heap as
+    upper bounds and only re-evaluated when they reach the top of the heap.
+    Since the gains can only decrease as more links are covered, the ranking is
+    identical to the eager implementation, which re-evaluates every gain on each
+    iteration (quadratic in the number of prefixes).
+    With budgets, the prefixes of the agents whose quota is filled are dropped
+    from the heap as they reach its top.
+    """
+
+    def __init__(self, lazy: bool = True):
+        self.lazy = lazy
+
     def __call__(
-        self, links: dict[tuple[Agent, Network], set[Link]]
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
+    ) -> dict[Agent, list[Network]]:
+        if self.lazy:
+            return self.lazy_greedy(LinkStore.wrap(links), budgets)
+        return self.eager_greedy(as_dict(links), budgets)
+
+    @staticmethod
+    def eager_greedy(
+        links: dict[tuple[Agent, Network], set[Link]],
+        budgets: dict[Agent, int] | None = None,
     ) -> dict[Agent, list[Network]]:
         all_links: set[Link] = set()
         covered: set[Link] = set()
@@ -15,10 +47,111 @@ class GreedyCoverRanker(AbstractRanker):
         for links_ in links.values():
             all_links.update(links_)
 
-        while covered != all_links and links:
-            agent, prefix = max(links, key=lambda k: len(links[k] - covered))
+        # The candidates are removed from a copy, `links` is left untouched.
+        candidates = {
+            k: v
+            for k, v in links.items()
+            if budgets is None or budgets.get(k[0], 0) > 0
+        }
+
+        while covered != all_links and candidates:
+            agent, prefix = max(candidates, key=lambda k: len(candidates[k] - covered))
+            if not candidates[(agent, prefix)] - covered:
+                # The links left are only seen by the agents without quota.
+                break
             prefixes[agent].append(prefix)
-            covered.update(links[(agent, prefix)])
-            links.pop((agent, prefix))
+            covered.update(candidates.pop((agent, prefix)))
+            if budgets is not None and len(prefixes[agent]) >= budgets[agent]:
+                candidates = {k: v for k, v in candidates.items() if k[0] != agent}
 
         return prefixes
+
+    @classmethod
+    def lazy_greedy(
+        cls, store: LinkStore, budgets: dict[Agent, int] | None = None
+    ) -> dict[Agent, list[Network]]:
+        covered = np.zeros(store.n_links, dtype=np.bool_)
+        n_left = store.n_links
+
+        def gain(i: int) -> int:
+            row = store.row(i)
+            return len(row) - int(np.count_nonzero(covered[row]))
+
+        def select(i: int, gain: float) -> bool:
+            nonlocal n_left
+            covered[store.row(i)] = True
+            n_left -= int(gain)
+            return n_left > 0
+
+        ranked_rows = lazy_cover(
+            store.sizes(),
+            store.row_agents,
+            cls.quotas(store, budgets).tolist(),
+            gain,
+            select,
+        )
+        return {
+            store.agents[agent_id]: [store.key(i)[1] for i in rows]
+            for agent_id, rows in ranked_rows.items()
+        }
+
+
+def lazy_cover(
+    bounds: np.ndarray,
+    row_agents: np.ndarray,
+    quotas: list[int],
+    gain: Callable[[int], float],
+    select: Callable[[int, float], bool],
+) -> dict[int, list[int]]:
+    """
+    Lazy greedy cover: rows selected for each agent id, in order, with at most
+    `quotas[agent_id]` rows each. `bounds` are the initial upper bounds of the gains,
+    `gain(row)` is the current gain of a row, and `select(row, gain)` marks its links
+    as covered, and returns False if there is nothing left to cover.
+    Ties are broken by row order.
+    >>> sets = [{1, 2, 3}, {3, 4}, {4}]
+    >>> covered = set()
+    >>> def select(i, gain):
+    ...     covered.update(sets[i])
+    ...     return True
+    >>> ranked = lazy_cover(
+    ...     np.array([3, 2, 1]), np.array([0, 0, 1]), [2, 1],
+    ...     lambda i: len(sets[i] - covered), select,
+    ... )
+    >>> dict(ranked)
+    {0: [0, 1]}
+    """
+    # Python lists are faster than arrays for scalar accesses.
+    row_agents_ = row_agents.tolist()
+    quotas = list(quotas)
+    n_filled = sum(quota <= 0 for quota in quotas)
+    ranked_rows: dict[int, list[int]] = defaultdict(list)
+
+    # (-gain, row): the heap order matches the tie-breaking of `max`
+    # in the eager implementation of `GreedyCoverRanker` (first maximum in row order).
+    rows = np.flatnonzero(
+        (np.array(quotas, dtype=np.int64)[row_agents] > 0) & (bounds > 0)
+    )
+    heap = list(zip((-bounds[rows]).tolist(), rows.tolist()))
+    heapify(heap)
+
+    while heap and n_filled < len(quotas):
+        _, i = heappop(heap)
+        agent_id = row_agents_[i]
+        if quotas[agent_id] <= 0:
+            continue
+        gain_ = gain(i)
+        if heap and (-gain_, i) > heap[0]:
+            # Stale upper bound, re-insert with the new gain.
+            heappush(heap, (-gain_, i))
+            continue
+        if not gain_:
+            # The links left are only seen by the agents without quota.
+            break
+        ranked_rows[agent_id].append(i)
+        quotas[agent_id] -= 1
+        n_filled += not quotas[agent_id]
+        if not select(i, gain_):
+            break
+
+    return ranked_rows
@@ -1,34 +1,45 @@
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
+
+import numpy as np
 
 from zeph.rankers import AbstractRanker
+from zeph.store import LinkStore
 from zeph.typing import Agent, Link, Network
 
 
 class NaiveRanker(AbstractRanker):
     def __call__(
-        self, links: dict[tuple[Agent, Network], set[Link]]
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
     ) -> dict[Agent, list[Network]]:
-        all_links: set[Link] = set()
-        covered: set[Link] = set()
+        store = LinkStore.wrap(links)
+        covered = np.zeros(store.n_links, dtype=np.bool_)
+        n_covered = 0
+        quotas = self.quotas(store, budgets)
+        n_filled = int(np.count_nonzero(quotas <= 0))
         prefixes: dict[Agent, list[Network]] = defaultdict(list)
 
-        for links_ in links.values():
-            all_links.update(links_)
-
         # Sort the subsets by size in descending order
-        subsets = OrderedDict(
-            sorted(
-                [(k, v) for k, v in links.items()],
-                key=lambda x: len(x[1]),
-                reverse=True,
-            )
-        )
+        # (a stable sort on the negated sizes keeps the original order for ties)
+        # and skip the subsets of the agents without quota.
+        order = np.argsort(-store.sizes(), kind="stable")
+        order = order[quotas[store.row_agents[order]] > 0]
 
-        for agent, prefix in subsets:
-            if covered == all_links:
+        for i in order.tolist():
+            if n_covered == store.n_links or n_filled == len(quotas):
                 break
-            if subsets[(agent, prefix)] - covered:
+            agent_id = store.row_agents[i]
+            if not quotas[agent_id]:
+                continue
+            row = store.row(i)
+            gain = len(row) - int(np.count_nonzero(covered[row]))
+            if gain:
+                agent, prefix = store.key(i)
                 prefixes[agent].append(prefix)
-                covered.update(subsets[(agent, prefix)])
+                covered[row] = True
+                n_covered += gain
+                quotas[agent_id] -= 1
+                n_filled += not quotas[agent_id]
 
         return prefixes
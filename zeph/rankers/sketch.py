@@ -0,0 +1,164 @@
+from collections.abc import Iterable
+
+import numpy as np
+
+from zeph.history import EMPTY, RewardHistory, bottom_k
+from zeph.rankers import AbstractRanker
+from zeph.rankers.greedy import lazy_cover
+from zeph.store import LinkStore
+from zeph.typing import Agent, Link, Network
+from zeph.utilities import concatenate, key_network
+
+
+class SketchCoverRanker(AbstractRanker):
+    """
+    Approximate greedy set cover on MinHash (bottom-k) sketches of the links of each
+    (agent, prefix): the `sketch_size` smallest hashes of its links, with the same hash
+    for all the prefixes, so that a link shared by two prefixes tends to be sampled in both.
+    The marginal gain of a prefix is estimated as its number of links multiplied by
+    the fraction of its sketch not yet covered by the sketches of the prefixes selected.
+    As in `GreedyCoverRanker`, the gains are re-evaluated lazily.
+
+    Each (agent, prefix) uses `8 * sketch_size + 8` bytes, whatever its number of links,
+    and `rank_blocks` builds the sketches as the links are fetched, without keeping them.
+    The ranking is approximate: see `benchmarks.coverage` for the coverage loss
+    compared to the exact greedy algorithm.
+    """
+
+    def __init__(self, sketch_size: int = 64):
+        self.sketch_size = sketch_size
+
+    def __call__(
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
+    ) -> dict[Agent, list[Network]]:
+        store = LinkStore.wrap(links)
+        # The hashed values are the link hashes, as in `rank_blocks`, or the link ids.
+        if store.link_values.dtype == np.uint64:
+            hashes = mix(store.link_values)
+        else:
+            hashes = mix(np.arange(store.n_links, dtype=np.uint64))
+        sizes = store.sizes()
+        rows = np.repeat(np.arange(len(store)), sizes)
+        sketches = bottom_k(rows, hashes[store.links], len(store), self.sketch_size)
+        ranked_rows = self.rank_sketches(
+            sketches, sizes, store.row_agents, self.quotas(store, budgets).tolist()
+        )
+        return {
+            store.agents[agent_id]: [store.key(i)[1] for i in rows_]
+            for agent_id, rows_ in ranked_rows.items()
+        }
+
+    def rank_blocks(
+        self,
+        blocks: Iterable[tuple[Agent, np.ndarray, np.ndarray, np.ndarray]],
+        budgets: dict[Agent, int] | None = None,
+        memory_limit: int | None = None,
+    ) -> dict[Agent, list[Network]]:
+        """Rank the prefixes from the sketches of each block, built as the blocks are fetched."""
+        agents: dict[Agent, int] = {}
+        row_agents, row_keys, row_sizes, sketches = [], [], [], []
+        for agent, keys, sizes, links in blocks:
+            rows = np.repeat(np.arange(len(keys)), sizes)
+            sketches.append(bottom_k(rows, mix(links), len(keys), self.sketch_size))
+            agent_id = agents.setdefault(agent, len(agents))
+            row_agents.append(np.full(len(keys), agent_id, dtype=np.uint32))
+            row_keys.append(keys)
+            row_sizes.append(sizes)
+        if budgets is None:
+            quotas = [sum(len(x) for x in row_keys)] * len(agents)
+        else:
+            quotas = [budgets.get(agent, 0) for agent in agents]
+        keys_ = concatenate(row_keys, np.uint64)
+        ranked_rows = self.rank_sketches(
+            (
+                np.concatenate(sketches)
+                if sketches
+                else np.empty((0, self.sketch_size), np.uint64)
+            ),
+            concatenate(row_sizes, np.int64),
+            concatenate(row_agents, np.uint32),
+            quotas,
+        )
+        agents_ = list(agents)
+        return {
+            agents_[agent_id]: [key_network(int(keys_[i])) for i in rows_]
+            for agent_id, rows_ in ranked_rows.items()
+        }
+
+    @classmethod
+    def rank_history(
+        cls, history: RewardHistory, budgets: dict[Agent, int] | None = None
+    ) -> dict[Agent, list[Network]]:
+        """
+        Rank the prefixes of a reward history: the sketches are those of the history,
+        and the number of links of each prefix is its decayed reward.
+        """
+        if budgets is None:
+            quotas = [len(history)] * len(history.agents)
+        else:
+            quotas = [budgets.get(agent, 0) for agent in history.agents]
+        ranked_rows = cls.rank_sketches(
+            history.sketches, history.row_rewards, history.row_agents, quotas
+        )
+        return {
+            history.agents[agent_id]: [
+                key_network(int(history.row_keys[i])) for i in rows_
+            ]
+            for agent_id, rows_ in ranked_rows.items()
+        }
+
+    @staticmethod
+    def rank_sketches(
+        sketches: np.ndarray,
+        sizes: np.ndarray,
+        row_agents: np.ndarray,
+        quotas: list[int],
+    ) -> dict[int, list[int]]:
+        """
+        Rows selected for each agent id, in order, with at most `quotas[agent_id]` rows each.
+        `sizes` is the (possibly fractional) number of links of each row.
+        >>> sketches = np.array([[1, 2], [2, 3], [4, EMPTY]], dtype=np.uint64)
+        >>> dict(SketchCoverRanker.rank_sketches(sketches, np.array([4, 3, 1]), np.array([0, 0, 1]), [2, 1]))
+        {0: [0, 1], 1: [2]}
+        """
+        # Dense ids of the sampled hashes, and the sketch of each row as a CSR matrix.
+        sampled = sketches != EMPTY
+        _, ids = np.unique(sketches[sampled], return_inverse=True)
+        indptr = np.zeros(len(sketches) + 1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(sampled, axis=1), out=indptr[1:])
+        covered = np.zeros(len(ids), dtype=np.bool_)
+        sizes_ = sizes.tolist()
+        indptr_ = indptr.tolist()
+
+        def sketch(i: int) -> np.ndarray:
+            start, end = indptr_[i], indptr_[i + 1]
+            return ids[start:end]
+
+        def gain(i: int) -> float:
+            row = sketch(i)
+            uncovered = len(row) - int(np.count_nonzero(covered[row]))
+            return float(sizes_[i] * uncovered / len(row))
+
+        def select(i: int, gain: float) -> bool:
+            covered[sketch(i)] = True
+            return True
+
+        return lazy_cover(sizes, row_agents, quotas, gain, select)
+
+
+def mix(values: np.ndarray) -> np.ndarray:
+    """
+    SplitMix64 finalizer, so that the sketches sample the links uniformly
+    whatever the distribution of their hashes (or ids).
+    >>> mix(np.array([0, 1], dtype=np.uint64)).tolist()
+    [0, 6238072747940578789]
+    """
+    x = values.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
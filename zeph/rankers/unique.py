@@ -1,33 +1,131 @@
-from collections import Counter, defaultdict
+from collections.abc import Iterable
+from heapq import nlargest
+
+import numpy as np
 
 from zeph.rankers import AbstractRanker
+from zeph.store import LinkStore
 from zeph.typing import Agent, Link, Network
+from zeph.utilities import concatenate, key_network
 
 
 class UniqueLinksRanker(AbstractRanker):
     def __call__(
-        self, links: dict[tuple[Agent, Network], set[Link]]
+        self,
+        links: dict[tuple[Agent, Network], set[Link]] | LinkStore,
+        budgets: dict[Agent, int] | None = None,
     ) -> dict[Agent, list[Network]]:
         """
         links: (agent, prefix) -> links
         """
+        store = LinkStore.wrap(links)
+
         # Count how many times each link has been seen
-        counts: Counter[Link] = Counter()
-        for links_ in links.values():
-            counts.update(links_)
+        counts = np.bincount(store.links, minlength=store.n_links)
 
         # Compute the reward as the number of globally unique (across all agents) links a prefix has seen.
-        rewards: dict[Agent, dict[Network, int]] = defaultdict(lambda: defaultdict(int))
-        for (agent, prefix), links_ in links.items():
-            for link in links_:
-                if counts[link] == 1:
-                    rewards[agent][prefix] += 1
+        # Only the positions of the unique links are kept, and mapped to their row.
+        positions = np.flatnonzero(counts[store.links] == 1)
+        rows = np.searchsorted(store.indptr, positions, side="right") - 1
+        rewards = np.bincount(rows, minlength=len(store))
+
+        ranked_rows = self.rank_rows(store.row_agents, rewards, store.agents, budgets)
+        return {
+            agent: [store.prefixes[i] for i in store.row_prefixes[rows_].tolist()]
+            for agent, rows_ in ranked_rows.items()
+        }
+
+    def rank_blocks(
+        self,
+        blocks: Iterable[tuple[Agent, np.ndarray, np.ndarray, np.ndarray]],
+        budgets: dict[Agent, int] | None = None,
+        memory_limit: int | None = None,
+    ) -> dict[Agent, list[Network]]:
+        """
+        Rank the prefixes in one pass over the blocks.
+        Since a link that counts in a reward is seen by a single (agent, prefix),
+        only the distinct links of each block are kept, with the number of
+        (agent, prefix) that have seen them and the first of these,
+        instead of the links of each (agent, prefix).
+        """
+        agents: dict[Agent, int] = {}
+        row_agents, row_keys, values, counts, owners = [], [], [], [], []
+        n_rows = 0
+        for agent, keys, sizes, links in blocks:
+            rows = np.repeat(np.arange(n_rows, n_rows + len(keys)), sizes)
+            distinct, first, count = np.unique(
+                links, return_index=True, return_counts=True
+            )
+            values.append(distinct)
+            counts.append(count)
+            owners.append(rows[first])
+            agent_id = agents.setdefault(agent, len(agents))
+            row_agents.append(np.full(len(keys), agent_id, dtype=np.int64))
+            row_keys.append(keys)
+            n_rows += len(keys)
+
+        _, inverse = np.unique(concatenate(values, np.uint64), return_inverse=True)
+        totals = np.bincount(inverse, weights=concatenate(counts, np.int64))
+        unique = totals[inverse] == 1
+        rewards = np.bincount(
+            concatenate(owners, np.int64)[unique], minlength=n_rows
+        ).astype(np.int64)
 
-        # Sort the prefixes by reward
+        keys_ = concatenate(row_keys, np.uint64)
+        ranked_rows = self.rank_rows(
+            concatenate(row_agents, np.int64), rewards, list(agents), budgets
+        )
+        return {
+            agent: [key_network(key) for key in keys_[rows_].tolist()]
+            for agent, rows_ in ranked_rows.items()
+        }
+
+    @staticmethod
+    def rank_rows(
+        row_agents: np.ndarray,
+        rewards: np.ndarray,
+        agents: list[Agent],
+        budgets: dict[Agent, int] | None = None,
+    ) -> dict[Agent, np.ndarray]:
+        """
+        Sort the rows of each agent by decreasing reward, and then in their original
+        order, as `rank_rewards`. The rows without reward are not ranked, and
+        the agents are in the order of their first row with a reward.
+        >>> rows = UniqueLinksRanker.rank_rows(np.array([1, 0, 0, 1]), np.array([1, 0, 2, 3]), ["a", "b"])
+        >>> {agent: rows_.tolist() for agent, rows_ in rows.items()}
+        {'b': [3, 0], 'a': [2]}
+        """
+        rows = np.flatnonzero(rewards)
+        agent_ids, first = np.unique(row_agents[rows], return_index=True)
+        rows = rows[np.lexsort((rows, -rewards[rows], row_agents[rows]))]
+        bounds = np.searchsorted(row_agents[rows], np.arange(len(agents) + 1))
+        ranked_rows: dict[Agent, np.ndarray] = {}
+        for agent_id in agent_ids[np.argsort(first)].tolist():
+            start, end = bounds[agent_id], bounds[agent_id + 1]
+            if budgets is not None:
+                end = min(end, start + budgets.get(agents[agent_id], 0))
+            ranked_rows[agents[agent_id]] = rows[start:end]
+        return ranked_rows
+
+    @staticmethod
+    def rank_rewards(
+        rewards: dict[Agent, dict[Network, int]],
+        budgets: dict[Agent, int] | None = None,
+    ) -> dict[Agent, list[Network]]:
+        """
+        Sort the prefixes by decreasing reward (ties keep the order of `rewards`).
+        The rewards can be computed by ClickHouse with `zeph.queries.GetUniqueLinksRewards`.
+        With `budgets`, only the `budgets[agent]` best prefixes of each agent are
+        selected, with a heap instead of a full sort.
+        """
         prefixes: dict[Agent, list[Network]] = {}
         for agent, rewards_ in rewards.items():
-            prefixes[agent] = [
-                x[0] for x in sorted(rewards_.items(), key=lambda x: x[1])
-            ]
-
+            if budgets is None:
+                ranked = sorted(rewards_.items(), key=lambda x: x[1], reverse=True)
+            else:
+                # Equivalent to `sorted(...)[:n]`, ties included.
+                ranked = nlargest(
+                    budgets.get(agent, 0), rewards_.items(), key=lambda x: x[1]
+                )
+            prefixes[agent] = [x[0] for x in ranked]
         return prefixes
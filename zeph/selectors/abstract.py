@@ -2,34 +2,65 @@
 
 import random
 from abc import ABC, abstractmethod
+from collections.abc import Collection, Sequence
 
 from zeph.typing import Network
 
 
 class AbstractSelector(ABC):
-    def __init__(self, universe: set[Network], budgets: dict[str, int]) -> None:
-        self.universe = universe
+    def __init__(
+        self,
+        universe: Collection[Network],
+        budgets: dict[str, int],
+        seed: int | None = None,
+    ) -> None:
+        # The prefixes are sampled by index: sort the universe if it is not indexable
+        # (e.g. a set), so that the selection does not depend on the iteration order.
+        if not isinstance(universe, Sequence):
+            universe = sorted(universe)
+        self.universe: Sequence[Network] = universe
         self.budgets = budgets
-
-    def universe_shuffled(self) -> list[Network]:
-        universe = list(self.universe)
-        random.shuffle(universe)
-        return universe
+        self.random = random.Random(seed)
 
     @abstractmethod
     def select(self, agent_uuid: str) -> set[Network]:
         pass
 
+    def sample(
+        self, k: int, exclude: Collection[Network] = frozenset()
+    ) -> list[Network]:
+        """
+        Sample `k` distinct prefixes of the universe that are not in `exclude`
+        (or as many as possible), in O(k) when `k` is small compared to the universe.
+        """
+        n = len(self.universe)
+        if k <= 0 or not n:
+            return []
+        if 2 * (k + len(exclude)) > n:
+            # Dense sample: go through a random permutation of the universe.
+            indices = iter(self.random.sample(range(n), n))
+        else:
+            # Sparse sample: draw indices until `k` prefixes are found,
+            # since less than half of the universe is selected or excluded,
+            # this takes less than 2k draws on average.
+            indices = iter(lambda: self.random.randrange(n), None)
+        seen = set()
+        prefixes = []
+        for i in indices:
+            if i in seen:
+                continue
+            seen.add(i)
+            prefix = self.universe[i]
+            if prefix not in exclude:
+                prefixes.append(prefix)
+                if len(prefixes) >= k:
+                    break
+        return prefixes
+
     def _select_random(
         self, agent_uuid: str, preset: set[Network] | None = None
     ) -> set[Network]:
-        prefixes = set()
-        if preset:
-            prefixes.update(preset)
-        universe = self.universe_shuffled()
+        prefixes = set(preset or ())
         budget = self.budgets[agent_uuid]
-        for prefix in universe:
-            if len(prefixes) >= budget:
-                break
-            prefixes.add(prefix)
+        prefixes.update(self.sample(budget - len(prefixes), exclude=prefixes))
         return prefixes
@@ -5,24 +5,32 @@ Add the constraint of a prefix being probed by exactly one agent.
 It's less effective than letting the agents potentially probe the same prefixes (see paper).
 """
 
-from collections import defaultdict
-from itertools import cycle
+from collections import defaultdict, deque
+from collections.abc import Collection
 
 from zeph.selectors.random import RandomSelector
 from zeph.typing import Network
 
 
 class ConstrainedRandomSelector(RandomSelector):
-    def __init__(self, universe: set[Network], budgets: dict[str, int]) -> None:
-        super().__init__(universe, budgets)
+    def __init__(
+        self,
+        universe: Collection[Network],
+        budgets: dict[str, int],
+        seed: int | None = None,
+    ) -> None:
+        super().__init__(universe, budgets, seed)
         self.prefixes = self.dispatch()
 
     def dispatch(self) -> dict[str, set[Network]]:
+        """Dispatch a sample of the universe to the agents that are not full, in turn."""
         prefixes: dict[str, set[Network]] = defaultdict(set)
-        for agent, prefix in zip(cycle(self.budgets), self.universe_shuffled()):
-            if len(prefixes[agent]) >= self.budgets[agent]:
-                continue
+        agents = deque(agent for agent, budget in self.budgets.items() if budget > 0)
+        for prefix in self.sample(sum(self.budgets.values())):
+            agent = agents.popleft()
             prefixes[agent].add(prefix)
+            if len(prefixes[agent]) < self.budgets[agent]:
+                agents.append(agent)
         return prefixes
 
     def select(self, agent_uuid: str) -> set[Network]:
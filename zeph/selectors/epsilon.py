@@ -5,6 +5,8 @@ Apply a reinforcement-learning approach to select prefixes.
 """
 
 
+from collections.abc import Collection
+
 from zeph.selectors.abstract import AbstractSelector
 from zeph.typing import Network
 
@@ -12,12 +14,13 @@ from zeph.typing import Network
 class EpsilonSelector(AbstractSelector):
     def __init__(
         self,
-        universe: set[Network],
+        universe: Collection[Network],
         budgets: dict[str, int],
         epsilon: float,
         ranked_prefixes: dict[str, list[Network]],
+        seed: int | None = None,
     ):
-        super().__init__(universe, budgets)
+        super().__init__(universe, budgets, seed)
         self.epsilon = epsilon
         self.ranked_prefixes = ranked_prefixes
 
@@ -30,7 +33,9 @@ class EpsilonSelector(AbstractSelector):
             * Pick random eB prefixes not already used in the exploration set
         """
         # Compute the number of prefixes for exploration [eB] / exploitation [(1-e)B]
-        n_prefixes_exploitation = int((1 - self.epsilon) * self.budgets[agent_uuid])
+        n_prefixes_exploitation = self.exploitation_budget(
+            self.budgets[agent_uuid], self.epsilon
+        )
 
         # Pick the (1-e)B prefix with the best reward
         rank = self.ranked_prefixes.get(agent_uuid, [])
@@ -38,3 +43,13 @@ class EpsilonSelector(AbstractSelector):
 
         # Add random prefixes until the budget is completely burned
         return self._select_random(agent_uuid, preset=prefixes)
+
+    @staticmethod
+    def exploitation_budget(budget: int, epsilon: float) -> int:
+        """
+        Number of ranked prefixes selected out of `budget` prefixes,
+        i.e. the number of prefixes that the rankers need to rank.
+        >>> EpsilonSelector.exploitation_budget(1000, 0.1)
+        900
+        """
+        return int((1 - epsilon) * budget)
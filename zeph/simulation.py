@@ -0,0 +1,405 @@
+"""
+Offline simulation of Zeph cycles.
+
+A ground truth, i.e. the links that each agent would discover by probing each prefix
+(for example the links of a previous measurement), is replayed through `run_zeph`
+with in-process stand-ins for `IrisClient` and `ClickHouseClient`:
+a measurement reveals, for each agent, the ground-truth links of the prefixes of its target list.
+"""
+import re
+from collections.abc import Collection, Iterator
+from ipaddress import IPv6Address
+from itertools import count
+from pathlib import Path
+from socket import AF_INET, AF_INET6, inet_pton
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+import httpx
+import numpy as np
+from diamond_miner.queries.query import links_table
+
+from zeph.instrumentation import Instrumentation
+from zeph.main import run_zeph
+from zeph.queries import REWARDS_DTYPE, ROW_BINARY_DTYPE
+from zeph.rankers import AbstractRanker
+from zeph.store import LinkStore, NetworkArray
+from zeph.typing import Agent, Network
+from zeph.utilities import IPV4_MAPPED, measurement_id
+
+
+class GroundTruth:
+    """
+    Links of each (agent, prefix), indexed by agent and network key.
+
+    >>> from zeph.utilities import network_key
+    >>> store = LinkStore.from_dict({("a", "10.0.1.0/24"): {1, 2}, ("a", "10.0.0.0/24"): {2}})
+    >>> ground_truth = GroundTruth(store)
+    >>> rows = ground_truth.reveal("a", np.array([network_key("10.0.0.0/24"), 0], dtype=np.uint64))
+    >>> ground_truth.links(rows)[1].tolist()
+    [1]
+    """
+
+    def __init__(self, store: LinkStore) -> None:
+        self.store = store
+        self.prefix_keys = store.prefix_keys()
+        # Sort the rows by agent, and then by network key.
+        keys = self.row_keys(np.arange(len(store)))
+        self.rows = np.lexsort((keys, store.row_agents))
+        self.keys = keys[self.rows]
+        self.agent_offsets = np.searchsorted(
+            store.row_agents[self.rows], np.arange(len(store.agents) + 1)
+        )
+        self.agent_ids = {agent: i for i, agent in enumerate(store.agents)}
+
+    @property
+    def agents(self) -> list[Agent]:
+        return self.store.agents
+
+    @property
+    def n_links(self) -> int:
+        return self.store.n_links
+
+    def reveal(self, agent: Agent, keys: np.ndarray) -> np.ndarray:
+        """Rows of the store of the prefixes `keys` probed by `agent`, in the order of `keys`."""
+        agent_id = self.agent_ids.get(agent)
+        if agent_id is None:
+            return np.empty(0, dtype=np.int64)
+        start, end = self.agent_offsets[agent_id], self.agent_offsets[agent_id + 1]
+        agent_keys = self.keys[start:end]
+        index = np.searchsorted(agent_keys, keys)
+        found = index < len(agent_keys)
+        found[found] = agent_keys[index[found]] == keys[found]
+        rows: np.ndarray = self.rows[start + index[found]]
+        return rows
+
+    def row_keys(self, rows: np.ndarray) -> np.ndarray:
+        """Network key of the prefix of each row in `rows`."""
+        keys: np.ndarray = self.prefix_keys[self.store.row_prefixes[rows]]
+        return keys
+
+    def links(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Number of links of each row in `rows`, and their dense ids, concatenated."""
+        sizes = self.store.indptr[rows + 1] - self.store.indptr[rows]
+        return sizes, self.store.links_of(rows)
+
+    def save(self, path: Path) -> None:
+        store = self.store
+        with path.open("wb") as f:
+            np.savez(
+                f,
+                agents=np.array(store.agents),
+                prefixes=self.prefix_keys,
+                row_agents=store.row_agents,
+                row_prefixes=store.row_prefixes,
+                indptr=store.indptr,
+                links=store.links,
+                link_values=store.link_values,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "GroundTruth":
+        with np.load(path) as data:
+            return cls(
+                LinkStore(
+                    agents=data["agents"].tolist(),
+                    prefixes=NetworkArray(data["prefixes"]),
+                    row_agents=data["row_agents"],
+                    row_prefixes=data["row_prefixes"],
+                    indptr=data["indptr"],
+                    links=data["links"],
+                    link_values=data["link_values"],
+                )
+            )
+
+
+def target_keys(content: bytes) -> np.ndarray:
+    """
+    Network keys of the prefixes of a target file.
+    >>> target_keys(b"10.0.0.0/24,icmp,2,32,6\\n2001:db8::/64,icmp,2,32,6").tolist()
+    [281470849515520, 2306139568115548160]
+    """
+    keys = []
+    for line in content.splitlines():
+        address = line.split(b",", 1)[0].split(b"/", 1)[0].decode()
+        if ":" in address:
+            keys.append(int.from_bytes(inet_pton(AF_INET6, address)[:8], "big"))
+        else:
+            keys.append(
+                (IPV4_MAPPED << 32) | int.from_bytes(inet_pton(AF_INET, address), "big")
+            )
+    return np.array(keys, dtype=np.uint64)
+
+
+def address_parts(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Inverse of `zeph.utilities.address_keys`: the upper and lower 64 bits of the addresses."""
+    ipv4 = (keys >> np.uint64(32)) == np.uint64(IPV4_MAPPED)
+    zero = np.uint64(0)
+    return np.where(ipv4, zero, keys), np.where(ipv4, keys, zero)
+
+
+def in_range(keys: np.ndarray, first: int, last: int) -> np.ndarray:
+    """
+    Mask of the network keys whose address is between the addresses `first` and `last`.
+    >>> from zeph.utilities import network_key
+    >>> keys = np.array([network_key("10.0.0.0/24"), network_key("2001:db8::/64")], dtype=np.uint64)
+    >>> in_range(keys, int(IPv6Address("::ffff:10.0.0.0")), int(IPv6Address("::ffff:10.0.0.255"))).tolist()
+    [True, False]
+    """
+    high, low = address_parts(keys)
+    first_high, first_low = np.uint64(first >> 64), np.uint64(first & (2**64 - 1))
+    last_high, last_low = np.uint64(last >> 64), np.uint64(last & (2**64 - 1))
+    after_first = (high > first_high) | ((high == first_high) & (low >= first_low))
+    before_last = (high < last_high) | ((high == last_high) & (low <= last_low))
+    mask: np.ndarray = after_first & before_last
+    return mask
+
+
+class SimulatedIris:
+    """
+    Stand-in for `IrisClient`, implementing the requests made by `zeph.iris`.
+    The measurements are finished as soon as they are created.
+    """
+
+    def __init__(self, ground_truth: GroundTruth, probing_rate: int = 100_000) -> None:
+        self.ground_truth = ground_truth
+        self.probing_rate = probing_rate
+        self.targets: dict[str, np.ndarray] = {}
+        self.measurements: dict[str, dict] = {}
+        self.tables: dict[str, np.ndarray] = {}
+        "Rows of the ground truth revealed by each links table."
+        self.measurement_rows: dict[str, np.ndarray] = {}
+        "Rows of the ground truth revealed by each measurement."
+        self.counter = count()
+
+    def all(self, url: str, params: dict | None = None) -> list[dict]:
+        assert url == "/agents"
+        return [
+            {"uuid": agent, "parameters": {"max_probing_rate": self.probing_rate}}
+            for agent in self.ground_truth.agents
+        ]
+
+    def get(self, url: str, params: dict | None = None) -> httpx.Response:
+        _, resource, uuid = url.split("/")
+        assert resource == "measurements"
+        return response("GET", url, 200, self.measurements[uuid])
+
+    def post(
+        self, url: str, json: dict | None = None, files: dict | None = None
+    ) -> httpx.Response:
+        if url == "/targets" and files:
+            key, file = files["target_file"]
+            self.targets[key] = target_keys(file.read())
+            return response("POST", url, 201, {"key": key})
+        assert url == "/measurements" and json
+        measurement_uuid = f"simulation-{next(self.counter)}"
+        rows = []
+        for agent in json["agents"]:
+            agent_rows = self.ground_truth.reveal(
+                agent["uuid"], self.targets[agent["target_file"]]
+            )
+            table = links_table(measurement_id(measurement_uuid, agent["uuid"]))
+            self.tables[table] = np.sort(agent_rows)
+            rows.append(agent_rows)
+        self.measurement_rows[measurement_uuid] = np.concatenate(rows)
+        self.measurements[measurement_uuid] = {
+            "uuid": measurement_uuid,
+            "state": "finished",
+            "end_time": None,
+            "tags": json["tags"],
+            "agents": [{"agent_uuid": agent["uuid"]} for agent in json["agents"]],
+        }
+        return response("POST", url, 201, self.measurements[measurement_uuid])
+
+
+def response(method: str, url: str, status_code: int, json: Any) -> httpx.Response:
+    return httpx.Response(status_code, json=json, request=httpx.Request(method, url))
+
+
+class SimulatedClickHouse:
+    """
+    Stand-in for `ClickHouseClient`, answering the queries of `zeph.queries`
+    on the links tables of `SimulatedIris`, with the rows encoded in bulk.
+    The filters of the queries, other than the prefix range, are ignored.
+    """
+
+    def __init__(self, iris: SimulatedIris, chunk_size: int = 2**20) -> None:
+        self.iris = iris
+        self.chunk_size = chunk_size
+
+    def rows(self, query: str) -> list[np.ndarray]:
+        """Rows of the ground truth of each links table of `query`, in the prefix range."""
+        bounds = re.search(
+            r"probe_dst_prefix >= toIPv6\('(.+?)'\) AND probe_dst_prefix <= toIPv6\('(.+?)'\)",
+            query,
+        )
+        tables = []
+        for table in re.findall(r"FROM (links__\w+)", query):
+            rows = self.iris.tables.get(table, np.empty(0, dtype=np.int64))
+            if bounds:
+                keys = self.iris.ground_truth.row_keys(rows)
+                first, last = (int(IPv6Address(bound)) for bound in bounds.groups())
+                rows = rows[in_range(keys, first, last)]
+            tables.append(rows)
+        return tables
+
+    def json(
+        self, query: str, data: Any = None, settings: dict | None = None
+    ) -> list[dict]:
+        assert "min(probe_dst_prefix)" in query
+        rows = np.concatenate(self.rows(query))
+        if not len(rows):
+            # The aggregates of an empty table are the default values.
+            return [{"first": "::", "last": "::"}]
+        keys = np.sort(self.iris.ground_truth.row_keys(rows))
+        high, low = address_parts(keys[[0, -1]])
+        first, last = (
+            str(IPv6Address(int(h) << 64 | int(lo))) for h, lo in zip(high, low)
+        )
+        return [{"first": first, "last": last}]
+
+    def iter_bytes(
+        self, query: str, data: Any = None, settings: dict | None = None
+    ) -> Iterator[bytes]:
+        assert settings and settings["default_format"] == "RowBinary"
+        if "AS reward" in query:
+            records = self.rewards(self.rows(query))
+        else:
+            records = self.links(self.rows(query))
+        content = records.tobytes()
+        for start in range(0, len(content), self.chunk_size):
+            end = start + self.chunk_size
+            yield content[start:end]
+
+    def links(self, tables: list[np.ndarray]) -> np.ndarray:
+        """Records of `GetUniqueLinksByPrefix.binary_statement`."""
+        (rows,) = tables
+        ground_truth = self.iris.ground_truth
+        sizes, links = ground_truth.links(rows)
+        records = np.empty(len(links), dtype=ROW_BINARY_DTYPE)
+        records["high"], records["low"] = address_parts(
+            np.repeat(ground_truth.row_keys(rows), sizes)
+        )
+        records["link"] = ground_truth.store.link_values[links]
+        return records
+
+    def rewards(self, tables: list[np.ndarray]) -> np.ndarray:
+        """Records of `GetUniqueLinksRewards`: the number of links seen by a single (agent, prefix)."""
+        ground_truth = self.iris.ground_truth
+        agents = np.repeat(np.arange(len(tables)), [len(rows) for rows in tables])
+        rows = np.concatenate(tables)
+        sizes, links = ground_truth.links(rows)
+        unique = np.bincount(links, minlength=ground_truth.n_links)[links] == 1
+        rewards = np.bincount(
+            np.repeat(np.arange(len(rows)), sizes), weights=unique, minlength=len(rows)
+        )
+        keep = rewards > 0
+        keys = ground_truth.row_keys(rows[keep])
+        order = np.lexsort((keys, agents[keep]))
+        records = np.empty(len(order), dtype=REWARDS_DTYPE)
+        records["agent"] = agents[keep][order]
+        records["high"], records["low"] = address_parts(keys[order])
+        records["reward"] = rewards[keep][order]
+        return records
+
+
+def simulate(
+    ground_truth: GroundTruth,
+    universe: Collection[Network],
+    *,
+    cycles: int,
+    budget: int,
+    ranker: AbstractRanker | str = "DFGCoverRanker",
+    exploration_ratio: float = 0.1,
+    seed: int | None = None,
+    server_side_rewards: bool = False,
+    compare_rankers: list[str] | None = None,
+    history_decay: float | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Run `cycles` Zeph cycles on the ground truth, with a budget of `budget` prefixes per agent.
+    The first cycle is a random selection, and each cycle is ranked on the previous one
+    (or on the reward history of the previous ones, if `history_decay` is specified).
+    Yields, for each cycle, the number of links discovered, and the time of each stage.
+    """
+    with TemporaryDirectory(prefix="zeph-simulation-") as directory:
+        history_file = (
+            Path(directory) / "history.npz" if history_decay is not None else None
+        )
+        yield from simulate_cycles(
+            ground_truth,
+            universe,
+            cycles=cycles,
+            budget=budget,
+            ranker=ranker,
+            exploration_ratio=exploration_ratio,
+            seed=seed,
+            server_side_rewards=server_side_rewards,
+            compare_rankers=compare_rankers,
+            history_file=history_file,
+            history_decay=0.0 if history_decay is None else history_decay,
+        )
+
+
+def simulate_cycles(
+    ground_truth: GroundTruth,
+    universe: Collection[Network],
+    *,
+    cycles: int,
+    budget: int,
+    ranker: AbstractRanker | str,
+    exploration_ratio: float,
+    seed: int | None,
+    server_side_rewards: bool,
+    compare_rankers: list[str] | None,
+    history_file: Path | None,
+    history_decay: float,
+) -> Iterator[dict[str, Any]]:
+    iris = SimulatedIris(ground_truth)
+    clickhouse = SimulatedClickHouse(iris)
+    discovered = np.zeros(ground_truth.n_links, dtype=bool)
+    previous_uuid = None
+    for cycle in range(cycles):
+        instrumentation = Instrumentation(enabled=True)
+        start = perf_counter()
+        run_zeph(
+            iris=iris,  # type: ignore[arg-type]
+            clickhouse=clickhouse,  # type: ignore[arg-type]
+            ranker=ranker,
+            universe=universe,
+            agent_tag="all",
+            measurement_tags=["simulation"],
+            tool="diamond-miner",
+            protocol="icmp",
+            min_ttl=2,
+            max_ttl=32,
+            exploration_ratio=exploration_ratio,
+            previous_uuid=previous_uuid,
+            fixed_budget=budget,
+            dry_run=False,
+            seed=None if seed is None else seed + cycle,
+            server_side_rewards=server_side_rewards,
+            instrumentation=instrumentation,
+            compare_rankers=compare_rankers,
+            history_file=history_file,
+            history_decay=history_decay,
+        )
+        seconds = perf_counter() - start
+        previous_uuid = list(iris.measurements)[-1]
+        rows = iris.measurement_rows[previous_uuid]
+        links = np.unique(ground_truth.links(rows)[1])
+        new_links = int(np.count_nonzero(~discovered[links]))
+        discovered[links] = True
+        stages: dict[str, float] = {}
+        for span in instrumentation.spans:
+            stages[span.name] = stages.get(span.name, 0.0) + span.wall_seconds
+        yield {
+            "cycle": cycle,
+            "probed_prefixes": len(rows),
+            "links": len(links),
+            "new_links": new_links,
+            "discovered_links": int(discovered.sum()),
+            "seconds": seconds,
+            "stages": stages,
+        }
@@ -0,0 +1,338 @@
+"""
+Compact storage of the links seen by each (agent, prefix).
+
+Instead of one Python `set` of 64-bit hashes per (agent, prefix), the links are
+stored in a CSR-like layout: the links of row `i` are
+`links[indptr[i]:indptr[i + 1]]`, where each link is a dense `uint32` identifier.
+The agents and prefixes are interned, so each row only holds two `uint32` ids.
+"""
+import json
+from collections.abc import Hashable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, overload
+
+import numpy as np
+
+from zeph.interning import LinkInterner
+from zeph.typing import Agent, Link, Network
+from zeph.utilities import concatenate, key_network, network_key
+
+ARRAYS = ("row_agents", "row_prefixes", "indptr", "links", "link_values")
+
+
+class NetworkArray(Sequence[Network]):
+    """
+    Sequence of networks backed by an array of network keys (see `zeph.utilities.network_key`).
+    The networks are only converted to strings when accessed.
+
+    >>> networks = NetworkArray(np.array([0xFFFFC0000200, 0x20010DB800000000], dtype=np.uint64))
+    >>> len(networks), networks[0], list(networks)
+    (2, '192.0.2.0/24', ['192.0.2.0/24', '2001:db8::/64'])
+    """
+
+    def __init__(self, keys: np.ndarray) -> None:
+        self.keys = keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @overload
+    def __getitem__(self, index: int) -> Network:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "NetworkArray":
+        ...
+
+    def __getitem__(self, index: int | slice) -> "Network | NetworkArray":
+        if isinstance(index, slice):
+            return NetworkArray(self.keys[index])
+        return key_network(int(self.keys[index]))
+
+
+@dataclass(frozen=True, eq=False)
+class LinkStore:
+    agents: list[Agent]
+    "Interned agents, indexed by `row_agents`."
+
+    prefixes: Sequence[Network]
+    "Interned prefixes, indexed by `row_prefixes`."
+
+    row_agents: np.ndarray
+    "Agent id of each row (`uint32`)."
+
+    row_prefixes: np.ndarray
+    "Prefix id of each row (`uint32`)."
+
+    indptr: np.ndarray
+    "Offsets of the links of each row in `links` (`int64`, one more than the number of rows)."
+
+    links: np.ndarray
+    "Dense link ids (`uint32`)."
+
+    link_values: np.ndarray
+    "Original value (e.g. `cityHash64`) of each dense link id."
+
+    def __len__(self) -> int:
+        return len(self.row_agents)
+
+    @property
+    def n_links(self) -> int:
+        """Number of distinct links."""
+        return len(self.link_values)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays, excluding the interned agents and prefixes."""
+        return sum(
+            x.nbytes
+            for x in (
+                self.row_agents,
+                self.row_prefixes,
+                self.indptr,
+                self.links,
+                self.link_values,
+            )
+        )
+
+    def sizes(self) -> np.ndarray:
+        """Number of links of each row."""
+        return np.diff(self.indptr)
+
+    def row(self, i: int) -> np.ndarray:
+        """Dense link ids of row `i`."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.links[start:end]
+
+    def links_of(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Dense link ids of the rows in `rows`, concatenated.
+
+        >>> store = LinkStore.from_dict({("a", "p1"): {10, 20}, ("a", "p2"): {20, 30}})
+        >>> store.links_of(np.array([1, 0])).tolist()
+        [1, 2, 0, 1]
+        """
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        links: np.ndarray = self.links[index]
+        return links
+
+    def count(self, rows: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Number of links of each row in `rows` selected by `mask`,
+        a boolean mask over the links of the rows (in the order of `links_of`).
+
+        >>> store = LinkStore.from_dict({("a", "p1"): {10, 20}, ("a", "p2"): {20, 30}})
+        >>> store.count(np.array([1, 0]), np.array([True, False, True, True])).tolist()
+        [1, 2]
+        """
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        counts = np.zeros(offsets[-1] + 1, dtype=np.int64)
+        np.cumsum(mask, out=counts[1:])
+        return counts[offsets[1:]] - counts[offsets[:-1]]
+
+    def uncovered(self, rows: np.ndarray, covered: np.ndarray) -> np.ndarray:
+        """
+        Number of links of each row in `rows` that are not in `covered`
+        (a boolean mask over the dense link ids).
+
+        >>> store = LinkStore.from_dict({("a", "p1"): {10, 20}, ("a", "p2"): {20, 30}})
+        >>> covered = np.array([False, True, False])
+        >>> store.uncovered(np.array([0, 1]), covered).tolist()
+        [1, 1]
+        """
+        return self.count(rows, ~covered[self.links_of(rows)])
+
+    def key(self, i: int) -> tuple[Agent, Network]:
+        return self.agents[self.row_agents[i]], self.prefixes[self.row_prefixes[i]]
+
+    def keys(self) -> Iterator[tuple[Agent, Network]]:
+        for i in range(len(self)):
+            yield self.key(i)
+
+    def to_dict(self) -> dict[tuple[Agent, Network], set[Link]]:
+        """Convert the store back to the `(agent, prefix) -> links` representation."""
+        values = self.link_values.tolist()
+        return {
+            self.key(i): {values[link] for link in self.row(i).tolist()}
+            for i in range(len(self))
+        }
+
+    @classmethod
+    def from_dict(cls, links: dict[tuple[Agent, Network], set[Link]]) -> "LinkStore":
+        """
+        >>> store = LinkStore.from_dict({("a", "p1"): {10, 20}, ("b", "p1"): {20}})
+        >>> len(store), store.n_links, store.agents, store.prefixes
+        (2, 2, ['a', 'b'], ['p1'])
+        >>> store.to_dict()
+        {('a', 'p1'): {10, 20}, ('b', 'p1'): {20}}
+        """
+        builder = LinkStoreBuilder()
+        link_ids: dict[Hashable, int] = {}
+        for (agent, prefix), links_ in links.items():
+            ids = [link_ids.setdefault(link, len(link_ids)) for link in links_]
+            builder.add(agent, prefix, np.array(ids, dtype=np.uint64))
+        values = list(link_ids)
+        if all(isinstance(value, int) for value in values):
+            link_values = np.array(values, dtype=np.uint64)
+        else:
+            link_values = np.fromiter(values, dtype=object, count=len(values))
+        return builder.build(link_values)
+
+    def prefix_keys(self) -> np.ndarray:
+        """
+        Network keys of the prefixes (see `zeph.utilities.network_key`).
+
+        >>> store = LinkStore.from_dict({("a", "192.0.2.0/24"): {10}})
+        >>> store.prefix_keys().tolist()
+        [281473902969344]
+        """
+        if isinstance(self.prefixes, NetworkArray):
+            return self.prefixes.keys
+        return np.array(
+            [network_key(prefix) for prefix in self.prefixes], dtype=np.uint64
+        )
+
+    def save(self, directory: Path) -> None:
+        """
+        Save the store, with integer link values, as `.npy` files that can be memory-mapped
+        by `load`. The prefixes are saved as strings.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        if isinstance(self.prefixes, NetworkArray):
+            np.save(directory / "prefixes.npy", self.prefixes.keys)
+            prefixes = None
+        else:
+            prefixes = [str(prefix) for prefix in self.prefixes]
+        metadata = {"agents": self.agents, "prefixes": prefixes}
+        (directory / "metadata.json").write_text(json.dumps(metadata))
+        for name in ARRAYS:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: Literal["r"] | None = "r") -> "LinkStore":
+        """
+        Load a store saved with `save`. By default the arrays are memory-mapped
+        read-only, so that several processes can share a single copy of the store.
+        """
+        metadata = json.loads((directory / "metadata.json").read_text())
+        prefixes = metadata["prefixes"]
+        if prefixes is None:
+            prefixes = NetworkArray(np.load(directory / "prefixes.npy", mmap_mode))
+        arrays = {
+            name: np.load(directory / f"{name}.npy", mmap_mode) for name in ARRAYS
+        }
+        return cls(agents=metadata["agents"], prefixes=prefixes, **arrays)
+
+    @classmethod
+    def wrap(
+        cls, links: "dict[tuple[Agent, Network], set[Link]] | LinkStore"
+    ) -> "LinkStore":
+        """Return `links` as a `LinkStore`, converting it if needed."""
+        if isinstance(links, LinkStore):
+            return links
+        return cls.from_dict(links)
+
+
+def as_dict(
+    links: dict[tuple[Agent, Network], set[Link]] | LinkStore
+) -> dict[tuple[Agent, Network], set[Link]]:
+    """Adapter for the rankers that operate on the `(agent, prefix) -> links` representation."""
+    if isinstance(links, LinkStore):
+        return links.to_dict()
+    return links
+
+
+class LinkStoreBuilder:
+    """
+    Incrementally build a `LinkStore`, either one row at a time (`add`)
+    or one block of rows with prefixes given as network keys (`add_many`).
+    The two methods cannot be mixed.
+    The link hashes are interned to dense ids when calling `build`;
+    with `memory_limit`, they are spilled to disk beyond this size (see `zeph.interning`).
+    """
+
+    def __init__(
+        self, memory_limit: int | None = None, spill_directory: Path | None = None
+    ) -> None:
+        self.agents: dict[Agent, int] = {}
+        self.prefixes: dict[Network, int] = {}
+        # Rows added with `add`
+        self.row_agents: list[int] = []
+        self.row_prefixes: list[int] = []
+        self.sizes: list[int] = []
+        # Rows added with `add_many`
+        self.block_agents: list[np.ndarray] = []
+        self.block_keys: list[np.ndarray] = []
+        self.block_sizes: list[np.ndarray] = []
+        self.interner = LinkInterner(memory_limit, spill_directory)
+
+    def __len__(self) -> int:
+        return len(self.sizes) + sum(len(x) for x in self.block_sizes)
+
+    def add(self, agent: Agent, prefix: Network, links: Iterable[Link]) -> None:
+        assert not self.block_keys, "cannot mix `add` and `add_many`"
+        if not isinstance(links, np.ndarray):
+            links = np.fromiter(links, dtype=np.uint64)
+        self.row_agents.append(self.agents.setdefault(agent, len(self.agents)))
+        self.row_prefixes.append(self.prefixes.setdefault(prefix, len(self.prefixes)))
+        self.sizes.append(len(links))
+        self.interner.add(links)
+
+    def add_many(
+        self, agent: Agent, keys: np.ndarray, sizes: np.ndarray, links: np.ndarray
+    ) -> None:
+        """
+        Add the rows of an agent: the links of the prefix `keys[i]`
+        are the next `sizes[i]` values of `links`.
+        """
+        assert not self.sizes, "cannot mix `add` and `add_many`"
+        agent_id = self.agents.setdefault(agent, len(self.agents))
+        self.block_agents.append(np.full(len(keys), agent_id, dtype=np.uint32))
+        self.block_keys.append(keys)
+        self.block_sizes.append(sizes)
+        self.interner.add(links)
+
+    def build(self, link_values: np.ndarray | None = None) -> LinkStore:
+        """
+        Args:
+            link_values: if specified, the rows already hold dense ids
+                and this is the value of each id. Otherwise the rows hold
+                link values that are interned here.
+        """
+        prefixes: Sequence[Network]
+        if self.block_keys:
+            keys, row_prefixes = np.unique(
+                concatenate(self.block_keys, np.uint64), return_inverse=True
+            )
+            prefixes = NetworkArray(keys)
+            row_agents = concatenate(self.block_agents, np.uint32)
+            sizes = concatenate(self.block_sizes, np.int64)
+        else:
+            prefixes = list(self.prefixes)
+            row_prefixes = np.array(self.row_prefixes, dtype=np.uint32)
+            row_agents = np.array(self.row_agents, dtype=np.uint32)
+            sizes = np.array(self.sizes, dtype=np.int64)
+        indptr = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        links: np.ndarray
+        if link_values is None:
+            link_values, links = self.interner.finish()
+        else:
+            links = self.interner.values()
+            assert len(link_values) < 2**32, "too many distinct links"
+        return LinkStore(
+            agents=list(self.agents),
+            prefixes=prefixes,
+            row_agents=row_agents,
+            row_prefixes=row_prefixes.astype(np.uint32),
+            indptr=indptr,
+            links=links.astype(np.uint32, copy=False),
+            link_values=link_values,
+        )
@@ -0,0 +1,323 @@
+"""
+Universe of the prefixes that can be probed.
+
+The universe is stored as sorted, merged, intervals of /24 (IPv4) and /64 (IPv6)
+prefixes, so its size is proportional to the number of BGP routes rather than
+to the number of prefixes. The prefixes file holds one network per line:
+a /24 or a /64 prefix, a larger network (e.g. `10.0.0.0/16`) or an address range
+(e.g. `10.0.0.0-10.0.3.255`), which stand for all the /24 or /64 prefixes they contain.
+
+Instead of being parsed on every run, the prefixes file is compiled once into
+a snapshot of the intervals, which is memory-mapped on later runs.
+The snapshot header holds the SHA-256 of the prefixes file it was built from.
+"""
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Sequence
+from hashlib import sha256
+from ipaddress import ip_address, ip_network
+from pathlib import Path
+from socket import AF_INET, AF_INET6, inet_pton
+from tempfile import NamedTemporaryFile
+from typing import overload
+
+import numpy as np
+from tqdm import tqdm
+
+from zeph.logging import logger
+from zeph.typing import Network
+from zeph.utilities import IPV4_MAPPED, key_network, network_key
+
+MAGIC = b"ZEPHUNV2"
+
+HEADER_DTYPE = np.dtype(
+    [("magic", "S8"), ("n_ipv4", "<u8"), ("n_ipv6", "<u8"), ("digest", "u1", (32,))]
+)
+"""Header of a snapshot, followed by the IPv4 (`<u4`) and IPv6 (`<u8`) intervals."""
+
+
+def file_digest(path: Path) -> bytes:
+    """SHA-256 of a file."""
+    h = sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.digest()
+
+
+def parse_interval(line: str) -> tuple[int, int, int]:
+    """
+    Parse a network or an address range of the prefixes file.
+    Return the IP version and the first and last /24 (IPv4) or /64 (IPv6) of the interval,
+    as the upper 24 or 64 bits of their address.
+    >>> parse_interval("10.0.0.0/24")
+    (4, 655360, 655360)
+    >>> parse_interval("10.0.0.0/22")
+    (4, 655360, 655363)
+    >>> parse_interval("10.0.0.0-10.0.3.255")
+    (4, 655360, 655363)
+    >>> parse_interval("2001:db8::/63")
+    (6, 2306139568115548160, 2306139568115548161)
+    >>> parse_interval("10.0.0.0/25")
+    Traceback (most recent call last):
+    ValueError: invalid network or range: '10.0.0.0/25'
+    """
+    try:
+        if "-" in line:
+            first_, last_ = line.split("-")
+            first, last = ip_address(first_.strip()), ip_address(last_.strip())
+            if first.version != last.version or int(first) > int(last):
+                raise ValueError
+        else:
+            network = ip_network(line)
+            first, last = network.network_address, network.broadcast_address
+    except ValueError:
+        raise ValueError(f"invalid network or range: {line!r}") from None
+    shift = 8 if first.version == 4 else 64
+    if "/" in line and (int(last) - int(first) + 1) >> shift == 0:
+        raise ValueError(f"invalid network or range: {line!r}")
+    return first.version, int(first) >> shift, int(last) >> shift
+
+
+def merge_intervals(intervals: np.ndarray) -> np.ndarray:
+    """
+    Sort and merge overlapping or adjacent intervals (`[first, last]` rows).
+    >>> merge_intervals(np.array([[5, 6], [0, 2], [3, 3], [8, 9], [9, 9]])).tolist()
+    [[0, 3], [5, 6], [8, 9]]
+    """
+    if not len(intervals):
+        return intervals.reshape(0, 2)
+    intervals = intervals[np.lexsort((intervals[:, 1], intervals[:, 0]))]
+    first, last = intervals[:, 0], np.maximum.accumulate(intervals[:, 1])
+    # Compare without `last + 1`, which can overflow.
+    gaps = (first[1:] > last[:-1]) & (first[1:] - last[:-1] > 1)
+    starts = np.flatnonzero(np.concatenate(([True], gaps)))
+    ends = np.append(starts[1:] - 1, len(intervals) - 1)
+    return np.stack((first[starts], last[ends]), axis=1)
+
+
+class Universe(Sequence[Network]):
+    """
+    Sorted set of /24 and /64 prefixes, with the IPv4 prefixes first.
+    Membership is tested by binary search on the intervals, and the prefix at
+    a given index is found by binary search on the cumulative size of the intervals,
+    so that prefixes can be sampled uniformly without being materialized.
+
+    >>> universe = Universe.from_networks(["2001:db8::/64", "192.0.2.0/24", "192.0.2.0/23"])
+    >>> len(universe), list(universe)
+    (3, ['192.0.2.0/24', '192.0.3.0/24', '2001:db8::/64'])
+    >>> "192.0.3.0/24" in universe, "192.0.4.0/24" in universe, "192.0.2.0/23" in universe
+    (True, False, False)
+    """
+
+    def __init__(self, ipv4: np.ndarray, ipv6: np.ndarray) -> None:
+        self.ipv4 = ipv4
+        "Sorted and disjoint intervals of IPv4 /24 (`uint32`, upper 24 bits of the address)."
+        self.ipv6 = ipv6
+        "Sorted and disjoint intervals of IPv6 /64 (`uint64`, upper 64 bits of the address)."
+        ipv4_offsets, ipv6_offsets = offsets(ipv4), offsets(ipv6)
+        self.n_ipv4 = int(ipv4_offsets[-1])
+        self.n_ipv6 = int(ipv6_offsets[-1])
+        # Looking up a scalar is several times faster with `bisect` on lists
+        # than with `np.searchsorted`, and the number of intervals is small.
+        self.ipv4_index = (ipv4_offsets[:-1].tolist(), ipv4[:, 0].tolist())
+        self.ipv6_index = (ipv6_offsets[:-1].tolist(), ipv6[:, 0].tolist())
+
+    def __len__(self) -> int:
+        return self.n_ipv4 + self.n_ipv6
+
+    @overload
+    def __getitem__(self, index: int) -> Network:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Network]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Network | list[Network]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index < self.n_ipv4:
+            return ipv4_network(locate(self.ipv4_index, index))
+        return key_network(locate(self.ipv6_index, index - self.n_ipv4))
+
+    def __iter__(self) -> Iterator[Network]:
+        for first, last in self.ipv4.tolist():
+            for unit in range(first, last + 1):
+                yield ipv4_network(unit)
+        for first, last in self.ipv6.tolist():
+            for unit in range(first, last + 1):
+                yield key_network(unit)
+
+    def __contains__(self, network: object) -> bool:
+        if not isinstance(network, str):
+            return False
+        if network.partition("/")[2] not in ("24", "64"):
+            return False
+        try:
+            key = network_key(network)
+        except ValueError:
+            return False
+        if key >> 32 == IPV4_MAPPED:
+            intervals, unit = self.ipv4, (key & 0xFFFFFFFF) >> 8
+        else:
+            intervals, unit = self.ipv6, key
+        # Python integers are compared as `float64` with `uint64` arrays.
+        value = intervals.dtype.type(unit)
+        i = int(np.searchsorted(intervals[:, 0], value, side="right")) - 1
+        return i >= 0 and unit <= int(intervals[i, 1])
+
+    @property
+    def n_intervals(self) -> int:
+        return len(self.ipv4) + len(self.ipv6)
+
+    @classmethod
+    def from_networks(cls, networks: Iterable[str]) -> "Universe":
+        """Build a universe from the lines of a prefixes file (see `parse_interval`)."""
+        # Fast path for /24 and /64 prefixes, which are the vast majority of the lines.
+        ipv4, ipv6 = [], []
+        intervals: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        for network in networks:
+            address, _, prefix_len = network.partition("/")
+            try:
+                if prefix_len == "24":
+                    ipv4.append(inet_pton(AF_INET, address))
+                    continue
+                if prefix_len == "64":
+                    ipv6.append(inet_pton(AF_INET6, address)[:8])
+                    continue
+            except OSError:
+                raise ValueError(f"invalid network or range: {network!r}") from None
+            version, first, last = parse_interval(network)
+            intervals[version].append((first, last))
+        units_v4 = np.frombuffer(b"".join(ipv4), dtype=">u4") >> np.uint32(8)
+        units_v6 = np.frombuffer(b"".join(ipv6), dtype=">u8")
+        return cls(
+            merge_intervals(
+                np.concatenate(
+                    (
+                        np.repeat(units_v4, 2).reshape(-1, 2),
+                        np.array(intervals[4], dtype=np.uint32).reshape(-1, 2),
+                    )
+                ).astype(np.uint32)
+            ),
+            merge_intervals(
+                np.concatenate(
+                    (
+                        np.repeat(units_v6, 2).reshape(-1, 2),
+                        np.array(intervals[6], dtype=np.uint64).reshape(-1, 2),
+                    )
+                ).astype(np.uint64)
+            ),
+        )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Universe":
+        """Parse a prefixes file (one network or range per line, `#` for comments)."""
+        with path.open() as f:
+            return cls.from_networks(
+                line.strip()
+                for line in tqdm(f)
+                if line.strip() and not line.startswith("#")
+            )
+
+    @classmethod
+    def load(cls, path: Path, digest: bytes | None = None) -> "Universe | None":
+        """
+        Memory-map a snapshot.
+        Return `None` if the snapshot is invalid or if it was not built from
+        a prefixes file with the specified `digest`.
+        """
+        try:
+            (header,) = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        except (OSError, ValueError):
+            return None
+        if header["magic"] != MAGIC or (
+            digest and header["digest"].tobytes() != digest.ljust(32, b"\0")
+        ):
+            return None
+        n_ipv4, n_ipv6 = int(header["n_ipv4"]), int(header["n_ipv6"])
+        offset_ipv6 = ipv6_offset(n_ipv4)
+        if path.stat().st_size != offset_ipv6 + 16 * n_ipv6:
+            return None
+        return cls(
+            memmap(path, np.dtype("<u4"), HEADER_DTYPE.itemsize, n_ipv4),
+            memmap(path, np.dtype("<u8"), offset_ipv6, n_ipv6),
+        )
+
+    def save(self, path: Path, digest: bytes = b"") -> None:
+        """Write a snapshot atomically."""
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["n_ipv4"], header["n_ipv6"] = len(self.ipv4), len(self.ipv6)
+        header["digest"] = np.frombuffer(digest.ljust(32, b"\0"), dtype=np.uint8)
+        padding = ipv6_offset(len(self.ipv4)) - HEADER_DTYPE.itemsize
+        padding -= 8 * len(self.ipv4)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            f.write(header.tobytes())
+            f.write(self.ipv4.astype("<u4").tobytes())
+            f.write(b"\0" * padding)
+            f.write(self.ipv6.astype("<u8").tobytes())
+        Path(f.name).replace(path)
+
+    @classmethod
+    def open(cls, prefixes_file: Path, directory: Path | None = None) -> "Universe":
+        """
+        Load the universe of a prefixes file from its snapshot in `directory`,
+        building the snapshot if it does not exist (or if `directory` is not specified,
+        parse the prefixes file).
+        """
+        if not directory:
+            return cls.from_file(prefixes_file)
+        digest = file_digest(prefixes_file)
+        snapshot = directory / f"{digest.hex()}.universe"
+        if (universe := cls.load(snapshot, digest)) is not None:
+            logger.info("file=%s snapshot=%s", prefixes_file, snapshot)
+            return universe
+        universe = cls.from_file(prefixes_file)
+        try:
+            universe.save(snapshot, digest)
+        except OSError as e:
+            logger.warning("file=%s snapshot=%s error=%s", prefixes_file, snapshot, e)
+        return universe
+
+
+def ipv4_network(unit: int) -> Network:
+    return key_network((IPV4_MAPPED << 32) | (unit << 8))
+
+
+def offsets(intervals: np.ndarray) -> np.ndarray:
+    """
+    Index of the first prefix of each interval, followed by the number of prefixes.
+    >>> offsets(np.array([[0, 3], [5, 6]], dtype=np.uint32)).tolist()
+    [0, 4, 6]
+    """
+    sizes = intervals[:, 1].astype(np.uint64) - intervals[:, 0] + np.uint64(1)
+    result = np.zeros(len(intervals) + 1, dtype=np.uint64)
+    np.cumsum(sizes, out=result[1:])
+    assert not len(sizes) or result[-1] >= sizes.max(), "universe too large"
+    return result
+
+
+def locate(index: tuple[list[int], list[int]], i: int) -> int:
+    """Prefix (upper bits of its address) at index `i`, given the offsets and the first prefix of each interval."""
+    offsets, firsts = index
+    j = bisect_right(offsets, i) - 1
+    return firsts[j] + i - offsets[j]
+
+
+def ipv6_offset(n_ipv4: int) -> int:
+    """Offset of the IPv6 intervals in a snapshot, aligned on 8 bytes."""
+    offset = HEADER_DTYPE.itemsize + 8 * n_ipv4
+    return offset + -offset % 8
+
+
+def memmap(path: Path, dtype: np.dtype, offset: int, n: int) -> np.ndarray:
+    if not n:
+        # np.memmap does not support empty arrays.
+        return np.empty((0, 2), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n, 2))
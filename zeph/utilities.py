@@ -1,3 +1,12 @@
+from collections.abc import Iterable, Iterator
+from ipaddress import IPv4Address, IPv6Address, IPv6Network
+from pathlib import Path
+from socket import AF_INET, inet_ntop
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+
 def measurement_id(measurement_uuid: str, agent_uuid: str) -> str:
     """
     Return the measurement identifier used by Iris.
@@ -26,3 +35,106 @@ def parse_network(addr: str, prefix_len_v4: int = 24, prefix_len_v6: int = 64) -
         ), "IPv4-mapped IPv6 addresses must be in dotted representation"
         return f"{addr[7:]}/{prefix_len_v4}"
     return f"{addr}/{prefix_len_v6}"
+
+
+def covering_network(first: str, last: str) -> IPv6Network:
+    """
+    Return the smallest IPv6 network containing `first` and `last`.
+    >>> covering_network("::ffff:8.8.4.0", "::ffff:8.8.8.0")
+    IPv6Network('::ffff:808:0/116')
+    >>> covering_network("::ffff:1.0.0.0", "2001:db8::")
+    IPv6Network('::/2')
+    >>> covering_network("2001:db8::", "2001:db8::")
+    IPv6Network('2001:db8::/128')
+    """
+    a, b = int(IPv6Address(first)), int(IPv6Address(last))
+    prefix_len = 128 - (a ^ b).bit_length()
+    return IPv6Network((a, prefix_len), strict=False)
+
+
+def split_network(network: IPv6Network, n: int) -> list[IPv6Network]:
+    """
+    Split `network` in at least `n` subnets of equal size (a power of two).
+    >>> split_network(IPv6Network("::ffff:0:0/96"), 3)
+    [IPv6Network('::ffff:0:0/98'), IPv6Network('::ffff:4000:0/98'), IPv6Network('::ffff:8000:0/98'), IPv6Network('::ffff:c000:0/98')]
+    >>> split_network(IPv6Network("2001:db8::/128"), 4)
+    [IPv6Network('2001:db8::/128')]
+    """
+    prefixlen_diff = min((n - 1).bit_length(), 128 - network.prefixlen)
+    return list(network.subnets(prefixlen_diff=prefixlen_diff))
+
+
+IPV4_MAPPED = 0xFFFF
+
+
+def network_key(network: str) -> int:
+    """
+    Encode a /24 or /64 network as a 64-bit integer: the lower 64 bits of the
+    IPv4-mapped address for IPv4 networks, the upper 64 bits of the address for IPv6 networks.
+    The two ranges do not overlap for routable IPv6 prefixes (`::/8` is reserved).
+    >>> hex(network_key("192.0.2.0/24"))
+    '0xffffc0000200'
+    >>> hex(network_key("2001:db8::/64"))
+    '0x20010db800000000'
+    """
+    addr = network.split("/")[0]
+    if "." in addr:
+        return (IPV4_MAPPED << 32) | int(IPv4Address(addr))
+    return int(IPv6Address(addr)) >> 64
+
+
+def key_network(key: int, prefix_len_v4: int = 24, prefix_len_v6: int = 64) -> str:
+    """
+    Inverse of `network_key`.
+    >>> key_network(0xFFFFC0000200)
+    '192.0.2.0/24'
+    >>> key_network(0x20010DB800000000)
+    '2001:db8::/64'
+    """
+    if key >> 32 == IPV4_MAPPED:
+        # Faster than `IPv4Address.__str__`.
+        address = inet_ntop(AF_INET, (key & 0xFFFFFFFF).to_bytes(4, "big"))
+        return f"{address}/{prefix_len_v4}"
+    return f"{IPv6Address(key << 64)}/{prefix_len_v6}"
+
+
+def address_keys(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """
+    Vectorized `network_key` for IPv6 addresses given as their upper and lower 64 bits.
+    >>> address_keys(np.array([0, 0x20010DB800000000]), np.array([0xFFFFC0000200, 0])).tolist()
+    [281473902969344, 2306139568115548160]
+    """
+    ipv4 = (high == 0) & ((low >> 32) == IPV4_MAPPED)
+    return np.where(ipv4, low, high).astype(np.uint64)
+
+
+def iter_records(chunks: Iterable[bytes], dtype: np.dtype) -> Iterator[np.ndarray]:
+    """
+    Decode a stream of fixed-size binary records, regardless of how they are split in chunks.
+    >>> dtype = np.dtype([("a", "<u2"), ("b", "u1")])
+    >>> [x.tolist() for x in iter_records([b"\\x01\\x00\\x02\\x03", b"\\x00\\x04"], dtype)]
+    [[(1, 2)], [(3, 4)]]
+    """
+    remainder = b""
+    for chunk in chunks:
+        data = remainder + chunk
+        size = len(data) - len(data) % dtype.itemsize
+        if size:
+            yield np.frombuffer(data, dtype=dtype, count=size // dtype.itemsize)
+        remainder = data[size:]
+    assert not remainder, "truncated record"
+
+
+def shared_directory() -> TemporaryDirectory:
+    """
+    Temporary directory for the arrays memory-mapped by several processes,
+    in `/dev/shm` when available so that they are not written to the disk.
+    """
+    shm = Path("/dev/shm")
+    return TemporaryDirectory(dir=shm if shm.is_dir() else None, prefix="zeph-")
+
+
+def concatenate(arrays: list[np.ndarray], dtype: type) -> np.ndarray:
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
@@ -1,29 +1,212 @@
 """
-Convert a RIB file to a list of /24 prefixes.
-TODO: IPv6 support.
+Convert RIB files to a list of /24 (and /64) prefixes.
+
+Since the /64 of an IPv6 route cannot be enumerated, IPv6 routes are written
+as address ranges, or as a random sample of their /64.
 """
-from ipaddress import IPv4Network, ip_network
+import random
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from ipaddress import IPv4Address, IPv6Address, ip_network
+from itertools import chain
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
+import radix
 import typer
 from pyasn.mrtx import parse_mrt_file
 from tqdm import tqdm
 
+from zeph.universe import merge_intervals
+
+
+def parse_prefixes(
+    input_file: Path, print_progress: bool, skip_record_on_error: bool
+) -> list[str]:
+    """Announced prefixes of a RIB file."""
+    return list(
+        parse_mrt_file(str(input_file), print_progress, skip_record_on_error).keys()
+    )
+
+
+def covering_prefixes(prefixes: Iterable[str]) -> list[str]:
+    """
+    Remove the prefixes that are covered by another prefix.
+    >>> covering_prefixes(["10.0.0.0/8", "10.1.0.0/16", "11.0.0.0/24", "10.0.0.0/8"])
+    ['10.0.0.0/8', '11.0.0.0/24']
+    """
+    rtree = radix.Radix()
+    for prefix in prefixes:
+        rtree.add(prefix)
+    return [
+        node.prefix
+        for node in rtree.nodes()
+        if rtree.search_worst(node.prefix).prefix == node.prefix
+    ]
+
+
+def prefix_intervals(prefixes: Iterable[str], version: int) -> np.ndarray:
+    """
+    Merged intervals (`[first, last]` rows) of the /24 (IPv4) or /64 (IPv6)
+    contained in the prefixes, as the upper 24 or 64 bits of their address.
+    Prefixes of the other IP version, or longer than /24 (/64) are ignored.
+    >>> prefixes = ["10.0.0.0/23", "10.0.2.0/24", "10.0.4.0/25", "2001:db8::/63"]
+    >>> prefix_intervals(prefixes, 4).tolist()
+    [[655360, 655362]]
+    >>> prefix_intervals(prefixes, 6).tolist()
+    [[2306139568115548160, 2306139568115548161]]
+    """
+    dtype, unit_len = (np.uint32, 24) if version == 4 else (np.uint64, 64)
+    intervals = []
+    for prefix in prefixes:
+        network = ip_network(prefix)
+        if network.version != version or network.prefixlen > unit_len:
+            continue
+        first = int(network.network_address) >> (network.max_prefixlen - unit_len)
+        intervals.append((first, first + (1 << (unit_len - network.prefixlen)) - 1))
+    return merge_intervals(np.array(intervals, dtype=dtype).reshape(-1, 2))
+
+
+def ipv4_units(intervals: np.ndarray) -> np.ndarray:
+    """
+    The /24 of each interval.
+    >>> ipv4_units(np.array([[1, 3], [7, 7]], dtype=np.uint32)).tolist()
+    [1, 2, 3, 7]
+    """
+    sizes = (intervals[:, 1] - intervals[:, 0] + 1).astype(np.int64)
+    starts = np.cumsum(sizes) - sizes
+    units = np.arange(int(sizes.sum()), dtype=np.int64)
+    units += np.repeat(intervals[:, 0].astype(np.int64) - starts, sizes)
+    return units.astype(np.uint32)
+
+
+def iter_ipv4_prefixes(
+    intervals: np.ndarray, chunk_size: int = 1 << 20
+) -> Iterator[str]:
+    """
+    Lines of the output file, one /24 per line.
+    >>> list(iter_ipv4_prefixes(np.array([[655360, 655361]], dtype=np.uint32)))
+    ['10.0.0.0/24\\n10.0.1.0/24\\n']
+    """
+    units = ipv4_units(intervals)
+    for start in range(0, len(units), chunk_size):
+        end = start + chunk_size
+        chunk = units[start:end]
+        yield "".join(
+            f"{a}.{b}.{c}.0/24\n"
+            for a, b, c in zip(
+                (chunk >> 16).tolist(),
+                ((chunk >> 8) & 0xFF).tolist(),
+                (chunk & 0xFF).tolist(),
+            )
+        )
+
+
+def iter_ranges(intervals: np.ndarray, version: int) -> Iterator[str]:
+    """
+    Lines of the output file, one address range per interval.
+    >>> list(iter_ranges(np.array([[655360, 655361]], dtype=np.uint32), 4))
+    ['10.0.0.0-10.0.1.255\\n']
+    >>> list(iter_ranges(np.array([[0x20010DB800000000, 0x20010DB800000001]], dtype=np.uint64), 6))
+    ['2001:db8::-2001:db8:0:1:ffff:ffff:ffff:ffff\\n']
+    """
+    address: type[IPv4Address | IPv6Address]
+    address, shift = (IPv4Address, 8) if version == 4 else (IPv6Address, 64)
+    for first, last in intervals.tolist():
+        first_address = address(first << shift)
+        last_address = address((last << shift) | ((1 << shift) - 1))
+        yield f"{first_address}-{last_address}\n"
+
+
+def iter_ipv6_samples(
+    prefixes: Iterable[str], n: int, rng: random.Random
+) -> Iterator[str]:
+    """
+    Lines of the output file, `n` random /64 (or all of them if there are less) per IPv6 prefix.
+    The prefixes must not overlap (see `covering_prefixes`), so that no /64 is written twice.
+    >>> list(iter_ipv6_samples(["2001:db8:0:2::/64", "2001:db8::/63", "10.0.0.0/8"], 4, random.Random(42)))
+    ['2001:db8::/64\\n', '2001:db8:0:1::/64\\n', '2001:db8:0:2::/64\\n']
+    >>> len(list(iter_ipv6_samples(["2001:db8::/32"], 4, random.Random(42))))
+    4
+    """
+    routes = sorted(
+        (int(network.network_address) >> 64, network.prefixlen)
+        for network in map(ip_network, prefixes)
+        if network.version == 6 and network.prefixlen <= 64
+    )
+    for first, prefix_len in routes:
+        size = 1 << (64 - prefix_len)
+        if size <= 2 * n:
+            offsets = rng.sample(range(size), min(n, size))
+        else:
+            # `random.sample` does not support ranges of more than 2^63 elements.
+            offsets_: set[int] = set()
+            while len(offsets_) < n:
+                offsets_.add(rng.randrange(size))
+            offsets = list(offsets_)
+        for offset in sorted(offsets):
+            yield f"{IPv6Address((first + offset) << 64)}/64\n"
+
 
 def main(
-    input_file: Path = typer.Argument(...),
+    input_files: list[Path] = typer.Argument(..., help="RIB files"),
     output_file: Path = typer.Argument(...),
     print_progress: bool = False,
     skip_record_on_error: bool = False,
+    ranges: bool = typer.Option(
+        False,
+        help="Write address ranges instead of /24 or /64 prefixes (see `zeph.universe`)",
+    ),
+    ipv6: bool = typer.Option(
+        True,
+        help="Write the IPv6 routes",
+    ),
+    ipv6_samples: int = typer.Option(
+        16,
+        help="Number of /64 prefixes randomly sampled per IPv6 route (without --ranges)",
+        metavar="N",
+    ),
+    seed: Optional[int] = typer.Option(
+        None,
+        help="Seed of the sampling of the /64 prefixes",
+    ),
+    processes: Optional[int] = typer.Option(
+        None,
+        help="Number of processes used to parse the RIB files (default: one per CPU)",
+        metavar="N",
+    ),
 ) -> None:
-    prefixes = parse_mrt_file(str(input_file), print_progress, skip_record_on_error)
+    prefixes: set[str] = set()
+    parse = partial(
+        parse_prefixes,
+        print_progress=print_progress,
+        skip_record_on_error=skip_record_on_error,
+    )
+    with ProcessPoolExecutor(processes) as executor:
+        for prefixes_ in tqdm(
+            executor.map(parse, input_files),
+            total=len(input_files),
+            disable=not print_progress,
+        ):
+            prefixes.update(prefixes_)
+    routes = covering_prefixes(prefixes)
+    ipv4_intervals = prefix_intervals(routes, 4)
+    lines = (
+        iter_ranges(ipv4_intervals, 4) if ranges else iter_ipv4_prefixes(ipv4_intervals)
+    )
+    if ipv6:
+        if ranges:
+            ipv6_lines = iter_ranges(prefix_intervals(routes, 6), 6)
+        else:
+            ipv6_lines = iter_ipv6_samples(routes, ipv6_samples, random.Random(seed))
+        lines = chain(lines, ipv6_lines)
+    else:
+        n_skipped = sum(ip_network(route).version == 6 for route in routes)
+        typer.echo(f"Skipped {n_skipped} IPv6 routes", err=True)
     with output_file.open("w") as f:
-        for prefix in tqdm(prefixes, disable=not print_progress):
-            net = ip_network(prefix)
-            if isinstance(net, IPv4Network):
-                if net.prefixlen <= 24:
-                    for subnet in net.subnets(new_prefix=24):
-                        f.write(f"{subnet}\n")
+        f.writelines(lines)
 
 
 def run() -> None:
@@ -0,0 +1,155 @@
+"""
+Simulate Zeph cycles offline, on the links of a previous measurement.
+
+    zeph-simulate export MEASUREMENT_UUID ground-truth.npz
+    zeph-simulate run ground-truth.npz --cycles 10 --rankers DFGCoverRanker,UniqueLinksRanker --exploration-ratios 0.05,0.1,0.2
+
+Each combination of the parameters is simulated in a separate process,
+and the results of each cycle are appended to a JSON-lines file.
+"""
+import json
+import logging
+from collections.abc import Collection
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Any, Optional
+
+import typer
+from iris_client import IrisClient
+from pych_client import ClickHouseClient
+
+from zeph.iris import get_measurement_agents
+from zeph.queries import GetUniqueLinksByPrefix
+from zeph.simulation import GroundTruth, simulate
+from zeph.typing import Network
+from zeph.universe import Universe
+
+app = typer.Typer()
+
+# Ground truth and universe of the worker process.
+worker: dict[str, Any] = {}
+
+
+def initialize(ground_truth_file: Path, prefixes_file: Path | None) -> None:
+    """Load the ground truth and the universe once per worker process."""
+    ground_truth = GroundTruth.load(ground_truth_file)
+    universe: Collection[Network]
+    if prefixes_file:
+        universe = Universe.open(prefixes_file, None)
+    else:
+        universe = Universe.from_networks(list(ground_truth.store.prefixes))
+    worker.update(ground_truth=ground_truth, universe=universe)
+
+
+def simulate_parameters(
+    parameters: dict[str, Any], cycles: int, budget: int
+) -> list[dict[str, Any]]:
+    return [
+        {**parameters, **result}
+        for result in simulate(
+            worker["ground_truth"],
+            worker["universe"],
+            cycles=cycles,
+            budget=budget,
+            **parameters,
+        )
+    ]
+
+
+@app.command()
+def export(
+    measurement_uuid: str = typer.Argument(..., help="UUID of the measurement"),
+    output_file: Path = typer.Argument(..., help="Ground truth file (.npz)"),
+    subsets_per_agent: int = typer.Option(
+        1,
+        help="Number of subsets of the prefix space queried independently per agent",
+        metavar="N",
+    ),
+    concurrent_requests: int = typer.Option(
+        4, help="Maximum number of concurrent ClickHouse queries", metavar="N"
+    ),
+    memory_limit: Optional[int] = typer.Option(
+        None,
+        help="Spill the link hashes to disk (in $TMPDIR) beyond this size",
+        metavar="BYTES",
+    ),
+    iris_base_url: str = typer.Option(None, help="Iris API URL", metavar="BASE_URL"),
+    iris_username: str = typer.Option(
+        None, help="Iris API username", metavar="USERNAME"
+    ),
+    iris_password: str = typer.Option(
+        None, help="Iris API password", metavar="PASSWORD"
+    ),
+) -> None:
+    """Save the links of a measurement as a ground truth."""
+    logging.basicConfig(level=logging.INFO)
+    with IrisClient(
+        base_url=iris_base_url, username=iris_username, password=iris_password
+    ) as iris:
+        credentials = iris.get(
+            "/users/me/services", params={"measurement_uuid": measurement_uuid}
+        ).json()
+        agents = get_measurement_agents(iris, measurement_uuid)
+        with ClickHouseClient(**credentials["clickhouse"]) as clickhouse:
+            store = GetUniqueLinksByPrefix(filter_virtual=True).for_all_agents(
+                clickhouse,
+                measurement_uuid,
+                agents,
+                subsets_per_agent=subsets_per_agent,
+                concurrent_requests=concurrent_requests,
+                memory_limit=memory_limit,
+            )
+    GroundTruth(store).save(output_file)
+
+
+@app.command()
+def run(
+    ground_truth_file: Path = typer.Argument(..., help="Ground truth file (.npz)"),
+    prefixes_file: Optional[Path] = typer.Option(
+        None,
+        help="Prefixes that can be probed (by default, the prefixes of the ground truth)",
+        metavar="FILE",
+    ),
+    cycles: int = typer.Option(10, help="Number of cycles", metavar="N"),
+    budget: int = typer.Option(
+        10_000, help="Number of prefixes per agent and per cycle", metavar="N"
+    ),
+    rankers: str = typer.Option(
+        "DFGCoverRanker", help="Comma-separated ranker classes", metavar="CLASSES"
+    ),
+    exploration_ratios: str = typer.Option(
+        "0.1", help="Comma-separated exploration ratios", metavar="RATIOS"
+    ),
+    seeds: str = typer.Option("2021", help="Comma-separated seeds", metavar="SEEDS"),
+    processes: Optional[int] = typer.Option(
+        None, help="Number of parallel simulations (default: number of CPUs)"
+    ),
+    output_file: Path = typer.Option(
+        Path("simulation.jsonl"), help="Results of each cycle", metavar="FILE"
+    ),
+) -> None:
+    """Simulate each combination of the parameters."""
+    combinations = [
+        {"ranker": ranker, "exploration_ratio": float(ratio), "seed": int(seed)}
+        for ranker, ratio, seed in product(
+            rankers.split(","), exploration_ratios.split(","), seeds.split(",")
+        )
+    ]
+    with ProcessPoolExecutor(
+        processes, initializer=initialize, initargs=(ground_truth_file, prefixes_file)
+    ) as executor, output_file.open("a") as f:
+        futures = [
+            executor.submit(simulate_parameters, parameters, cycles, budget)
+            for parameters in combinations
+        ]
+        for parameters, future in zip(combinations, futures):
+            results = future.result()
+            f.writelines(json.dumps(result) + "\n" for result in results)
+            discovered_links = results[-1]["discovered_links"] if results else 0
+            summary = " ".join(f"{key}={value}" for key, value in parameters.items())
+            typer.echo(f"{summary} discovered-links={discovered_links}")
+
+
+if __name__ == "__main__":
+    app()